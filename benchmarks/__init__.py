@@ -0,0 +1,8 @@
+"""
+Performance benchmarks.
+
+Benchmarks are not run as part of the unit tests. Each module can be run
+individually, for instance:
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.signing
+"""
@@ -0,0 +1,59 @@
+"""
+Benchmark the resolution of the assets that are visible from a course.
+
+Course IDs are drawn from a skewed distribution, as LTI launches are usually
+concentrated on a few popular courses. The memoized resolver is compared with
+the resolution of the access scope at every call.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.access
+"""
+import argparse
+import random
+
+from django.test import override_settings
+
+from . import utils
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--courses", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=100000)
+    args = parser.parse_args()
+
+    utils.setup()
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import openedx
+
+    random.seed(0)
+    course_ids = [
+        f"course-v1:org{int(random.paretovariate(1)) % 100}"
+        f"+course{int(random.paretovariate(1)) % args.courses}+run1"
+        for _ in range(args.iterations)
+    ]
+    uncached = openedx.resolve_access_scope.__wrapped__  # type: ignore
+    for access_limit in ["ORGANIZATION", "COURSE", "RUN"]:
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO=access_limit):
+            launches = iter(course_ids)
+            utils.report(
+                f"{access_limit}: resolved every time",
+                utils.measure(
+                    lambda access_limit=access_limit: uncached(
+                        next(launches), access_limit
+                    ),
+                    args.iterations,
+                ),
+            )
+            launches = iter(course_ids)
+            utils.report(
+                f"{access_limit}: memoized",
+                utils.measure(
+                    lambda: openedx.course_access_scope(next(launches)),
+                    args.iterations,
+                ),
+            )
+            print(f"{'':<50} {openedx.resolve_access_scope.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
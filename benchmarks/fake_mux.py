@@ -0,0 +1,442 @@
+"""
+Fake Mux API server, for offline load testing and benchmarks.
+
+The server implements the assets, tracks, direct uploads and signing keys
+endpoints that are used by this LTI producer, with configurable latency, error
+rate and rate limiting. Direct upload urls point to the fake server: uploading a
+file (any PUT request) creates the corresponding asset, which becomes ready after
+a delay. When a webhook url is given, signed webhook events are sent for every
+change, just like Mux does.
+
+To use it, run the server and point the `MUX_API_HOST` setting to it:
+
+    python -m benchmarks.fake_mux --port=8765 --latency=0.05 --error-rate=0.01 \\
+        --rate-limit=10 --webhook-url=http://localhost:8000/mux/callback \\
+        --webhook-secret=secret
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import random
+import re
+import threading
+import typing as t
+import uuid
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic, sleep, time
+from urllib.parse import parse_qs, urlparse
+from urllib.request import Request, urlopen
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+logger = logging.getLogger(__file__)
+
+
+class FakeMux:
+    """
+    In-memory state and behaviour of the fake Mux API.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0,
+        error_rate: float = 0,
+        rate_limit: t.Optional[float] = None,
+        ready_delay: float = 1,
+        webhook_url: str = "",
+        webhook_secret: str = "",
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.ready_delay = ready_delay
+        self.webhook_url = webhook_url
+        self.webhook_secret = webhook_secret
+        self.base_url = ""
+        self.assets: t.Dict[str, t.Dict[str, t.Any]] = {}
+        self.uploads: t.Dict[str, t.Dict[str, t.Any]] = {}
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self._tokens = rate_limit or 0
+        self._tokens_updated_at = monotonic()
+
+    def is_rate_limited(self) -> bool:
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            current_time = monotonic()
+            self._tokens = min(
+                self.rate_limit,
+                self._tokens
+                + (current_time - self._tokens_updated_at) * self.rate_limit,
+            )
+            self._tokens_updated_at = current_time
+            if self._tokens < 1:
+                return True
+            self._tokens -= 1
+            return False
+
+    def create_asset(self, status: str = "preparing", policy: str = "signed") -> t.Dict:
+        asset = {
+            "id": uuid.uuid4().hex,
+            "status": status,
+            "created_at": str(int(time())),
+            "playback_ids": [{"id": uuid.uuid4().hex, "policy": policy}],
+            "tracks": [
+                {"id": uuid.uuid4().hex, "type": "video", "status": status},
+            ],
+            "errors": None,
+        }
+        with self.lock:
+            self.assets[asset["id"]] = asset
+        return asset
+
+    def create_upload(self, body: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        upload_id = uuid.uuid4().hex
+        upload = {
+            "id": upload_id,
+            "status": "waiting",
+            "timeout": body.get("timeout", 3600),
+            "cors_origin": body.get("cors_origin", "*"),
+            "new_asset_settings": body.get("new_asset_settings") or {},
+            "url": f"{self.base_url}/upload/{upload_id}",
+            "asset_id": None,
+        }
+        with self.lock:
+            self.uploads[upload_id] = upload
+        return upload
+
+    def complete_upload(self, upload_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Simulate the upload of a file: create the asset, which will be ready
+        after `ready_delay` seconds.
+        """
+        upload = self.uploads.get(upload_id)
+        if upload is None or upload["status"] != "waiting":
+            return None
+        policies = upload["new_asset_settings"].get("playback_policy") or ["public"]
+        asset = self.create_asset(policy=policies[0])
+        asset["upload_id"] = upload_id
+        upload["status"] = "asset_created"
+        upload["asset_id"] = asset["id"]
+        self.send_webhook("video.upload.asset_created", upload)
+        self.send_webhook("video.asset.created", asset)
+        timer = threading.Timer(self.ready_delay, self.set_asset_ready, [asset["id"]])
+        timer.daemon = True
+        timer.start()
+        return asset
+
+    def set_asset_ready(self, asset_id: str) -> None:
+        asset = self.assets.get(asset_id)
+        if asset is None:
+            return
+        asset["status"] = "ready"
+        for track in asset["tracks"]:
+            track["status"] = "ready"
+            if track["type"] == "text":
+                self.send_webhook("video.asset.track.ready", track)
+        self.send_webhook("video.asset.ready", asset)
+
+    def create_track(
+        self, asset: t.Dict[str, t.Any], body: t.Dict[str, t.Any]
+    ) -> t.Dict[str, t.Any]:
+        track = {
+            "id": uuid.uuid4().hex,
+            "asset_id": asset["id"],
+            "type": body.get("type", "text"),
+            "text_type": body.get("text_type", "subtitles"),
+            "language_code": body.get("language_code", "en"),
+            "name": body.get("name") or body.get("language_code", "en"),
+            "status": "preparing",
+        }
+        asset["tracks"].append(track)
+        self.send_webhook("video.asset.track.created", track)
+        timer = threading.Timer(self.ready_delay, self.set_asset_ready, [asset["id"]])
+        timer.daemon = True
+        timer.start()
+        return track
+
+    def webhook_event(
+        self, event_type: str, data: t.Dict[str, t.Any]
+    ) -> t.Tuple[bytes, str]:
+        """
+        Return the body and the Mux-Signature header of a webhook event.
+        """
+        body = json.dumps(
+            {"id": uuid.uuid4().hex, "type": event_type, "data": data}
+        ).encode()
+        timestamp = str(int(time()))
+        signature = hmac.new(
+            self.webhook_secret.encode(),
+            timestamp.encode() + b"." + body,
+            hashlib.sha256,
+        ).hexdigest()
+        return body, f"t={timestamp},v1={signature}"
+
+    def send_webhook(self, event_type: str, data: t.Dict[str, t.Any]) -> None:
+        if not self.webhook_url:
+            return
+        body, signature = self.webhook_event(event_type, data)
+        request = Request(
+            self.webhook_url,
+            data=body,
+            headers={"Content-Type": "application/json", "Mux-Signature": signature},
+        )
+
+        def send() -> None:
+            try:
+                with urlopen(request, timeout=10):
+                    pass
+            except OSError as e:
+                logger.warning("Could not send webhook %s: %s", event_type, e)
+
+        threading.Thread(target=send, daemon=True).start()
+
+
+def create_signing_key() -> t.Dict[str, t.Any]:
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    return {
+        "id": uuid.uuid4().hex,
+        "created_at": str(int(time())),
+        "private_key": base64.b64encode(pem).decode(),
+    }
+
+
+class Handler(BaseHTTPRequestHandler):
+    server: "FakeMuxServer"
+
+    ROUTES = [
+        ("GET", r"/video/v1/assets/(?P<asset_id>[^/]+)", "get_asset"),
+        ("DELETE", r"/video/v1/assets/(?P<asset_id>[^/]+)", "delete_asset"),
+        ("POST", r"/video/v1/assets/(?P<asset_id>[^/]+)/tracks", "create_track"),
+        (
+            "DELETE",
+            r"/video/v1/assets/(?P<asset_id>[^/]+)/tracks/(?P<track_id>[^/]+)",
+            "delete_track",
+        ),
+        ("GET", r"/video/v1/uploads", "list_uploads"),
+        ("POST", r"/video/v1/uploads", "create_upload"),
+        ("GET", r"/video/v1/uploads/(?P<upload_id>[^/]+)", "get_upload"),
+        ("PUT", r"/upload/(?P<upload_id>[^/]+)", "upload_file"),
+        ("POST", r"/video/v1/signing-keys", "create_signing_key"),
+    ]
+
+    def do_GET(self) -> None:  # pylint: disable=invalid-name
+        self.dispatch("GET")
+
+    def do_POST(self) -> None:  # pylint: disable=invalid-name
+        self.dispatch("POST")
+
+    def do_PUT(self) -> None:  # pylint: disable=invalid-name
+        self.dispatch("PUT")
+
+    def do_DELETE(self) -> None:  # pylint: disable=invalid-name
+        self.dispatch("DELETE")
+
+    def log_message(self, format: str, *args: t.Any) -> None:
+        # pylint: disable=redefined-builtin
+        logger.debug(format, *args)
+
+    def dispatch(self, method: str) -> None:
+        fake = self.server.fake
+        with fake.lock:
+            fake.request_count += 1
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        if fake.latency:
+            sleep(random.uniform(0.5, 1.5) * fake.latency)
+        if fake.is_rate_limited():
+            self.respond(429, {"error": {"type": "too_many_requests"}}, retry_after=1)
+            return
+        if fake.error_rate and random.random() < fake.error_rate:
+            self.respond(500, {"error": {"type": "internal_error"}})
+            return
+        for route_method, pattern, name in self.ROUTES:
+            match = re.fullmatch(pattern, url.path)
+            if route_method == method and match:
+                payload = json.loads(body) if body and method != "PUT" else {}
+                getattr(self, name)(payload, parse_qs(url.query), **match.groupdict())
+                return
+        self.respond(404, {"error": {"type": "not_found"}})
+
+    def respond(
+        self,
+        status: int,
+        payload: t.Optional[t.Dict[str, t.Any]] = None,
+        retry_after: t.Optional[int] = None,
+    ) -> None:
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_asset(self, _payload, _query, asset_id: str) -> None:
+        asset = self.server.fake.assets.get(asset_id)
+        if asset is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+        else:
+            self.respond(200, {"data": asset})
+
+    def delete_asset(self, _payload, _query, asset_id: str) -> None:
+        asset = self.server.fake.assets.pop(asset_id, None)
+        if asset is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+            return
+        self.server.fake.send_webhook("video.asset.deleted", asset)
+        self.respond(204)
+
+    def create_track(self, payload, _query, asset_id: str) -> None:
+        asset = self.server.fake.assets.get(asset_id)
+        if asset is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+        else:
+            self.respond(201, {"data": self.server.fake.create_track(asset, payload)})
+
+    def delete_track(self, _payload, _query, asset_id: str, track_id: str) -> None:
+        asset = self.server.fake.assets.get(asset_id)
+        tracks = asset["tracks"] if asset else []
+        track = next((track for track in tracks if track["id"] == track_id), None)
+        if track is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+            return
+        tracks.remove(track)
+        self.server.fake.send_webhook("video.asset.track.deleted", track)
+        self.respond(204)
+
+    def list_uploads(self, _payload, query, **_kwargs) -> None:
+        limit = int(query.get("limit", ["25"])[0])
+        page = int(query.get("page", ["1"])[0])
+        uploads = list(reversed(list(self.server.fake.uploads.values())))
+        self.respond(200, {"data": uploads[(page - 1) * limit : page * limit]})
+
+    def create_upload(self, payload, _query, **_kwargs) -> None:
+        self.respond(201, {"data": self.server.fake.create_upload(payload)})
+
+    def get_upload(self, _payload, _query, upload_id: str) -> None:
+        upload = self.server.fake.uploads.get(upload_id)
+        if upload is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+        else:
+            self.respond(200, {"data": upload})
+
+    def upload_file(self, _payload, _query, upload_id: str) -> None:
+        if self.server.fake.complete_upload(upload_id) is None:
+            self.respond(404, {"error": {"type": "not_found"}})
+        else:
+            self.respond(200)
+
+    def create_signing_key(self, _payload, _query, **_kwargs) -> None:
+        self.respond(201, {"data": create_signing_key()})
+
+
+class FakeMuxServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: t.Tuple[str, int], fake: FakeMux) -> None:
+        super().__init__(address, Handler)
+        self.fake = fake
+        fake.base_url = f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+
+def start(host: str = "127.0.0.1", port: int = 0, **options: t.Any) -> FakeMuxServer:
+    """
+    Start a fake Mux server in a background thread. Use port 0 to pick a random
+    port. Options are passed to `FakeMux`.
+
+    The server url is available as `server.fake.base_url`. Stop the server with
+    `server.shutdown()`.
+    """
+    server = FakeMuxServer((host, port), FakeMux(**options))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@contextmanager
+def configure(server: FakeMuxServer) -> t.Iterator[None]:
+    """
+    Point the Mux settings of the LTI producer to a fake server: API host,
+    webhook signing secret and url signing key.
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.conf import settings
+    from django.test import override_settings
+
+    from muxltiproducer import mux
+
+    signing_key = create_signing_key()
+    try:
+        with override_settings(
+            MUX_API_HOST=server.fake.base_url,
+            MUX_WEBHOOK_SIGNING_SECRET=server.fake.webhook_secret,
+            MUX_SIGNING_KEY_ID=signing_key["id"],
+            MUX_SIGNING_PRIVATE_KEY=signing_key["private_key"],
+            STATIC_URL=settings.STATIC_URL or "/static/",
+        ):
+            mux.reset_client()
+            yield
+    finally:
+        mux.reset_client()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run a fake Mux API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Mean response time, in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0, help="Fraction of 500 responses"
+    )
+    parser.add_argument(
+        "--rate-limit", type=float, help="Maximum number of requests per second"
+    )
+    parser.add_argument(
+        "--ready-delay",
+        type=float,
+        default=1,
+        help="Seconds after which uploaded assets and tracks become ready",
+    )
+    parser.add_argument("--webhook-url", default="")
+    parser.add_argument("--webhook-secret", default="")
+    parser.add_argument(
+        "--assets", type=int, default=0, help="Number of ready assets to create"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    fake = FakeMux(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        ready_delay=args.ready_delay,
+        webhook_url=args.webhook_url,
+        webhook_secret=args.webhook_secret,
+    )
+    for _ in range(args.assets):
+        fake.create_asset(status="ready")
+    server = FakeMuxServer((args.host, args.port), fake)
+    print(f"Fake Mux API listening on {fake.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Load test the LTI producer against the fake Mux API server.
+
+A fake Mux server is started in the background and a test database is created.
+The benchmark then drives, at scale:
+
+- the "uploads" view: checkout of direct upload urls from the pool, which is
+  topped up against the fake server;
+- the "synchronize" task, in "list" and "poll" modes, after all files are
+  uploaded;
+- the "callback" view: verification, storage and processing of the signed
+  webhooks that are emitted by the fake server;
+- the "launch" and "edit" views: lookup of visible assets and rendering of the
+  video player.
+
+Views are requested with the Django test client. LTI sessions are stubbed, as
+in the benchmark suite.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.load \\
+        --uploads=1000 --latency=0.02 --error-rate=0.01
+"""
+import argparse
+import random
+import typing as t
+from time import perf_counter, sleep
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+from . import fake_mux, utils
+from .suite import LTI_PARAMS, LTI_SESSION_ID, stub_lti_sessions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--uploads", type=int, default=200)
+    parser.add_argument("--launches", type=int, default=1000)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="Mean Mux API response time"
+    )
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--rate-limit", type=float)
+    args = parser.parse_args()
+
+    utils.setup()
+    stub_lti_sessions()
+    server = fake_mux.start(
+        ready_delay=0,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        webhook_secret="secret",
+    )
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import metrics
+
+    try:
+        with fake_mux.configure(server), utils.test_database():
+            metrics.reset()
+            run(server.fake, args)
+            print()
+            print(metrics.SummaryExporter().export(metrics.get_snapshot()))
+    finally:
+        server.shutdown()
+
+
+def run(fake: fake_mux.FakeMux, args: argparse.Namespace) -> None:
+    # pylint: disable=import-outside-toplevel
+    from django.test import Client
+    from django.urls import reverse
+
+    from muxltiproducer import models, mux, tasks
+
+    client = Client(HTTP_HOST="testserver")
+
+    def url(name: str) -> str:
+        if name == "callback":
+            return reverse("mux:callback")
+        return reverse(f"mux:{name}", kwargs={"lti_session_id": LTI_SESSION_ID})
+
+    def check(response: t.Any) -> None:
+        if response.status_code >= 400:
+            raise ValueError(f"Unexpected response: {response.status_code}")
+
+    # "uploads" view: urls that cannot be created by the fake server are errors
+    upload_errors = 0
+
+    def create_upload_url() -> None:
+        nonlocal upload_errors
+        try:
+            check(client.post(url("uploads")))
+        except mux.ApiException:
+            upload_errors += 1
+
+    utils.report(
+        "uploads: create upload url", utils.measure(create_upload_url, args.uploads)
+    )
+    print(f"{'':<50} {upload_errors} errors")
+
+    # Files are uploaded by browsers; webhooks are delivered below. Urls that
+    # are still in the pool are not used.
+    failed_uploads = 0
+    for upload_id in models.UploadUrl.objects.filter(
+        lti_context__isnull=False
+    ).values_list("mux_id", flat=True):
+        try:
+            with urlopen(
+                Request(f"{fake.base_url}/upload/{upload_id}", data=b"", method="PUT")
+            ):
+                pass
+        except HTTPError:
+            failed_uploads += 1
+    print(f"{'':<50} {failed_uploads} failed file uploads")
+    sleep(0.1)
+
+    # Synchronization task
+    for mode in ["list", "poll"]:
+        models.UploadUrl.objects.filter(lti_context__isnull=False).update(
+            status=models.UploadUrl.Statuses.WAITING.value
+        )
+        models.Asset.objects.all().delete()
+        report_once(
+            f"synchronize ({mode} mode)",
+            fake,
+            lambda mode=mode: tasks.synchronize.call_local(mode=mode),
+        )
+    print(
+        f"{'':<50} {models.Asset.objects.count()} assets created from "
+        f"{models.UploadUrl.objects.filter(lti_context__isnull=False).count()} "
+        "uploads"
+    )
+
+    # "callback" view: events are processed by the task right away
+    events = [
+        fake.webhook_event("video.asset.ready", asset) for asset in fake.assets.values()
+    ]
+    events_iterator = iter(events)
+
+    def receive_webhook() -> None:
+        body, signature = next(events_iterator)
+        check(
+            client.post(
+                url("callback"),
+                body,
+                content_type="application/json",
+                HTTP_MUX_SIGNATURE=signature,
+            )
+        )
+
+    utils.report(
+        "callback: receive webhook",
+        utils.measure(receive_webhook, len(events)),
+    )
+
+    # "launch" view
+    mux_ids = list(models.Asset.objects.values_list("mux_id", flat=True))
+    if not mux_ids:
+        return
+
+    def launch() -> None:
+        LTI_PARAMS["custom_video_id"] = random.choice(mux_ids)
+        check(client.get(url("launch")))
+
+    utils.report("launch: render player", utils.measure(launch, args.launches))
+
+    # "edit" view
+    def edit() -> None:
+        check(client.get(url("edit")))
+
+    utils.report("edit: list and render page of assets", utils.measure(edit, 50))
+
+
+def report_once(name: str, fake: fake_mux.FakeMux, func: t.Callable[[], t.Any]) -> None:
+    request_count = fake.request_count
+    start = perf_counter()
+    func()
+    duration = perf_counter() - start
+    print(
+        f"{name:<50} {duration:>12.2f} s"
+        f"   mux_requests={fake.request_count - request_count}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark the signature of playback urls.
+
+Compare the signature of urls with an RSA key parsed at every call (which was
+the original behaviour), with a cached key, and with memoized signed urls.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.signing
+"""
+import base64
+import typing as t
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.test import override_settings
+
+from . import utils
+
+
+def main() -> None:
+    utils.setup()
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import mux
+
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_key_pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    private_key_base64 = base64.b64encode(private_key_pem).decode()
+
+    def sign_uncached() -> str:
+        params: t.Dict[str, t.Any] = {"sub": "playbackid", "aud": "v", "exp": 0}
+        pem = base64.b64decode(private_key_base64).decode()
+        return jwt.encode(params, pem, algorithm="RS256", headers={"kid": "key"})
+
+    with override_settings(
+        MUX_SIGNING_KEY_ID="key", MUX_SIGNING_PRIVATE_KEY=private_key_base64
+    ):
+        utils.report(
+            "sign_url (key parsed every time)", utils.measure(sign_uncached, 200)
+        )
+        utils.report(
+            "sign_url (cached key)",
+            utils.measure(
+                lambda: mux.sign_url("https://video", {"sub": "playbackid"}), 200
+            ),
+        )
+        utils.report(
+            "sign_video_playback_url (memoized)",
+            utils.measure(
+                lambda: mux.sign_video_playback_url("https://video", "playbackid"),
+                10000,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    main()
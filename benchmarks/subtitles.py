@@ -0,0 +1,87 @@
+"""
+Benchmark the validation and conversion of subtitle files to WebVTT.
+
+Measure the throughput of the conversion of large SRT and WebVTT files, with
+text in several languages.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.subtitles
+"""
+import argparse
+import tempfile
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+from . import utils
+
+TEXTS = [
+    "Hello, how are you?",
+    "Bonjour, comment ça va ?",
+    "Привет, как дела?",
+    "こんにちは、お元気ですか？",
+    "مرحبا، كيف حالك؟",
+]
+
+
+def make_srt(cues: int) -> bytes:
+    lines = []
+    for index in range(cues):
+        start = index * 2000
+        lines += [
+            str(index + 1),
+            f"{timestamp(start, ',')} --> {timestamp(start + 1500, ',')}",
+            TEXTS[index % len(TEXTS)],
+            TEXTS[(index + 1) % len(TEXTS)],
+            "",
+        ]
+    return "\r\n".join(lines).encode()
+
+
+def make_webvtt(cues: int) -> bytes:
+    lines = ["WEBVTT", ""]
+    for index in range(cues):
+        start = index * 2000
+        lines += [
+            f"{timestamp(start, '.')} --> {timestamp(start + 1500, '.')} line:0",
+            TEXTS[index % len(TEXTS)],
+            "",
+        ]
+    return "\n".join(lines).encode()
+
+
+def timestamp(milliseconds: int, separator: str) -> str:
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cues", type=int, default=50000)
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    utils.setup()
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import subtitles
+
+    for name, content in [
+        ("SRT", make_srt(args.cues)),
+        ("WebVTT", make_webvtt(args.cues)),
+    ]:
+        upload = SimpleUploadedFile("subtitles", content)
+
+        def convert() -> None:
+            # pylint: disable=cell-var-from-loop
+            with tempfile.SpooledTemporaryFile(
+                max_size=subtitles.SPOOL_MAX_SIZE
+            ) as output:
+                subtitles.convert(upload, output)
+
+        results = utils.measure(convert, args.iterations)
+        utils.report(f"convert {name} ({len(content) / 1e6:.1f} MB)", results)
+        print(f"{'':<50} {len(content) / results['mean'] / 1e6:>12.1f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,483 @@
+"""
+End-to-end performance benchmark suite of the views and tasks.
+
+A test database is seeded with realistic data volumes: many LTI contexts, tens
+of thousands of assets and upload urls. The Mux API is replaced by the fake Mux
+server, without latency. The code paths of the main views and of the
+synchronization task are then measured: latency, number of SQL queries and
+peak memory allocations per call. Views are called with the test client. LTI
+views require an LTI session: the session decorators of ltiproducer are
+replaced by stubs, which set the LTI parameters of a fixed course.
+
+Results are compared with a baseline JSON file, and regressions are flagged
+(with a non-zero exit code) when:
+
+- the median latency (by more than 1ms) or the peak allocations increase by
+  more than the threshold;
+- the number of queries increases.
+
+Latencies depend on the machine: the baseline should be saved on the same
+machine as the results it is compared with.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.suite \\
+        --save-baseline
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.suite \\
+        --threshold=0.25
+"""
+import argparse
+import functools
+import json
+import os
+import random
+import statistics
+import sys
+import tracemalloc
+import typing as t
+from time import perf_counter
+
+from . import fake_mux, utils
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+BATCH_SIZE = 10000
+CONTEXT_ID = "course-v1:org0+course0+run0"
+LTI_SESSION_ID = "benchmark"
+ALLOCATION_ITERATIONS = 3
+# Latency changes below this value are considered noise
+MIN_LATENCY_CHANGE_MS = 1
+
+
+class Scenario(t.NamedTuple):
+    name: str
+    func: t.Callable[[], t.Any]
+    iterations: int
+    # Called before every iteration, and not measured
+    setup: t.Optional[t.Callable[[], t.Any]] = None
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=int, default=1000)
+    parser.add_argument("--assets", type=int, default=20000)
+    parser.add_argument(
+        "--context-assets",
+        type=int,
+        default=1000,
+        help="Number of assets in the LTI context of the views",
+    )
+    parser.add_argument("--upload-urls", type=int, default=20000)
+    parser.add_argument(
+        "--waiting-uploads",
+        type=int,
+        default=100,
+        help="Number of upload urls that are updated by the synchronize task",
+    )
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--sync-iterations", type=int, default=5)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Save the results as the new baseline",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Relative increase of latency and allocations that is flagged",
+    )
+    args = parser.parse_args()
+    parameters = {
+        "contexts": args.contexts,
+        "assets": args.assets,
+        "context_assets": args.context_assets,
+        "upload_urls": args.upload_urls,
+        "waiting_uploads": args.waiting_uploads,
+    }
+
+    utils.setup()
+    stub_lti_sessions()
+    server = fake_mux.start(ready_delay=3600, webhook_secret="secret")
+    try:
+        with fake_mux.configure(server), utils.test_database():
+            seed(server.fake, **parameters)
+            results = {
+                scenario.name: run(scenario)
+                for scenario in get_scenarios(
+                    server.fake, args.iterations, args.sync_iterations
+                )
+            }
+    finally:
+        server.shutdown()
+
+    current = {"parameters": parameters, "results": results}
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline saved to {args.baseline}")
+        return
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != parameters:
+            print(
+                f"Baseline parameters {baseline['parameters']} differ from "
+                f"{parameters}: results are not compared"
+            )
+            baseline = None
+    regressions = report(results, baseline and baseline["results"], args.threshold)
+    if regressions:
+        print(f"{regressions} regression(s) beyond the threshold")
+        sys.exit(1)
+
+
+class LtiParams(dict):
+    """
+    LTI launch parameters of the benchmarked course, such as "custom_video_id".
+    """
+
+    context_id = CONTEXT_ID
+    is_instructor = True
+
+
+LTI_PARAMS = LtiParams()
+
+
+def stub_lti_sessions() -> None:
+    """
+    Replace the LTI session decorators of the views by stubs. This must be
+    called before the views are imported.
+    """
+    # pylint: disable=import-outside-toplevel
+    from ltiproducer import ltiviews
+
+    assert "muxltiproducer.views" not in sys.modules
+
+    def view(func: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
+        @functools.wraps(func)
+        def wrapper(request: t.Any, *args: t.Any, **kwargs: t.Any) -> t.Any:
+            request.lti_session_id = kwargs.pop("lti_session_id")
+            request.lti_params = LTI_PARAMS
+            return func(request, *args, **kwargs)
+
+        return wrapper
+
+    ltiviews.view = view
+    ltiviews.instructor_required = lambda func: func
+
+
+def seed(
+    fake: fake_mux.FakeMux,
+    contexts: int,
+    assets: int,
+    context_assets: int,
+    upload_urls: int,
+    waiting_uploads: int,
+) -> None:
+    """
+    Seed the database and the fake Mux server. The assets of the LTI context of
+    the views are synchronized and ready. Only the waiting upload urls exist on
+    the fake server, where their file was uploaded.
+    """
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import models
+
+    print(
+        f"Seeding {contexts} contexts, {assets} assets and {upload_urls} upload "
+        "urls..."
+    )
+    random.seed(0)
+    lti_contexts = []
+    for i in range(contexts):
+        lti_context = models.LtiContext(
+            context_id=f"course-v1:org{i % 100}+course{i}+run{i % 3}"
+        )
+        lti_context.set_course_fields()
+        lti_contexts.append(lti_context)
+    models.LtiContext.objects.bulk_create(lti_contexts, batch_size=BATCH_SIZE)
+    lti_context_ids = list(
+        models.LtiContext.objects.exclude(context_id=CONTEXT_ID).values_list(
+            "id", flat=True
+        )
+    )
+    lti_context_id = models.LtiContext.objects.get(context_id=CONTEXT_ID).id
+
+    for start in range(0, assets, BATCH_SIZE):
+        batch = []
+        for i in range(start, min(start + BATCH_SIZE, assets)):
+            data = fake.create_asset(
+                status="ready", policy="public" if i % 2 else "signed"
+            )
+            batch.append(
+                models.Asset(
+                    mux_id=data["id"],
+                    lti_context_id=lti_context_id
+                    if i < context_assets
+                    else random.choice(lti_context_ids),
+                    **models.Asset.mux_fields(data),
+                )
+            )
+        models.Asset.objects.bulk_create(batch)
+
+    # The first upload urls belong to the LTI context of the views, like its
+    # first assets
+    upload_url_batch = []
+    for i in range(upload_urls):
+        if i < waiting_uploads:
+            mux_id = fake.create_upload({})["id"]
+            fake.complete_upload(mux_id)
+            status = models.UploadUrl.Statuses.WAITING.value
+        else:
+            mux_id = f"upload{i}"
+            status = models.UploadUrl.Statuses.CREATED.value
+        upload_url_batch.append(
+            models.UploadUrl(
+                mux_id=mux_id,
+                status=status,
+                lti_context_id=lti_context_id
+                if i < context_assets
+                else random.choice(lti_context_ids),
+            )
+        )
+    models.UploadUrl.objects.bulk_create(upload_url_batch, batch_size=BATCH_SIZE)
+
+
+def get_scenarios(
+    fake: fake_mux.FakeMux, iterations: int, sync_iterations: int
+) -> t.List[Scenario]:
+    # pylint: disable=import-outside-toplevel
+    from django.core import signing
+    from django.test import Client
+    from django.urls import reverse
+
+    from muxltiproducer import models, mux, tasks, views
+
+    client = Client(HTTP_HOST="testserver")
+    mux_ids = list(
+        models.Asset.objects.filter_visible(CONTEXT_ID).values_list("mux_id", flat=True)
+    )
+    pks = list(
+        models.Asset.objects.filter_visible(CONTEXT_ID).values_list("pk", flat=True)
+    )
+    upload_mux_ids = list(
+        models.UploadUrl.objects.filter(
+            lti_context__context_id=CONTEXT_ID,
+            status=models.UploadUrl.Statuses.CREATED.value,
+        ).values_list("mux_id", flat=True)
+    )
+    waiting_mux_ids = list(
+        models.UploadUrl.objects.filter(
+            status=models.UploadUrl.Statuses.WAITING.value
+        ).values_list("mux_id", flat=True)
+    )
+
+    def url(name: str, **kwargs: str) -> str:
+        if name not in ("upload_status", "upload_progress", "callback"):
+            kwargs["lti_session_id"] = LTI_SESSION_ID
+        return reverse(f"mux:{name}", kwargs=kwargs)
+
+    def check(response: t.Any) -> None:
+        if response.status_code >= 400:
+            raise ValueError(f"Unexpected response: {response.status_code}")
+
+    def launch() -> None:
+        LTI_PARAMS["custom_video_id"] = random.choice(mux_ids)
+        check(client.get(url("launch")))
+
+    def edit_video() -> None:
+        check(client.get(url("edit")))
+
+    def list_assets() -> None:
+        check(client.get(url("assets"), {"before": random.choice(pks)}))
+
+    # Upload urls are checked out from a pool, which is filled in advance
+    origin = "http://testserver"
+    playback_policy = mux.get_playback_policy()
+    models.UploadUrl.objects.bulk_create(
+        [
+            models.UploadUrl(
+                mux_id=direct_upload["id"],
+                url=direct_upload["url"],
+                origin=origin,
+                playback_policy=playback_policy,
+            )
+            for direct_upload in (
+                mux.create_direct_upload(origin=origin)
+                for _ in range(iterations + ALLOCATION_ITERATIONS)
+            )
+        ]
+    )
+
+    def create_upload_url() -> None:
+        check(client.post(url("uploads")))
+
+    upload_status_urls = [
+        url(
+            "upload_status",
+            token=signing.dumps(mux_id, salt=views.UPLOAD_STATUS_SALT),
+        )
+        for mux_id in upload_mux_ids
+    ]
+
+    def get_upload_status() -> None:
+        check(client.get(random.choice(upload_status_urls)))
+
+    # Progress is recorded for an upload which is excluded from synchronization
+    progress_upload_url = models.UploadUrl.objects.create(
+        mux_id="progress",
+        lti_context=models.LtiContext.objects.get(context_id=CONTEXT_ID),
+    )
+    progress_url = url(
+        "upload_progress",
+        token=signing.dumps(
+            progress_upload_url.mux_id, salt=views.UPLOAD_PROGRESS_SALT
+        ),
+    )
+    chunk_size = 5 * 1024 * 1024
+    progress_chunks = iter(range(1, 2 * (iterations + ALLOCATION_ITERATIONS) + 1))
+
+    def record_upload_progress() -> None:
+        check(
+            client.post(
+                progress_url,
+                {
+                    "bytes_confirmed": next(progress_chunks) * chunk_size,
+                    "bytes_total": 1000 * iterations * chunk_size,
+                    "chunk_size": chunk_size,
+                },
+            )
+        )
+
+    def callback() -> None:
+        body, signature = fake.webhook_event(
+            "video.asset.ready", fake.assets[random.choice(mux_ids)]
+        )
+        check(
+            client.post(
+                url("callback"),
+                body,
+                content_type="application/json",
+                HTTP_MUX_SIGNATURE=signature,
+            )
+        )
+
+    def reset_waiting_uploads() -> None:
+        models.UploadUrl.objects.filter(mux_id__in=waiting_mux_ids).update(
+            status=models.UploadUrl.Statuses.WAITING.value
+        )
+        models.Asset.objects.filter(
+            mux_id__in=[fake.uploads[mux_id]["asset_id"] for mux_id in waiting_mux_ids]
+        ).delete()
+
+    # Upload urls are checked out last, such that they are not synchronized
+    return [
+        Scenario("launch", launch, iterations),
+        Scenario("edit_video", edit_video, iterations),
+        Scenario("list_assets", list_assets, iterations),
+        Scenario("upload_status", get_upload_status, iterations),
+        Scenario("upload_progress", record_upload_progress, iterations),
+        Scenario("callback", callback, iterations),
+        Scenario(
+            "synchronize",
+            lambda: tasks.synchronize.call_local(mode="list"),
+            sync_iterations,
+            setup=reset_waiting_uploads,
+        ),
+        Scenario("uploads (POST)", create_upload_url, iterations),
+    ]
+
+
+def run(scenario: Scenario) -> t.Dict[str, float]:
+    """
+    Measure a scenario: latency, maximum number of queries and peak memory
+    allocations per call. Allocations are traced in separate iterations,
+    because tracing slows down execution.
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    random.seed(0)
+    durations = []
+    queries = 0
+    for _ in range(scenario.iterations):
+        if scenario.setup:
+            scenario.setup()
+        with CaptureQueriesContext(connection) as context:
+            start = perf_counter()
+            scenario.func()
+            durations.append(perf_counter() - start)
+        queries = max(queries, len(context))
+
+    allocated = 0
+    for _ in range(ALLOCATION_ITERATIONS):
+        if scenario.setup:
+            scenario.setup()
+        tracemalloc.start()
+        try:
+            scenario.func()
+            _size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        allocated = max(allocated, peak)
+
+    durations.sort()
+    return {
+        "iterations": scenario.iterations,
+        "mean_ms": round(statistics.mean(durations) * 1000, 3),
+        "p50_ms": round(durations[len(durations) // 2] * 1000, 3),
+        "p95_ms": round(durations[int(len(durations) * 0.95)] * 1000, 3),
+        "queries": queries,
+        "allocated_kib": round(allocated / 1024, 1),
+    }
+
+
+def report(
+    results: t.Dict[str, t.Dict[str, float]],
+    baseline: t.Optional[t.Dict[str, t.Dict[str, float]]],
+    threshold: float,
+) -> int:
+    """
+    Print the results, compared with the baseline, and return the number of
+    regressions.
+    """
+    print(
+        f"{'Scenario':<20} {'mean':>10} {'p50':>22} {'p95':>10} {'queries':>14} "
+        f"{'allocated':>24}"
+    )
+    regressions = 0
+    for name, result in results.items():
+        reference = (baseline or {}).get(name)
+        flags = []
+
+        def compare(
+            key: str, unit: str, is_relative: bool, min_change: float = 0
+        ) -> str:
+            value = result[key]
+            if reference is None:
+                return f"{value}{unit}"
+            previous = reference[key]
+            if is_relative:
+                change = (value - previous) / previous if previous else 0
+                if change > threshold and value - previous > min_change:
+                    flags.append(key)
+                return f"{value}{unit} ({change:+.0%})"
+            if value > previous:
+                flags.append(key)
+            return f"{value}{unit} ({value - previous:+d})"
+
+        p50 = compare("p50_ms", "ms", True, MIN_LATENCY_CHANGE_MS)
+        queries = compare("queries", "", False)
+        allocated = compare("allocated_kib", "KiB", True)
+        print(
+            f"{name:<20} {result['mean_ms']:>8.2f}ms {p50:>22} "
+            f"{result['p95_ms']:>8.2f}ms {queries:>14} {allocated:>24}"
+            + (f"   REGRESSION: {', '.join(flags)}" if flags else "")
+        )
+        regressions += len(flags)
+    return regressions
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+import statistics
+import typing as t
+from contextlib import contextmanager
+from time import perf_counter
+
+import django
+
+
+def setup() -> None:
+    django.setup()
+
+
+@contextmanager
+def test_database() -> t.Iterator[None]:
+    """
+    Create a fresh test database, and destroy it on exit.
+    """
+    # pylint: disable=import-outside-toplevel
+    from django.db import connection
+
+    old_name = connection.creation.create_test_db(verbosity=0)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def measure(func: t.Callable[[], t.Any], iterations: int) -> t.Dict[str, float]:
+    """
+    Call `func` `iterations` times and return timing statistics, in seconds.
+    """
+    durations = []
+    for _ in range(iterations):
+        start = perf_counter()
+        func()
+        durations.append(perf_counter() - start)
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "mean": statistics.mean(durations),
+        "p50": durations[len(durations) // 2],
+        "p95": durations[int(len(durations) * 0.95)],
+        "ops_per_second": iterations / sum(durations),
+    }
+
+
+def report(name: str, results: t.Dict[str, float]) -> None:
+    print(
+        f"{name:<50} {results['ops_per_second']:>12.1f} ops/s"
+        f"   mean={results['mean'] * 1e6:.1f}us"
+        f"   p50={results['p50'] * 1e6:.1f}us"
+        f"   p95={results['p95'] * 1e6:.1f}us"
+    )
@@ -0,0 +1,97 @@
+"""
+Benchmark the filtering of the assets that are visible by instructors.
+
+A test database is seeded with many LTI contexts and assets. The indexed
+lookups of `filter_visible` are then compared with the regex-based filter that
+was used previously.
+
+    DJANGO_SETTINGS_MODULE=tests.settings python -m benchmarks.visibility \\
+        --contexts=100000 --assets=1000000
+"""
+import argparse
+import random
+
+from django.test import override_settings
+
+from . import utils
+
+BATCH_SIZE = 10000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--contexts", type=int, default=100000)
+    parser.add_argument("--assets", type=int, default=1000000)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    utils.setup()
+    with utils.test_database():
+        seed(args.contexts, args.assets)
+        run(args.iterations)
+
+
+def seed(context_count: int, asset_count: int) -> None:
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import models
+
+    print(f"Seeding {context_count} contexts and {asset_count} assets...")
+    lti_contexts = []
+    for i in range(context_count):
+        lti_context = models.LtiContext(
+            context_id=f"course-v1:org{i % 100}+course{(i // 100) % 100}+run{i // 10000}"
+        )
+        lti_context.set_course_fields()
+        lti_contexts.append(lti_context)
+    models.LtiContext.objects.bulk_create(lti_contexts, batch_size=BATCH_SIZE)
+    lti_context_ids = list(models.LtiContext.objects.values_list("id", flat=True))
+    random.seed(0)
+    for start in range(0, asset_count, BATCH_SIZE):
+        models.Asset.objects.bulk_create(
+            [
+                models.Asset(
+                    mux_id=f"asset{i}", lti_context_id=random.choice(lti_context_ids)
+                )
+                for i in range(start, min(start + BATCH_SIZE, asset_count))
+            ]
+        )
+
+
+def run(iterations: int) -> None:
+    # pylint: disable=import-outside-toplevel
+    from muxltiproducer import models
+
+    course_id = "course-v1:org1+course1+run0"
+    regexes = {
+        "ORGANIZATION": r"^course-v1:org1\+",
+        "COURSE": r"^course-v1:org1\+course1\+",
+        "RUN": r"^course-v1:org1\+course1\+run0$",
+    }
+    for access_limit, regex in regexes.items():
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO=access_limit):
+            utils.report(
+                f"{access_limit}: regex filter",
+                utils.measure(
+                    lambda regex=regex: list(
+                        models.Asset.objects.filter(
+                            lti_context__context_id__regex=regex
+                        ).order_by("-pk")[:50]
+                    ),
+                    iterations,
+                ),
+            )
+            utils.report(
+                f"{access_limit}: filter_visible",
+                utils.measure(
+                    lambda: list(
+                        models.Asset.objects.filter_visible(course_id).order_by("-pk")[
+                            :50
+                        ]
+                    ),
+                    iterations,
+                ),
+            )
+
+
+if __name__ == "__main__":
+    main()
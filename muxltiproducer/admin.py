@@ -1,4 +1,7 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin import helpers
+from django.db.models import Count
+from django.shortcuts import render
 
 from . import models
 
@@ -6,13 +9,66 @@ from . import models
 @admin.register(models.LtiContext)
 class LtiContextAdmin(admin.ModelAdmin):
     list_display = ("id", "context_id")
+    actions = ["reparent_assets"]
+
+    @admin.action(description="Move assets to another context")
+    def reparent_assets(self, request, queryset):
+        """
+        Display the number of assets that will be moved, and ask for the target
+        context. Then, move the assets.
+        """
+        target_context_id = request.POST.get("target", "").strip()
+        if "apply" in request.POST and target_context_id:
+            target, _created = models.LtiContext.objects.get_or_create(
+                context_id=target_context_id
+            )
+            for source in queryset.exclude(pk=target.pk):
+                moved = 0
+                for moved in models.Asset.objects.reparent(source, target):
+                    pass
+                self.message_user(
+                    request,
+                    f"Moved {moved} assets from {source.context_id} to "
+                    f"{target.context_id}",
+                    messages.SUCCESS,
+                )
+            return None
+        return render(
+            request,
+            "admin/muxltiproducer/lticontext/reparent_assets.html",
+            context={
+                **self.admin_site.each_context(request),
+                "opts": self.model._meta,
+                "contexts": queryset.annotate(asset_count=Count("asset")),
+                "action_checkbox_name": helpers.ACTION_CHECKBOX_NAME,
+                "target": target_context_id,
+            },
+        )
 
 
 @admin.register(models.Asset)
 class AssetAdmin(admin.ModelAdmin):
     list_display = ("id", "mux_id")
+    raw_id_fields = ("lti_context",)
 
 
 @admin.register(models.UploadUrl)
 class UploadUrlAdmin(admin.ModelAdmin):
     list_display = ("id", "mux_id", "created_at", "status")
+    raw_id_fields = ("lti_context",)
+
+
+@admin.register(models.SyncCursor)
+class SyncCursorAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "page", "updated_at")
+
+
+@admin.register(models.WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ("id", "mux_id", "type", "created_at", "processed_at")
+
+
+@admin.register(models.SubtitleFile)
+class SubtitleFileAdmin(admin.ModelAdmin):
+    list_display = ("id", "name", "created_at")
+    raw_id_fields = ("asset",)
@@ -0,0 +1,47 @@
+import logging
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from muxltiproducer import models
+
+
+class Command(BaseCommand):
+    help = "Delete many assets, both locally and from Mux"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--context",
+            action="append",
+            default=[],
+            help="Delete the assets of this LTI context ID (can be repeated)",
+        )
+        parser.add_argument(
+            "--created-before",
+            type=date.fromisoformat,
+            help="Delete the assets that were uploaded before this date (YYYY-MM-DD)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the number of assets that would be deleted",
+        )
+
+    def handle(self, *args, **options):
+        logging.getLogger().setLevel(logging.INFO)
+        if not options["context"] and not options["created_before"]:
+            raise CommandError(
+                "At least one of --context or --created-before is required"
+            )
+        assets = models.Asset.objects.all()
+        if options["context"]:
+            assets = assets.filter(lti_context__context_id__in=options["context"])
+        if options["created_before"]:
+            assets = assets.filter(mux_created_at__date__lt=options["created_before"])
+        if options["dry_run"]:
+            self.stdout.write(f"{assets.count()} assets would be deleted")
+            return
+        mux_ids = models.Asset.objects.bulk_delete(assets)
+        self.stdout.write(
+            f"Deleted {len(mux_ids)} assets. Deletion from Mux was queued."
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from muxltiproducer import metrics
+
+
+class Command(BaseCommand):
+    help = "Print the latency and error metrics of Mux API calls, and the asset cache hit ratio"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--format",
+            help=(
+                "Exporter: 'summary', 'prometheus', 'log' or the import path of an "
+                "exporter class. Defaults to the MUX_METRICS_EXPORTER setting."
+            ),
+        )
+        parser.add_argument(
+            "--reset",
+            action="store_true",
+            help="Reset all counters after printing them",
+        )
+
+    def handle(self, *args, **options):
+        exporter = metrics.get_exporter(options["format"])
+        self.stdout.write(exporter.export(metrics.get_snapshot()), ending="")
+        if options["reset"]:
+            metrics.reset()
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from muxltiproducer import models
+
+
+class Command(BaseCommand):
+    help = (
+        "Move all the assets of an LTI context to another one, for instance after "
+        "a course rerun"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="LTI context ID of the original course")
+        parser.add_argument("target", help="LTI context ID of the new course")
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of assets that are moved by each query",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only print the number of assets that would be moved",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            source = models.LtiContext.objects.get(context_id=options["source"])
+        except models.LtiContext.DoesNotExist as e:
+            raise CommandError(f"Unknown LTI context: {options['source']}") from e
+        total = models.Asset.objects.filter(lti_context=source).count()
+        if options["dry_run"]:
+            self.stdout.write(
+                f"{total} assets would be moved from {source.context_id} to "
+                f"{options['target']}"
+            )
+            return
+        target, _created = models.LtiContext.objects.get_or_create(
+            context_id=options["target"]
+        )
+        try:
+            for moved in models.Asset.objects.reparent(
+                source, target, batch_size=options["batch_size"]
+            ):
+                self.stdout.write(f"Moved {moved}/{total} assets")
+        except ValueError as e:
+            raise CommandError(str(e)) from e
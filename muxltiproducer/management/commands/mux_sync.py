@@ -8,8 +8,29 @@ from muxltiproducer import tasks
 class Command(BaseCommand):
     help = "Synchronize data with the Mux API"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode",
+            choices=["list", "poll"],
+            help="Direct uploads synchronization mode",
+        )
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            help="Number of direct uploads fetched simultaneously, in 'poll' mode",
+        )
+        parser.add_argument(
+            "--rate",
+            type=float,
+            help="Maximum number of Mux API requests per second, in 'poll' mode",
+        )
+
     def handle(self, *args, **options):
         logging.getLogger().setLevel(logging.INFO)
         if options["verbosity"] >= 3:
             logging.getLogger().setLevel(logging.DEBUG)
-        tasks.synchronize.call_local()
+        tasks.synchronize.call_local(
+            mode=options["mode"],
+            concurrency=options["concurrency"],
+            rate=options["rate"],
+        )
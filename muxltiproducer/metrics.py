@@ -0,0 +1,395 @@
+"""
+Instrumentation of the calls to the Mux API and of the asset cache.
+
+Metrics are recorded in memory by every process, and regularly added to shared
+counters in the lti_apps cache, such that they can be exported by the
+"mux_metrics" management command.
+"""
+import atexit
+import bisect
+import json
+import logging
+import threading
+import typing as t
+from collections import defaultdict
+from time import perf_counter, time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+# Upper bounds of the latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+CACHE_KEY_PREFIX = "mux:metrics:"
+# Counter names are registered once, in an append-only list of keys
+NAMES_COUNT_CACHE_KEY = f"{CACHE_KEY_PREFIX}names:count"
+NAME_CACHE_KEY_PREFIX = f"{CACHE_KEY_PREFIX}names:"
+REGISTERED_CACHE_KEY_PREFIX = f"{CACHE_KEY_PREFIX}registered:"
+
+logger = logging.getLogger(__file__)
+
+
+class Metrics:
+    """
+    Thread-safe metric counters of the current process.
+
+    Counters are indexed by "|"-separated names:
+
+        latency|<operation>|<bucket index>: number of calls per latency bucket
+        latency_sum|<operation>: total latency, in microseconds
+        errors|<operation>|<exception class>: number of failed calls
+        cache|hit, cache|miss: number of asset cache lookups
+    """
+
+    def __init__(self) -> None:
+        self.counters: t.Dict[str, int] = defaultdict(int)
+        self.flushed_at = time()
+        self._lock = threading.Lock()
+        self._is_flushing = False
+
+    def observe(
+        self, operation: str, duration: float, error: t.Optional[Exception] = None
+    ) -> None:
+        bucket = bisect.bisect_left(LATENCY_BUCKETS, duration)
+        with self._lock:
+            self.counters[f"latency|{operation}|{bucket}"] += 1
+            self.counters[f"latency_sum|{operation}"] += int(duration * 1e6)
+            if error is not None:
+                self.counters[f"errors|{operation}|{error.__class__.__name__}"] += 1
+        self.flush_if_needed()
+
+    def observe_cache(self, hits: int = 0, misses: int = 0) -> None:
+        with self._lock:
+            self.counters["cache|hit"] += hits
+            self.counters["cache|miss"] += misses
+        self.flush_if_needed()
+
+    def flush_if_needed(self) -> None:
+        """
+        Flush the counters in a background thread, such that the current
+        request or API call does not wait for the cache.
+        """
+        if time() - self.flushed_at <= getattr(
+            settings, "MUX_METRICS_FLUSH_SECONDS", 10
+        ):
+            return
+        with self._lock:
+            if self._is_flushing:
+                return
+            self._is_flushing = True
+            self.flushed_at = time()
+        threading.Thread(target=self._flush_in_background, daemon=True).start()
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Could not flush metrics")
+        finally:
+            self._is_flushing = False
+
+    def flush(self) -> None:
+        """
+        Add the counters of this process to the shared counters, and reset them.
+
+        Existing shared counters are incremented with a single cache call each.
+        Missing counters, which are new or were reset, are created and their
+        name is registered.
+        """
+        with self._lock:
+            counters = {name: value for name, value in self.counters.items() if value}
+            self.counters.clear()
+            self.flushed_at = time()
+        cache = caches["lti_apps"]
+        for name, value in counters.items():
+            cache_key = f"{CACHE_KEY_PREFIX}{name}"
+            try:
+                cache.incr(cache_key, value)
+                continue
+            except ValueError:
+                pass
+            if not cache.add(cache_key, value, timeout=None):
+                # The counter was created by another process in the meantime
+                cache.incr(cache_key, value)
+            register_name(name)
+
+
+def register_name(name: str) -> None:
+    """
+    Add a counter name to the shared list of names, unless it is already there.
+
+    Names are appended with atomic cache operations, such that concurrent
+    processes do not overwrite each other's names.
+    """
+    cache = caches["lti_apps"]
+    if not cache.add(f"{REGISTERED_CACHE_KEY_PREFIX}{name}", True, timeout=None):
+        return
+    cache.add(NAMES_COUNT_CACHE_KEY, 0, timeout=None)
+    index = cache.incr(NAMES_COUNT_CACHE_KEY)
+    cache.set(f"{NAME_CACHE_KEY_PREFIX}{index}", name, timeout=None)
+
+
+def get_names() -> t.List[str]:
+    """
+    Return the registered counter names.
+    """
+    cache = caches["lti_apps"]
+    count = cache.get(NAMES_COUNT_CACHE_KEY) or 0
+    names = cache.get_many(
+        [f"{NAME_CACHE_KEY_PREFIX}{index}" for index in range(1, count + 1)]
+    )
+    return sorted(set(names.values()))
+
+
+metrics = Metrics()
+atexit.register(metrics.flush)
+
+
+class InstrumentedClient:
+    """
+    Wrapper around a Mux API client that records the latency and the errors of
+    all API calls.
+    """
+
+    def __init__(self, client: t.Any) -> None:
+        self._client = client
+
+    def __getattr__(self, name: str) -> t.Any:
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        def call(*args: t.Any, **kwargs: t.Any) -> t.Any:
+            start = perf_counter()
+            try:
+                result = attribute(*args, **kwargs)
+            except Exception as e:
+                metrics.observe(name, perf_counter() - start, error=e)
+                raise
+            metrics.observe(name, perf_counter() - start)
+            return result
+
+        return call
+
+
+class Snapshot(t.NamedTuple):
+    """
+    Metrics aggregated over all processes.
+    """
+
+    # Non-cumulative call counts, indexed by operation and bucket index
+    latency: t.Dict[str, t.List[int]]
+    # Total latency in seconds, indexed by operation
+    latency_sum: t.Dict[str, float]
+    # Error counts, indexed by (operation, exception class)
+    errors: t.Dict[t.Tuple[str, str], int]
+    cache_hits: int
+    cache_misses: int
+
+    @property
+    def cache_hit_ratio(self) -> t.Optional[float]:
+        lookups = self.cache_hits + self.cache_misses
+        return self.cache_hits / lookups if lookups else None
+
+    def latency_quantile(self, operation: str, quantile: float) -> float:
+        """
+        Estimate a latency quantile from the histogram, as the upper bound of the
+        bucket that contains it.
+        """
+        counts = self.latency[operation]
+        rank = quantile * sum(counts)
+        cumulative = 0
+        bucket = 0
+        for bucket, count in enumerate(counts):
+            cumulative += count
+            if cumulative >= rank and count:
+                break
+        return (LATENCY_BUCKETS + (float("inf"),))[bucket]
+
+
+def get_snapshot() -> Snapshot:
+    """
+    Read the shared counters. Counters of the current process are flushed first.
+    """
+    metrics.flush()
+    cache = caches["lti_apps"]
+    names = get_names()
+    values = cache.get_many([f"{CACHE_KEY_PREFIX}{name}" for name in names])
+    snapshot = Snapshot({}, {}, {}, 0, 0)
+    for name in names:
+        value = values.get(f"{CACHE_KEY_PREFIX}{name}")
+        if not value:
+            continue
+        kind, *labels = name.split("|")
+        if kind == "latency":
+            operation, bucket = labels
+            counts = snapshot.latency.setdefault(
+                operation, [0] * (len(LATENCY_BUCKETS) + 1)
+            )
+            counts[int(bucket)] += value
+        elif kind == "latency_sum":
+            snapshot.latency_sum[labels[0]] = value / 1e6
+        elif kind == "errors":
+            snapshot.errors[(labels[0], labels[1])] = value
+        elif name == "cache|hit":
+            snapshot = snapshot._replace(cache_hits=value)  # pylint: disable=no-member
+        elif name == "cache|miss":
+            snapshot = snapshot._replace(  # pylint: disable=no-member
+                cache_misses=value
+            )
+    return snapshot
+
+
+def reset() -> None:
+    """
+    Reset the shared counters.
+    """
+    with metrics._lock:  # pylint: disable=protected-access
+        metrics.counters.clear()
+    cache = caches["lti_apps"]
+    names = get_names()
+    count = cache.get(NAMES_COUNT_CACHE_KEY) or 0
+    cache.delete_many(
+        [f"{CACHE_KEY_PREFIX}{name}" for name in names]
+        + [f"{REGISTERED_CACHE_KEY_PREFIX}{name}" for name in names]
+        + [f"{NAME_CACHE_KEY_PREFIX}{index}" for index in range(1, count + 1)]
+        + [NAMES_COUNT_CACHE_KEY]
+    )
+
+
+class PrometheusExporter:
+    """
+    Export metrics in the Prometheus text format.
+    """
+
+    def export(self, snapshot: Snapshot) -> str:
+        lines = [
+            "# HELP mux_api_request_duration_seconds Duration of Mux API calls.",
+            "# TYPE mux_api_request_duration_seconds histogram",
+        ]
+        for operation, counts in sorted(snapshot.latency.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(
+                    "mux_api_request_duration_seconds_bucket"
+                    f'{{operation="{operation}",le="{bound}"}} {cumulative}'
+                )
+            lines.append(
+                f'mux_api_request_duration_seconds_sum{{operation="{operation}"}} '
+                f"{snapshot.latency_sum.get(operation, 0)}"
+            )
+            lines.append(
+                f'mux_api_request_duration_seconds_count{{operation="{operation}"}} '
+                f"{cumulative}"
+            )
+        lines += [
+            "# HELP mux_api_errors_total Failed Mux API calls.",
+            "# TYPE mux_api_errors_total counter",
+        ]
+        for (operation, exception), count in sorted(snapshot.errors.items()):
+            lines.append(
+                f'mux_api_errors_total{{operation="{operation}",'
+                f'exception="{exception}"}} {count}'
+            )
+        lines += [
+            "# HELP mux_asset_cache_lookups_total Lookups of asset properties in "
+            "the cache.",
+            "# TYPE mux_asset_cache_lookups_total counter",
+            f'mux_asset_cache_lookups_total{{result="hit"}} {snapshot.cache_hits}',
+            f'mux_asset_cache_lookups_total{{result="miss"}} {snapshot.cache_misses}',
+        ]
+        return "\n".join(lines) + "\n"
+
+
+class LogExporter:
+    """
+    Export metrics as structured (JSON) log records, one per operation.
+    """
+
+    def export(self, snapshot: Snapshot) -> str:
+        records: t.List[t.Dict[str, t.Any]] = []
+        for operation, counts in sorted(snapshot.latency.items()):
+            calls = sum(counts)
+            records.append(
+                {
+                    "metric": "mux_api_calls",
+                    "operation": operation,
+                    "calls": calls,
+                    "errors": {
+                        exception: count
+                        for (errored_operation, exception), count in sorted(
+                            snapshot.errors.items()
+                        )
+                        if errored_operation == operation
+                    },
+                    "mean_seconds": snapshot.latency_sum.get(operation, 0) / calls,
+                    "p50_seconds": snapshot.latency_quantile(operation, 0.5),
+                    "p95_seconds": snapshot.latency_quantile(operation, 0.95),
+                    "p99_seconds": snapshot.latency_quantile(operation, 0.99),
+                }
+            )
+        records.append(
+            {
+                "metric": "mux_asset_cache",
+                "hits": snapshot.cache_hits,
+                "misses": snapshot.cache_misses,
+                "hit_ratio": snapshot.cache_hit_ratio,
+            }
+        )
+        lines = [json.dumps(record) for record in records]
+        for line in lines:
+            logger.info(line)
+        return "\n".join(lines) + "\n"
+
+
+class SummaryExporter:
+    """
+    Export metrics as a human-readable table.
+    """
+
+    def export(self, snapshot: Snapshot) -> str:
+        lines = [
+            f"{'Operation':<30} {'Calls':>8} {'Errors':>8} {'Mean':>9} "
+            f"{'p50':>9} {'p95':>9} {'p99':>9}"
+        ]
+        for operation, counts in sorted(snapshot.latency.items()):
+            calls = sum(counts)
+            errors = sum(
+                count
+                for (errored_operation, _exception), count in snapshot.errors.items()
+                if errored_operation == operation
+            )
+            mean = snapshot.latency_sum.get(operation, 0) / calls
+            lines.append(
+                f"{operation:<30} {calls:>8} {errors:>8} {mean * 1000:>7.1f}ms "
+                + " ".join(
+                    f"<{snapshot.latency_quantile(operation, quantile) * 1000:>6.0f}ms"
+                    for quantile in (0.5, 0.95, 0.99)
+                )
+            )
+        ratio = snapshot.cache_hit_ratio
+        lines.append(
+            f"Asset cache: {snapshot.cache_hits} hits, {snapshot.cache_misses} misses"
+            + (f" (hit ratio: {ratio:.1%})" if ratio is not None else "")
+        )
+        return "\n".join(lines) + "\n"
+
+
+EXPORTERS = {
+    "prometheus": PrometheusExporter,
+    "log": LogExporter,
+    "summary": SummaryExporter,
+}
+
+
+def get_exporter(name: t.Optional[str] = None) -> t.Any:
+    """
+    Return an exporter instance from its name, or from the import path of a
+    class with an `export(snapshot) -> str` method. The default exporter is
+    defined by the MUX_METRICS_EXPORTER setting.
+    """
+    if not name:
+        name = str(getattr(settings, "MUX_METRICS_EXPORTER", "summary"))
+    exporter_class = EXPORTERS.get(name) or import_string(name)
+    return exporter_class()
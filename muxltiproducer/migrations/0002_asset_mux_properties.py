@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="asset",
+            name="mux_created_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_errors",
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_playback_id",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_playback_policy",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_status",
+            field=models.CharField(
+                blank=True,
+                choices=[
+                    ("preparing", "PREPARING"),
+                    ("ready", "READY"),
+                    ("errored", "ERRORED"),
+                    ("missing", "MISSING"),
+                ],
+                max_length=32,
+            ),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_synced_at",
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="asset",
+            name="mux_text_tracks",
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
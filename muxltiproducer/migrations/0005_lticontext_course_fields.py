@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0004_webhookevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="lticontext",
+            name="course",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="lticontext",
+            name="organization",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddField(
+            model_name="lticontext",
+            name="run",
+            field=models.CharField(blank=True, default="", max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="lticontext",
+            index=models.Index(
+                fields=["organization", "course", "run"],
+                name="muxltiproducer_org_course_run",
+            ),
+        ),
+    ]
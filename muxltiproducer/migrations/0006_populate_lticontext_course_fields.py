@@ -0,0 +1,39 @@
+import re
+
+from django.db import migrations
+
+BATCH_SIZE = 2000
+# Open edX course ID pattern, copied such that this migration does not depend on
+# the current code of the app
+COURSE_ID_REGEX = re.compile(
+    r"course-v1:(?P<organization>[^+]+)\+(?P<course>[^+]+)\+(?P<run>[^+]+)"
+)
+
+
+def populate_course_fields(apps, _schema_editor):
+    LtiContext = apps.get_model("muxltiproducer", "LtiContext")
+    batch = []
+    for lti_context in LtiContext.objects.only("id", "context_id").iterator(
+        chunk_size=BATCH_SIZE
+    ):
+        match = COURSE_ID_REGEX.match(lti_context.context_id)
+        organization, course, run = match.groups() if match else ("", "", "")
+        lti_context.organization = organization
+        lti_context.course = course
+        lti_context.run = run
+        batch.append(lti_context)
+        if len(batch) >= BATCH_SIZE:
+            LtiContext.objects.bulk_update(batch, ["organization", "course", "run"])
+            batch = []
+    LtiContext.objects.bulk_update(batch, ["organization", "course", "run"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0005_lticontext_course_fields"),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_course_fields, migrations.RunPython.noop),
+    ]
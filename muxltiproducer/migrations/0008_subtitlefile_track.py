@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:20
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0007_subtitlefile"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="subtitlefile",
+            name="asset",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="subtitle_files",
+                to="muxltiproducer.asset",
+            ),
+        ),
+        migrations.AddField(
+            model_name="subtitlefile",
+            name="mux_track_id",
+            field=models.CharField(
+                blank=True, db_index=True, max_length=255, verbose_name="Mux track ID"
+            ),
+        ),
+    ]
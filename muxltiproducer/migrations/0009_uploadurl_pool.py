@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0008_subtitlefile_track"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadurl",
+            name="origin",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="uploadurl",
+            name="playback_policy",
+            field=models.CharField(blank=True, max_length=32),
+        ),
+        migrations.AddField(
+            model_name="uploadurl",
+            name="url",
+            field=models.TextField(blank=True, verbose_name="Mux direct upload URL"),
+        ),
+        migrations.AlterField(
+            model_name="uploadurl",
+            name="lti_context",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                to="muxltiproducer.lticontext",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="uploadurl",
+            index=models.Index(
+                condition=models.Q(("lti_context__isnull", True)),
+                fields=["origin", "playback_policy", "created_at"],
+                name="muxltiproducer_uploadurl_pool",
+            ),
+        ),
+    ]
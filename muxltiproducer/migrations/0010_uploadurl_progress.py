@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 07:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0009_uploadurl_pool"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="uploadurl",
+            name="bytes_confirmed",
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="uploadurl",
+            name="bytes_total",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadurl",
+            name="chunk_size",
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="uploadurl",
+            name="progress_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
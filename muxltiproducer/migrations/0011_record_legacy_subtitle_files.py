@@ -0,0 +1,36 @@
+from django.core.files.storage import DefaultStorage
+from django.db import migrations
+
+# Copied, such that this migration does not depend on the current code of the app
+MEDIA_FOLDER = "mux/subtitles"
+BATCH_SIZE = 2000
+
+
+def record_legacy_subtitle_files(apps, _schema_editor):
+    """
+    Subtitle files that were uploaded before SubtitleFile rows were created are
+    recorded once, such that they are deleted by the expiry task. They expire
+    one hour after this migration, which leaves enough time to Mux to ingest
+    the most recent ones.
+    """
+    SubtitleFile = apps.get_model("muxltiproducer", "SubtitleFile")
+    try:
+        _folders, files = DefaultStorage().listdir(MEDIA_FOLDER)
+    except FileNotFoundError:
+        return
+    SubtitleFile.objects.bulk_create(
+        [SubtitleFile(name=f"{MEDIA_FOLDER}/{filename}") for filename in files],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("muxltiproducer", "0010_uploadurl_progress"),
+    ]
+
+    operations = [
+        migrations.RunPython(record_legacy_subtitle_files, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,48 @@
 import enum
+import logging
 import typing as t
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from time import monotonic, sleep, time
 
+from django.conf import settings
 from django.core.cache import caches
-from django.db import models
-from django.utils.timezone import now
+from django.db import models, transaction
+from django.utils.timezone import is_naive, make_aware, make_naive, now
 
 from . import mux, openedx
+from .metrics import metrics
+
+logger = logging.getLogger(__file__)
+
+PREFETCH_MAX_WORKERS = getattr(settings, "MUX_PREFETCH_MAX_WORKERS", 8)
+UPLOAD_URL_POOL_SIZE = getattr(settings, "MUX_UPLOAD_URL_POOL_SIZE", 10)
+UPLOAD_PROGRESS_TIMEOUT_SECONDS = getattr(
+    settings, "MUX_UPLOAD_PROGRESS_TIMEOUT_SECONDS", 300
+)
+# Default validity of asset data, by Mux asset status
+CACHE_TTL_SECONDS = {
+    "preparing": 60,
+    "ready": 24 * 60 * 60,
+    "errored": 24 * 60 * 60,
+    "missing": 5 * 60,
+}
+REFRESH_LOCK_SECONDS = 60
+FETCH_LOCK_SECONDS = 10
+FETCH_LOCK_POLL_SECONDS = 0.1
+# Number of assets deleted from Mux by each asynchronous task
+DELETE_CHUNK_SIZE = 100
+# Upload url statuses are cached until the urls are deleted
+UPLOAD_STATUS_CACHE_TIMEOUT = mux.DIRECT_UPLOAD_VALIDITY_SECONDS + 60 * 60
+# Pooled upload urls are checked out only if they leave enough time for an
+# upload; older urls just expire
+UPLOAD_URL_POOL_MAX_AGE_SECONDS = mux.DIRECT_UPLOAD_VALIDITY_SECONDS // 2
+# Urls are created one by one, so the fill lock must outlive the slowest fill
+UPLOAD_URL_POOL_FILL_LOCK_SECONDS = (
+    int(UPLOAD_URL_POOL_SIZE * mux.get_max_request_seconds()) + 60
+)
+# Pools are topped up when they have at most this number of urls left
+UPLOAD_URL_POOL_LOW_WATER_MARK = UPLOAD_URL_POOL_SIZE // 2
 
 
 class LtiContext(models.Model):
@@ -17,32 +53,359 @@ class LtiContext(models.Model):
     context_id = models.CharField(
         verbose_name="LTI context ID (aka: course ID)", max_length=512, unique=True
     )
+    # Open edX course ID components, parsed from the context ID. These are empty
+    # if the context ID is not an Open edX course ID.
+    organization = models.CharField(max_length=255, blank=True, default="")
+    course = models.CharField(max_length=255, blank=True, default="")
+    run = models.CharField(max_length=255, blank=True, default="")
+
+    class Meta:
+        indexes = [
+            # This index serves lookups by organization, organization + course
+            # and organization + course + run.
+            models.Index(
+                fields=["organization", "course", "run"],
+                name="muxltiproducer_org_course_run",
+            ),
+        ]
+
+    def save(self, *args, **kwargs) -> None:
+        self.set_course_fields()
+        super().save(*args, **kwargs)
+
+    def set_course_fields(self) -> None:
+        """
+        Parse the organization, course and run from the context ID.
+        """
+        self.organization, self.course, self.run = openedx.course_pattern_match(
+            self.context_id
+        ) or ("", "", "")
 
 
 # pylint: disable=too-few-public-methods
-class AssetManager(models.Manager):
+class AssetManager(models.Manager["Asset"]):
     def filter_visible(self, course_id: str):
-        regex = openedx.course_access_limit_regex(course_id)
-        return self.filter(lti_context__context_id__regex=regex) if regex else self
+        lookups = openedx.course_access_limit_lookups(course_id)
+        if lookups is None:
+            return self
+        return self.filter(
+            **{f"lti_context__{field}": value for field, value in lookups.items()}
+        )
+
+    def get_visible_page(
+        self,
+        course_id: str,
+        before: t.Optional[int] = None,
+        query: str = "",
+        size: int = 20,
+    ) -> t.Tuple[t.List["Asset"], t.Optional[int]]:
+        """
+        Return a page of visible assets, from the most recent ones, with their
+        Mux properties.
+
+        Pagination is keyset-based: `before` is the pk of the last asset from
+        the previous page. Assets can be searched with `query`, which is either
+        an upload date (YYYY-MM-DD) or the beginning of a Mux asset ID.
+
+        Return the list of assets and the `before` value of the next page, or
+        None if this is the last page.
+        """
+        assets = self.filter_visible(course_id)
+        if before is not None:
+            assets = assets.filter(pk__lt=before)
+        query = query.strip()
+        if query:
+            try:
+                upload_date = date.fromisoformat(query)
+            except ValueError:
+                assets = assets.filter(mux_id__startswith=query)
+            else:
+                assets = assets.filter(mux_created_at__date=upload_date)
+        page = self.prefetch_mux_properties(assets.order_by("-pk")[: size + 1])
+        if len(page) > size:
+            return page[:size], page[size - 1].pk
+        return page, None
+
+    def prefetch_mux_properties(self, assets: t.Iterable["Asset"]) -> t.List["Asset"]:
+        """
+        Load the Mux properties of many assets at once.
+
+        This should be used whenever `mux_properties` is going to be accessed
+        for a list of assets, for instance in a template. Only the assets that
+        were never synchronized need to be loaded: their properties are then
+        stored locally. The assets queryset is evaluated. Assets that could not
+        be loaded have no properties.
+
+        Return the list of assets.
+        """
+        assets = list(assets)
+        failed = self.sync_mux_data(
+            [asset for asset in assets if asset.mux_synced_at is None]
+        )
+        for asset in failed:
+            # Don't fetch the asset again on `mux_properties` access
+            asset._mux_properties = None  # pylint: disable=protected-access
+        return assets
+
+    def sync_mux_data(self, assets: t.List["Asset"], no_cache=False) -> t.List["Asset"]:
+        """
+        Update the local copy of the Mux properties of many assets at once.
+
+        Data is loaded with `MuxAssetProperties.load_data_many` and saved with
+        a single bulk update query. Assets that could not be loaded are left
+        unchanged, and will be synchronized later.
+
+        Return the list of assets that could not be loaded.
+        """
+        if not assets:
+            return []
+        data = MuxAssetProperties.load_data_many(
+            [asset.mux_id for asset in assets], no_cache=no_cache
+        )
+        synced: t.List["Asset"] = []
+        failed: t.List["Asset"] = []
+        for asset in assets:
+            if asset.mux_id in data:
+                asset.set_mux_data(data[asset.mux_id])
+                synced.append(asset)
+            else:
+                failed.append(asset)
+        if synced:
+            self.bulk_update(synced, Asset.MUX_FIELDS)
+        return failed
+
+    def bulk_delete(self, assets: "models.QuerySet[Asset]") -> t.List[str]:
+        """
+        Delete assets both locally and from Mux.
+
+        Local rows are deleted at once and the cached properties are evicted.
+        Mux deletions are queued in chunks (see `tasks.delete_mux_assets`).
+
+        Return: Mux IDs of the deleted assets.
+        """
+        # pylint: disable=import-outside-toplevel,cyclic-import
+        from . import tasks
+
+        mux_ids = list(assets.values_list("mux_id", flat=True))
+        if not mux_ids:
+            return []
+        self.filter(mux_id__in=mux_ids).delete()
+        MuxAssetProperties.delete_cached_data(mux_ids)
+        for start in range(0, len(mux_ids), DELETE_CHUNK_SIZE):
+            tasks.delete_mux_assets(mux_ids[start : start + DELETE_CHUNK_SIZE])
+        return mux_ids
+
+    def reparent(
+        self, source: "LtiContext", target: "LtiContext", batch_size: int = 1000
+    ) -> t.Iterator[int]:
+        """
+        Move all the assets of an LTI context to another one, for instance when
+        a course is rerun.
+
+        Assets are moved with one update query per batch. Yield the total number
+        of moved assets after each batch.
+        """
+        if source.pk == target.pk:
+            raise ValueError("Source and target contexts must be different")
+        moved = 0
+        while True:
+            pks = list(
+                self.filter(lti_context=source)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                return
+            moved += self.filter(pk__in=pks).update(lti_context=target)
+            yield moved
+            if len(pks) < batch_size:
+                return
+
+    def update_mux_data(
+        self, mux_id: str, data: t.Optional[t.Dict[str, t.Any]]
+    ) -> None:
+        """
+        Store up-to-date Mux data, for instance from a webhook payload, both in
+        the cache and in the local copy.
+        """
+        MuxAssetProperties.set_cached_data({mux_id: data})
+        self.filter(mux_id=mux_id).update(**Asset.mux_fields(data))
 
 
 class Asset(models.Model):
+    @enum.unique
+    class Statuses(enum.Enum):
+        # https://docs.mux.com/api-reference/video#tag/assets
+        PREPARING = "preparing"
+        READY = "ready"
+        ERRORED = "errored"
+        # Local status for assets that could not be found on Mux
+        MISSING = "missing"
+
+    MUX_FIELDS = [
+        "mux_status",
+        "mux_playback_id",
+        "mux_playback_policy",
+        "mux_created_at",
+        "mux_errors",
+        "mux_text_tracks",
+        "mux_synced_at",
+    ]
+    # Subset of the track properties that are stored locally
+    MUX_TRACK_KEYS = ["id", "type", "text_type", "name", "language_code", "status"]
+
     mux_id = models.CharField(verbose_name="Mux asset ID", max_length=255, unique=True)
     lti_context = models.ForeignKey(LtiContext, models.CASCADE)
+
+    # Local copy of the Mux properties, such that we don't need to query Mux or
+    # the cache to render videos. This copy is kept up-to-date by webhooks and
+    # the synchronization task.
+    mux_status = models.CharField(
+        max_length=32,
+        blank=True,
+        choices=[(s.value, s.name) for s in Statuses],
+    )
+    mux_playback_id = models.CharField(max_length=255, blank=True)
+    mux_playback_policy = models.CharField(max_length=32, blank=True)
+    mux_created_at = models.DateTimeField(null=True, blank=True)
+    mux_errors = models.JSONField(default=list, blank=True)
+    mux_text_tracks = models.JSONField(default=list, blank=True)
+    mux_synced_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
     objects = AssetManager()
 
     @property
     def mux_properties(self) -> t.Optional["MuxAssetProperties"]:
         """
-        Return the properties object built from Mux API.
+        Return the properties object built from the local copy of the Mux data.
+
+        If the asset was never synchronized, data is first loaded from the cache
+        or the Mux API and stored locally. If the local copy is stale, it is
+        refreshed in the background.
 
         Return None if the asset does not exist on Mux.
         """
         if not hasattr(self, "_mux_properties"):
+            if self.mux_synced_at is None:
+                self.set_mux_data(MuxAssetProperties.load_data(self.mux_id))
+                self.save(update_fields=self.MUX_FIELDS)
+            elif self.mux_synced_at < now() - timedelta(
+                seconds=MuxAssetProperties.get_cache_ttl(self.mux_status)
+            ):
+                MuxAssetProperties.refresh_in_background(self.mux_id)
+            data = self.mux_data
             # pylint: disable=attribute-defined-outside-init
-            self._mux_properties = MuxAssetProperties.load(self.mux_id)
+            self._mux_properties = MuxAssetProperties(data) if data else None
         return self._mux_properties
 
+    def get_player_cache(self) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Return the timeout and version of the cached player html, or None if
+        the player should not be cached.
+
+        The version changes whenever the local copy is updated, by webhooks or
+        synchronization, and whenever signed urls are renewed. The player
+        expires when the local copy becomes stale, such that it is refreshed
+        on the next render.
+        """
+        if self.mux_status != self.Statuses.READY.value or self.mux_synced_at is None:
+            return None
+        timeout = int(
+            self.mux_synced_at.timestamp()
+            + MuxAssetProperties.get_cache_ttl(self.mux_status)
+            - time()
+        )
+        if timeout <= 0:
+            return None
+        version = f"{self.mux_playback_policy}:{self.mux_synced_at.timestamp()}"
+        if self.mux_playback_policy != "public":
+            epoch, epoch_timeout = mux.get_signing_epoch()
+            version = f"{version}:{epoch}"
+            timeout = min(timeout, epoch_timeout)
+        return {"timeout": timeout, "version": version}
+
+    @property
+    def mux_data(self) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Mux API data rebuilt from the local copy.
+
+        Return None if the asset does not exist on Mux.
+        """
+        if self.mux_status == self.Statuses.MISSING.value:
+            return None
+        return {
+            "id": self.mux_id,
+            "status": self.mux_status,
+            "created_at": str(int(_to_aware(self.mux_created_at).timestamp()))
+            if self.mux_created_at
+            else "0",
+            "playback_ids": [
+                {"id": self.mux_playback_id, "policy": self.mux_playback_policy}
+            ]
+            if self.mux_playback_id
+            else [],
+            "errors": {"messages": self.mux_errors} if self.mux_errors else None,
+            "tracks": self.mux_text_tracks,
+        }
+
+    def set_mux_data(self, data: t.Optional[t.Dict[str, t.Any]]) -> None:
+        """
+        Update the local copy from Mux API data. The asset is not saved.
+        """
+        for name, value in self.mux_fields(data).items():
+            setattr(self, name, value)
+        if hasattr(self, "_mux_properties"):
+            del self._mux_properties
+
+    def set_text_tracks(self, text_tracks: t.List[t.Dict[str, t.Any]]) -> None:
+        """
+        Patch the local copy and the cached properties with new text tracks.
+        """
+        self.mux_text_tracks = text_tracks
+        self.save(update_fields=["mux_text_tracks"])
+        MuxAssetProperties.set_cached_data({self.mux_id: self.mux_data})
+
+    @classmethod
+    def mux_fields(cls, data: t.Optional[t.Dict[str, t.Any]]) -> t.Dict[str, t.Any]:
+        """
+        Return the values of the local copy fields for the given Mux API data.
+        """
+        if not data:
+            return {
+                "mux_status": cls.Statuses.MISSING.value,
+                "mux_playback_id": "",
+                "mux_playback_policy": "",
+                "mux_created_at": None,
+                "mux_errors": [],
+                "mux_text_tracks": [],
+                "mux_synced_at": now(),
+            }
+        properties = MuxAssetProperties(data)
+        playback = properties.playback or {}
+        return {
+            "mux_status": data.get("status") or "",
+            "mux_playback_id": playback.get("id") or "",
+            "mux_playback_policy": playback.get("policy") or "",
+            "mux_created_at": _from_timestamp(properties.created_at_timestamp)
+            if data.get("created_at")
+            else None,
+            "mux_errors": properties.error_messages,
+            "mux_text_tracks": [
+                {key: track.get(key) for key in cls.MUX_TRACK_KEYS}
+                for track in properties.subtitle_tracks
+            ],
+            "mux_synced_at": now(),
+        }
+
+
+def _from_timestamp(timestamp: int) -> datetime:
+    value = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return value if settings.USE_TZ else make_naive(value)
+
+
+def _to_aware(value: datetime) -> datetime:
+    return make_aware(value) if is_naive(value) else value
+
 
 class MuxAssetProperties:
     @classmethod
@@ -55,6 +418,10 @@ class MuxAssetProperties:
         data = cls.load_data(mux_id)
         return cls(data) if data else None
 
+    @staticmethod
+    def cache_key(mux_id: str) -> str:
+        return f"mux:assets:{mux_id}"
+
     @staticmethod
     def load_data(mux_id, no_cache=False) -> t.Optional[t.Dict[str, t.Any]]:
         """
@@ -63,27 +430,199 @@ class MuxAssetProperties:
         Return None if the object could not be found.
 
         Results are stored in the lti_apps cache with keys prefixed by
-        "mux:assets:". Pass `no_cache=True` to bypass the cache.
+        "mux:assets:". Stale cached data is returned right away, and refreshed
+        in the background (see `get_cache_ttl`). Pass `no_cache=True` to bypass
+        the cache.
 
         See docs: https://docs.mux.com/api-reference/video#operation/get-asset
         """
-        absent = object()
-        cache_key = f"mux:assets:{mux_id}"
+        if not no_cache:
+            entry = caches["lti_apps"].get(MuxAssetProperties.cache_key(mux_id))
+            if entry is not None:
+                metrics.observe_cache(hits=1)
+                return MuxAssetProperties._unpack_cache_entry(mux_id, entry)
+            metrics.observe_cache(misses=1)
+            return MuxAssetProperties._fetch_data_once(mux_id)
+        data = mux.get_asset(mux_id)
+        MuxAssetProperties.set_cached_data({mux_id: data})
+        return data
+
+    @staticmethod
+    def load_data_many(
+        mux_ids: t.Iterable[str], no_cache=False
+    ) -> t.Dict[str, t.Optional[t.Dict[str, t.Any]]]:
+        """
+        Load many assets at once, from the cache or from the Mux API.
+
+        Cached data is fetched with a single query to the lti_apps cache. Cache
+        misses are then fetched concurrently from the Mux API, with at most
+        MUX_PREFETCH_MAX_WORKERS simultaneous requests throttled by the shared
+        rate limiter, and stored in the cache. Pass `no_cache=True` to fetch all
+        assets from the Mux API.
+
+        Return a dict of asset data indexed by Mux asset ID. Assets that could
+        not be fetched are logged and left out.
+        """
+        cache_keys = {
+            MuxAssetProperties.cache_key(mux_id): mux_id for mux_id in mux_ids
+        }
+        data = {}
+        if not no_cache:
+            for cache_key, entry in (
+                caches["lti_apps"].get_many(cache_keys.keys()).items()
+            ):
+                mux_id = cache_keys[cache_key]
+                data[mux_id] = MuxAssetProperties._unpack_cache_entry(mux_id, entry)
+        missing = [mux_id for mux_id in cache_keys.values() if mux_id not in data]
+        if not no_cache:
+            metrics.observe_cache(hits=len(data), misses=len(missing))
+        if missing:
+            max_workers = min(len(missing), PREFETCH_MAX_WORKERS)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                fetched = dict(
+                    result
+                    for result in executor.map(
+                        MuxAssetProperties._fetch_or_log, missing
+                    )
+                    if result is not None
+                )
+            MuxAssetProperties.set_cached_data(fetched)
+            data.update(fetched)
+        return data
+
+    @staticmethod
+    def _fetch_or_log(
+        mux_id: str,
+    ) -> t.Optional[t.Tuple[str, t.Optional[t.Dict[str, t.Any]]]]:
+        try:
+            return mux_id, mux.get_asset(mux_id, limiter=mux.get_rate_limiter())
+        except mux.ApiException as e:
+            logger.warning(
+                "Could not fetch asset: mux_id=%s status=%s", mux_id, e.status
+            )
+            return None
+
+    @staticmethod
+    def delete_cached_data(mux_ids: t.List[str]) -> None:
+        caches["lti_apps"].delete_many(
+            [MuxAssetProperties.cache_key(mux_id) for mux_id in mux_ids]
+        )
+
+    @staticmethod
+    def set_cached_data(data: t.Dict[str, t.Optional[t.Dict[str, t.Any]]]) -> None:
+        """
+        Store asset data, indexed by Mux asset ID, in the cache.
+
+        Entries remain valid for a duration that depends on the asset status
+        (see `get_cache_ttl`). Then, they are still served, but refreshed in the
+        background. Entries for missing assets are simply deleted when they
+        expire.
+        """
+        entries: t.Dict[t.Optional[int], t.Dict[str, t.Any]] = {}
+        current_time = time()
+        for mux_id, asset_data in data.items():
+            ttl = MuxAssetProperties.get_cache_ttl(
+                asset_data.get("status", "") if asset_data else None
+            )
+            timeout = None if asset_data else ttl
+            entries.setdefault(timeout, {})[MuxAssetProperties.cache_key(mux_id)] = {
+                "data": asset_data,
+                "expires_at": current_time + ttl,
+            }
+        for timeout, timeout_entries in entries.items():
+            caches["lti_apps"].set_many(timeout_entries, timeout=timeout)
+
+    @staticmethod
+    def get_cache_ttl(status: t.Optional[str]) -> int:
+        """
+        Return the validity duration of asset data, in seconds, for the given
+        Mux asset status. Use None for assets that could not be found.
+
+        Durations are defined by the MUX_ASSET_CACHE_TTL_SECONDS setting.
+        Assets that are being prepared are refreshed often, while ready assets
+        are not expected to change.
+        """
+        ttls = {
+            **CACHE_TTL_SECONDS,
+            **getattr(settings, "MUX_ASSET_CACHE_TTL_SECONDS", {}),
+        }
+        if status is None:
+            status = Asset.Statuses.MISSING.value
+        return ttls.get(status, ttls[Asset.Statuses.PREPARING.value])
+
+    @staticmethod
+    def refresh_in_background(mux_id: str) -> None:
+        """
+        Refresh the asset properties from the Mux API in an asynchronous task.
+
+        At most one refresh of a given asset is queued every
+        REFRESH_LOCK_SECONDS.
+        """
+        lock_key = f"{MuxAssetProperties.cache_key(mux_id)}:refresh"
+        if caches["lti_apps"].add(lock_key, True, REFRESH_LOCK_SECONDS):
+            # pylint: disable=import-outside-toplevel,cyclic-import
+            from . import tasks
+
+            tasks.refresh_mux_asset(mux_id)
+
+    @staticmethod
+    def _unpack_cache_entry(
+        mux_id: str, entry: t.Any
+    ) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Return the data from a cache entry. If the entry is stale, a refresh is
+        triggered in the background.
+        """
+        if isinstance(entry, dict) and entry.keys() == {"data", "expires_at"}:
+            data, expires_at = entry["data"], entry["expires_at"]
+        else:
+            # Entry created by a previous version, without expiry date
+            data, expires_at = entry, 0
+        if expires_at < time():
+            MuxAssetProperties.refresh_in_background(mux_id)
+        return data
+
+    @staticmethod
+    def _fetch_data_once(mux_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        """
+        Fetch asset data from the Mux API and store it in the cache.
+
+        To avoid cache stampedes, a lock is stored in the cache while the asset
+        is being fetched: concurrent callers, from any process, wait for the
+        data to be cached instead of querying the Mux API. When the lock
+        expires, callers stop waiting and query the Mux API themselves.
+        """
         cache = caches["lti_apps"]
-        data = cache.get(cache_key, absent)
-        if data is absent or no_cache:
+        cache_key = MuxAssetProperties.cache_key(mux_id)
+        lock_key = f"{cache_key}:lock"
+        has_lock = cache.add(lock_key, True, FETCH_LOCK_SECONDS)
+        if not has_lock:
+            deadline = monotonic() + FETCH_LOCK_SECONDS
+            while monotonic() < deadline:
+                sleep(FETCH_LOCK_POLL_SECONDS)
+                entry = cache.get(cache_key)
+                if entry is not None:
+                    return MuxAssetProperties._unpack_cache_entry(mux_id, entry)
+                if cache.get(lock_key) is None:
+                    break
+        try:
             data = mux.get_asset(mux_id)
-            cache.set(cache_key, data)
-        return data
+            MuxAssetProperties.set_cached_data({mux_id: data})
+            return data
+        finally:
+            if has_lock:
+                cache.delete(lock_key)
 
     def __init__(self, data: t.Dict[str, t.Any]) -> None:
         self._data = data
 
     def update(self) -> "MuxAssetProperties":
         """
-        Update from upstream Mux data.
+        Update from upstream Mux data. The local copy of the asset is updated too.
         """
-        data = self.load_data(self._data["id"], no_cache=True)
+        mux_id = self._data["id"]
+        data = mux.get_asset(mux_id)
+        Asset.objects.update_mux_data(mux_id, data)
         if data:
             self._data = data
         return self
@@ -135,7 +674,8 @@ class MuxAssetProperties:
 
     @property
     def subtitle_tracks(self):
-        return [track for track in self._data["tracks"] if track["type"] == "text"]
+        tracks = self._data.get("tracks") or []
+        return [track for track in tracks if track["type"] == "text"]
 
     @property
     def error_messages(self) -> t.List[str]:
@@ -153,6 +693,138 @@ class UploadUrlManager(models.Manager):
         cutoff = now() - timedelta(seconds=mux.DIRECT_UPLOAD_VALIDITY_SECONDS + 10)
         return self.filter(created_at__lt=cutoff)
 
+    def filter_context(self, context_id: str):
+        """
+        Limit selection to the urls of an LTI context, without fetching the
+        context.
+        """
+        return self.filter(lti_context__context_id=context_id)
+
+    def filter_pool(self, origin: str, playback_policy: str):
+        """
+        Limit selection to the pooled urls that can be checked out for the given
+        origin and playback policy.
+        """
+        return self.filter(
+            lti_context__isnull=True,
+            origin=origin,
+            playback_policy=playback_policy,
+            created_at__gte=now() - timedelta(seconds=UPLOAD_URL_POOL_MAX_AGE_SECONDS),
+        )
+
+    def checkout(
+        self, lti_context: LtiContext, origin: str, playback_policy: str
+    ) -> t.Optional["UploadUrl"]:
+        """
+        Assign a pooled url to an LTI context, without calling the Mux API.
+        Concurrent checkouts skip the urls that are being checked out.
+
+        Return None if the pool is empty.
+        """
+        with transaction.atomic():
+            upload_url = (
+                self.filter_pool(origin, playback_policy)
+                .select_for_update(skip_locked=True)
+                .order_by("created_at")
+                .first()
+            )
+            if upload_url is None:
+                return None
+            upload_url.lti_context = lti_context
+            upload_url.save(update_fields=["lti_context"])
+        return upload_url
+
+    def fill_pool_if_needed(self, origin: str, playback_policy: str) -> None:
+        """
+        Top up the pool of urls of an origin in an asynchronous task if it is
+        running low, such that bursts of uploads do not empty it. Pools that
+        are already being filled are skipped.
+        """
+        if not UPLOAD_URL_POOL_SIZE:
+            return
+        pool_size = self.filter_pool(origin, playback_policy).count()
+        if pool_size <= UPLOAD_URL_POOL_LOW_WATER_MARK and self.lock_pool(origin):
+            # pylint: disable=import-outside-toplevel,cyclic-import
+            from . import tasks
+
+            tasks.fill_upload_url_pool(origin)
+
+    def lock_pool(self, origin: str) -> bool:
+        """
+        Acquire the lock that prevents concurrent fills of the pool of an
+        origin, which would overfill it. The lock is released by
+        `unlock_pool`, or after UPLOAD_URL_POOL_FILL_LOCK_SECONDS.
+
+        Return False if the lock is already held.
+        """
+        return caches["lti_apps"].add(
+            self._pool_lock_key(origin), True, UPLOAD_URL_POOL_FILL_LOCK_SECONDS
+        )
+
+    def unlock_pool(self, origin: str) -> None:
+        caches["lti_apps"].delete(self._pool_lock_key(origin))
+
+    @staticmethod
+    def _pool_lock_key(origin: str) -> str:
+        return f"mux:upload-pool:{origin}:fill"
+
+    def filter_uploading(self):
+        """
+        Limit selection to the urls whose file is being uploaded: the upload is
+        incomplete and progress was reported recently. Incomplete uploads without
+        recent progress are stalled.
+        """
+        return self.filter(
+            progress_at__gte=now() - timedelta(seconds=UPLOAD_PROGRESS_TIMEOUT_SECONDS),
+            bytes_confirmed__lt=models.F("bytes_total"),
+        )
+
+    def record_progress(
+        self, mux_id: str, bytes_confirmed: int, bytes_total: int, chunk_size: int
+    ) -> bool:
+        """
+        Store the progress of an upload, with a single update query. Progress
+        never goes backwards, and it is only recorded for waiting urls that are
+        assigned to an LTI context.
+
+        Return False if progress was not recorded, for instance because a
+        different file is being uploaded.
+        """
+        if not 0 <= bytes_confirmed <= bytes_total or chunk_size <= 0:
+            raise ValueError("Invalid upload progress")
+        updated = (
+            self.filter(
+                mux_id=mux_id,
+                status=UploadUrl.Statuses.WAITING.value,
+                lti_context__isnull=False,
+            )
+            .filter(
+                models.Q(bytes_total__isnull=True)
+                | models.Q(
+                    bytes_total=bytes_total, bytes_confirmed__lte=bytes_confirmed
+                )
+            )
+            .update(
+                bytes_confirmed=bytes_confirmed,
+                bytes_total=bytes_total,
+                chunk_size=chunk_size,
+                progress_at=now(),
+            )
+        )
+        return updated > 0
+
+    def get_status(self, mux_id: str) -> t.Optional[str]:
+        """
+        Return the status of an upload url from the cache or, on cache miss,
+        from the database. Return None if the url does not exist.
+        """
+        status = caches["lti_apps"].get(UploadUrl.status_cache_key(mux_id))
+        if status is None:
+            status = self.filter(mux_id=mux_id).values_list("status", flat=True).first()
+            if status is not None:
+                UploadUrl.set_cached_statuses({mux_id: status})
+        return status
+
 
 class UploadUrl(models.Model):
     @enum.unique
@@ -167,7 +839,9 @@ class UploadUrl(models.Model):
     mux_id = models.CharField(
         verbose_name="Mux direct upload URL ID", max_length=255, unique=True
     )
-    lti_context = models.ForeignKey(LtiContext, models.CASCADE)
+    # Pooled urls, which were created in advance, are not assigned to any LTI
+    # context yet
+    lti_context = models.ForeignKey(LtiContext, models.CASCADE, null=True, blank=True)
     status = models.CharField(
         default=Statuses.WAITING.value,
         max_length=32,
@@ -175,4 +849,101 @@ class UploadUrl(models.Model):
         db_index=True,
     )
     created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    url = models.TextField(verbose_name="Mux direct upload URL", blank=True)
+    origin = models.CharField(max_length=255, blank=True)
+    playback_policy = models.CharField(max_length=32, blank=True)
+    # Upload progress, as reported by the browser, such that uploads can be
+    # resumed after a page reload. Chunks are uploaded in order, so the next
+    # chunk starts at `bytes_confirmed`.
+    bytes_total = models.BigIntegerField(null=True, blank=True)
+    bytes_confirmed = models.BigIntegerField(default=0)
+    chunk_size = models.PositiveIntegerField(null=True, blank=True)
+    progress_at = models.DateTimeField(null=True, blank=True)
     objects = UploadUrlManager()
+
+    class Meta:
+        indexes = [
+            # This index serves the checkout of pooled urls
+            models.Index(
+                fields=["origin", "playback_policy", "created_at"],
+                condition=models.Q(lti_context__isnull=True),
+                name="muxltiproducer_uploadurl_pool",
+            ),
+        ]
+
+    @staticmethod
+    def status_cache_key(mux_id: str) -> str:
+        return f"mux:upload:{mux_id}:status"
+
+    @staticmethod
+    def set_cached_statuses(statuses: t.Dict[str, str]) -> None:
+        """
+        Store upload url statuses, indexed by Mux direct upload ID, in the
+        cache, such that they can be polled without querying the database. This
+        must be called whenever statuses are modified.
+        """
+        caches["lti_apps"].set_many(
+            {
+                UploadUrl.status_cache_key(mux_id): status
+                for mux_id, status in statuses.items()
+            },
+            timeout=UPLOAD_STATUS_CACHE_TIMEOUT,
+        )
+
+
+class SyncCursor(models.Model):
+    """
+    Position of a synchronization process that pages through a Mux API list
+    endpoint, such that the next run can resume from there.
+    """
+
+    name = models.CharField(max_length=64, unique=True)
+    page = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class WebhookEvent(models.Model):
+    """
+    Webhook event received from Mux.
+
+    Events are stored as soon as they are received, and processed
+    asynchronously. Storing the event IDs makes it possible to ignore events
+    that are delivered more than once.
+    """
+
+    mux_id = models.CharField(verbose_name="Mux event ID", max_length=255, unique=True)
+    type = models.CharField(max_length=128)
+    data = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+
+class SubtitleFileManager(models.Manager):
+    def filter_expired(self):
+        """
+        Limit selection to files that are no longer needed by Mux.
+        """
+        return self.filter(created_at__lt=now() - timedelta(hours=1))
+
+
+class SubtitleFile(models.Model):
+    """
+    Subtitle file that was uploaded to the storage, such that Mux can download
+    it. Storing the file names makes it possible to clean up expired files
+    without listing the storage. Files are deleted as soon as the
+    corresponding track is ingested by Mux.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    asset = models.ForeignKey(
+        Asset,
+        models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="subtitle_files",
+    )
+    mux_track_id = models.CharField(
+        verbose_name="Mux track ID", max_length=255, blank=True, db_index=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    objects = SubtitleFileManager()
@@ -1,14 +1,24 @@
 import base64
 import hashlib
 import hmac
+import os
 import re
+import socket
+import threading
 import typing as t
-from time import time
+from collections import OrderedDict
+from functools import lru_cache
+from time import monotonic, sleep, time
 
 import jwt
+from cryptography.hazmat.primitives.asymmetric.rsa import RSAPrivateKey
+from cryptography.hazmat.primitives.serialization import load_pem_private_key
 import mux_python as mux
-from mux_python.exceptions import NotFoundException
+from mux_python.exceptions import ApiException, NotFoundException
 from django.conf import settings
+from urllib3.connection import HTTPConnection
+
+from .metrics import InstrumentedClient
 
 DIRECT_UPLOAD_VALIDITY_SECONDS = getattr(
     settings,
@@ -33,13 +43,9 @@ def create_direct_upload(origin: str = "*") -> t.Dict[str, t.Any]:
             ...
         }
     """
-    signed_playback_enabled = getattr(settings, "MUX_ENABLE_SIGNED_PLAYBACK", True)
-    playback_policy = (
-        mux.PlaybackPolicy.SIGNED
-        if signed_playback_enabled
-        else mux.PlaybackPolicy.PUBLIC
+    create_asset_request = mux.CreateAssetRequest(
+        playback_policy=[get_playback_policy()]
     )
-    create_asset_request = mux.CreateAssetRequest(playback_policy=[playback_policy])
     create_upload_request = mux.CreateUploadRequest(
         timeout=DIRECT_UPLOAD_VALIDITY_SECONDS,
         new_asset_settings=create_asset_request,
@@ -49,59 +55,312 @@ def create_direct_upload(origin: str = "*") -> t.Dict[str, t.Any]:
     return response.to_dict()["data"]
 
 
-def get_asset(mux_asset_id) -> t.Optional[t.Dict[str, t.Any]]:
+def get_playback_policy() -> str:
+    """
+    Return the playback policy of new assets: "signed" or "public".
+    """
+    signed_playback_enabled = getattr(settings, "MUX_ENABLE_SIGNED_PLAYBACK", True)
+    return (
+        mux.PlaybackPolicy.SIGNED
+        if signed_playback_enabled
+        else mux.PlaybackPolicy.PUBLIC
+    )
+
+
+def list_direct_uploads(page: int, limit: int = 100) -> t.List[t.Dict[str, t.Any]]:
+    """
+    Fetch a page of direct uploads, from the most recent ones. Pages start at 1.
+
+    See docs: https://docs.mux.com/api-reference/video#operation/list-direct-uploads
+    """
+    response = call_api(
+        get_uploads_client().list_direct_uploads, limit=limit, page=page
+    )
+    return response.to_dict()["data"]
+
+
+def get_direct_upload(
+    mux_id: str, limiter: t.Optional["RateLimiter"] = None
+) -> t.Dict[str, t.Any]:
+    """
+    Fetch a direct upload from the Mux API.
+
+    See docs: https://docs.mux.com/api-reference/video#operation/get-direct-upload
+    """
+    response = call_api(get_uploads_client().get_direct_upload, mux_id, limiter=limiter)
+    return response.to_dict()["data"]
+
+
+def get_asset(
+    mux_asset_id, limiter: t.Optional["RateLimiter"] = None
+) -> t.Optional[t.Dict[str, t.Any]]:
     """
     Fetch an asset from the Mux API.
 
-    Return None if the asset was not found.
+    Return None if the asset was not found. Calls are made with `call_api`,
+    throttled by the optional rate limiter.
 
     See docs: https://docs.mux.com/api-reference/video#operation/get-asset
     """
     try:
-        asset = get_assets_client().get_asset(mux_asset_id)
+        asset = call_api(get_assets_client().get_asset, mux_asset_id, limiter=limiter)
     except NotFoundException:
         return None
     return asset.data.to_dict()
 
 
+class RateLimiter:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are added at a constant `rate` per second, up to `burst` tokens.
+    Every call to `acquire` consumes a token, and blocks until one is available.
+    """
+
+    def __init__(self, rate: float, burst: t.Optional[float] = None) -> None:
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self._tokens = self.burst
+        self._updated_at = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                current_time = monotonic()
+                self._tokens = min(
+                    self.burst,
+                    self._tokens + (current_time - self._updated_at) * self.rate,
+                )
+                self._updated_at = current_time
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                delay = (1 - self._tokens) / self.rate
+            sleep(delay)
+
+
+@lru_cache(maxsize=None)
+def get_rate_limiter() -> RateLimiter:
+    """
+    Return the rate limiter shared by all the bulk calls to the Mux API from
+    the current process.
+    """
+    return RateLimiter(getattr(settings, "MUX_API_RATE_LIMIT", 5))
+
+
+def call_api(
+    func: t.Callable[..., t.Any],
+    *args: t.Any,
+    limiter: t.Optional[RateLimiter] = None,
+    **kwargs: t.Any,
+) -> t.Any:
+    """
+    Call a Mux API client method.
+
+    Calls are throttled by the optional rate limiter. Requests that are
+    rate-limited by Mux (HTTP 429) are retried at most MUX_API_MAX_RETRIES
+    times, after the delay indicated by the Retry-After header, or with an
+    exponential backoff.
+
+    See docs: https://docs.mux.com/api-reference#rate-limits
+    """
+    max_retries = getattr(settings, "MUX_API_MAX_RETRIES", 5)
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire()
+        try:
+            return func(*args, **kwargs)
+        except ApiException as e:
+            if e.status != 429 or attempt >= max_retries:
+                raise
+            sleep(_get_retry_delay(e, attempt))
+        attempt += 1
+
+
+def _get_retry_delay(e: ApiException, attempt: int) -> float:
+    retry_after = (e.headers or {}).get("Retry-After")
+    if retry_after is not None:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(0.5 * 2**attempt, 30)
+
+
 def get_assets_client() -> mux.AssetsApi:
-    return mux.AssetsApi(_get_client())
+    return t.cast(mux.AssetsApi, InstrumentedClient(mux.AssetsApi(_get_client())))
 
 
 def get_uploads_client() -> mux.DirectUploadsApi:
-    return mux.DirectUploadsApi(_get_client())
+    return t.cast(
+        mux.DirectUploadsApi, InstrumentedClient(mux.DirectUploadsApi(_get_client()))
+    )
 
 
 def get_url_signing_key_client() -> mux.URLSigningKeysApi:
-    return mux.URLSigningKeysApi(_get_client())
+    return t.cast(
+        mux.URLSigningKeysApi,
+        InstrumentedClient(mux.URLSigningKeysApi(_get_client())),
+    )
+
+
+def get_max_request_seconds() -> float:
+    """
+    Return the longest time that a request to the Mux API can wait before it
+    times out (see MUX_API_TIMEOUT_SECONDS).
+    """
+    timeout = getattr(settings, "MUX_API_TIMEOUT_SECONDS", (5, 30))
+    if isinstance(timeout, (int, float)):
+        # The same timeout applies to the connection and to the response
+        return 2 * timeout
+    return sum(timeout)
+
+
+class _ApiClient(mux.ApiClient):
+    """
+    API client with a default timeout for all requests.
+    """
+
+    def request(self, *args, _request_timeout=None, **kwargs):
+        if _request_timeout is None:
+            _request_timeout = getattr(settings, "MUX_API_TIMEOUT_SECONDS", (5, 30))
+        return super().request(*args, _request_timeout=_request_timeout, **kwargs)
+
+
+_client: t.Optional[mux.ApiClient] = None
+_client_lock = threading.Lock()
 
 
 def _get_client() -> mux.ApiClient:
+    """
+    Return the API client shared by all threads of the current process.
+
+    The client is created lazily. Sharing a single client means that the same
+    pool of HTTP connections is used for all API calls, such that connections
+    (and TLS sessions) to the Mux API are kept alive and reused.
+    """
+    global _client  # pylint: disable=global-statement
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def _create_client() -> mux.ApiClient:
     configuration = mux.Configuration(
-        username=settings.MUX_TOKEN_ID, password=settings.MUX_TOKEN_SECRET
+        host=getattr(settings, "MUX_API_HOST", None),
+        username=settings.MUX_TOKEN_ID,
+        password=settings.MUX_TOKEN_SECRET,
+    )
+    configuration.connection_pool_maxsize = getattr(
+        settings, "MUX_API_CONNECTION_POOL_SIZE", 10
     )
-    return mux.ApiClient(configuration)
+    if getattr(settings, "MUX_API_TCP_KEEPALIVE", True):
+        configuration.socket_options = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+    return _ApiClient(configuration)
 
 
-def sign_video_playback_url(public_url: str, playback_id: str) -> str:
-    return sign_url(
-        public_url,
+def reset_client() -> None:
+    """
+    Discard the shared API client. A new one will be created on next use.
+
+    This is automatically called in child processes after a fork (for instance:
+    huey or gunicorn workers), because connections must not be shared between
+    processes.
+    """
+    global _client, _client_lock  # pylint: disable=global-statement
+    _client = None
+    _client_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_client)
+
+
+def get_client_stats() -> t.Dict[str, int]:
+    """
+    Return connection reuse statistics for the shared API client.
+
+    Returns:
+
         {
-            "sub": playback_id,
-            "aud": "v",
-            "redundant_streams": True,
-        },
-    )
+            "requests": ...,    # number of HTTP requests
+            "connections": ..., # number of new connections (misses)
+            "reused": ...,      # number of requests on kept-alive connections (hits)
+        }
+    """
+    requests = connections = 0
+    if _client is not None:
+        pools = _client.rest_client.pool_manager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                requests += pool.num_requests
+                connections += pool.num_connections
+    return {
+        "requests": requests,
+        "connections": connections,
+        "reused": max(requests - connections, 0),
+    }
+
+
+def sign_video_playback_url(public_url: str, playback_id: str) -> str:
+    return _sign_playback_url(public_url, playback_id, "v", {"redundant_streams": True})
 
 
 def sign_poster_playback_url(public_url: str, playback_id: str) -> str:
-    return sign_url(
+    return _sign_playback_url(public_url, playback_id, "t")
+
+
+# Signed playback urls, indexed by (signing key ID, playback ID, audience).
+# Values are (url, signature time) tuples.
+_signed_urls: "OrderedDict[t.Tuple[str, str, str], t.Tuple[str, int]]" = OrderedDict()
+_signed_urls_lock = threading.Lock()
+
+
+def _sign_playback_url(
+    public_url: str,
+    playback_id: str,
+    aud: str,
+    params: t.Optional[t.Dict[str, t.Any]] = None,
+) -> str:
+    """
+    Return a signed playback url.
+
+    Signing urls is expensive, so signed urls are kept in memory and reused
+    until a fraction MUX_SIGNED_URL_REUSE_FRACTION of their validity has
+    elapsed. At most MUX_SIGNED_URL_CACHE_SIZE urls are kept.
+    """
+    validity_seconds = _get_signed_url_validity_seconds()
+    reuse_seconds = _get_signed_url_reuse_seconds()
+    cache_key = (settings.MUX_SIGNING_KEY_ID, playback_id, aud)
+    current_time = int(time())
+    with _signed_urls_lock:
+        cached = _signed_urls.get(cache_key)
+        if cached and current_time < cached[1] + reuse_seconds:
+            _signed_urls.move_to_end(cache_key)
+            return cached[0]
+
+    signed_url = sign_url(
         public_url,
         {
             "sub": playback_id,
-            "aud": "t",
+            "aud": aud,
+            "exp": current_time + validity_seconds,
+            **(params or {}),
         },
     )
+    with _signed_urls_lock:
+        _signed_urls[cache_key] = (signed_url, current_time)
+        _signed_urls.move_to_end(cache_key)
+        while len(_signed_urls) > getattr(settings, "MUX_SIGNED_URL_CACHE_SIZE", 10000):
+            _signed_urls.popitem(last=False)
+    return signed_url
 
 
 def sign_url(public_url: str, params: t.Dict[str, t.Any]) -> str:
@@ -114,21 +373,62 @@ def sign_url(public_url: str, params: t.Dict[str, t.Any]) -> str:
 
     https://docs.mux.com/guides/video/secure-video-playback
     """
-    validity_seconds = getattr(
-        settings,
-        "MUX_SIGNED_URL_EXPIRY_SECONDS",
-        7 * 24 * 60 * 60,
-    )
-    params.setdefault("exp", int(time()) + validity_seconds)
+    params.setdefault("exp", int(time()) + _get_signed_url_validity_seconds())
 
     signing_key_id = settings.MUX_SIGNING_KEY_ID
-    private_key_base64 = settings.MUX_SIGNING_PRIVATE_KEY
-    private_key = base64.b64decode(private_key_base64).decode()
+    private_key = _load_signing_key(signing_key_id, settings.MUX_SIGNING_PRIVATE_KEY)
     headers = {"kid": signing_key_id}
     token = jwt.encode(params, private_key, algorithm="RS256", headers=headers)
     return f"{public_url}?token={token}"
 
 
+def get_signing_epoch() -> t.Tuple[str, int]:
+    """
+    Return the current signing epoch, and the number of seconds until it ends.
+
+    The signed urls which are returned during an epoch remain valid until the
+    end of the next epoch, such that content which includes signed urls can be
+    cached until the end of the epoch.
+    """
+    # Signed urls are reused for up to `reuse_seconds`: they remain valid for at
+    # least `validity - reuse_seconds` after they are returned.
+    length = max(
+        int(_get_signed_url_validity_seconds() - _get_signed_url_reuse_seconds()) // 2,
+        1,
+    )
+    current_time = int(time())
+    signing_key_id = getattr(settings, "MUX_SIGNING_KEY_ID", "")
+    return f"{signing_key_id}:{current_time // length}", length - current_time % length
+
+
+def _get_signed_url_reuse_seconds() -> float:
+    return _get_signed_url_validity_seconds() * getattr(
+        settings, "MUX_SIGNED_URL_REUSE_FRACTION", 0.5
+    )
+
+
+def _get_signed_url_validity_seconds() -> int:
+    return getattr(
+        settings,
+        "MUX_SIGNED_URL_EXPIRY_SECONDS",
+        7 * 24 * 60 * 60,
+    )
+
+
+@lru_cache(maxsize=8)
+def _load_signing_key(
+    signing_key_id: str, private_key_base64: str  # pylint: disable=unused-argument
+) -> RSAPrivateKey:
+    """
+    Parse the base64-encoded PEM private key.
+
+    Parsed keys are cached by key ID, such that keys are parsed only once per
+    process, and key rotation is still possible.
+    """
+    private_key = base64.b64decode(private_key_base64)
+    return load_pem_private_key(private_key, password=None)  # type: ignore
+
+
 def verify_webhook_signature(sig: str, body: bytes):
     """
     Verify a webhook callback signature.
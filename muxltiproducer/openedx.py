@@ -1,7 +1,47 @@
 import re
 import typing as t
+from functools import lru_cache
 
 from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+COURSE_ID_REGEX = re.compile(
+    r"course-v1:(?P<organization>[^+]+)\+(?P<course>[^+]+)\+(?P<run>[^+]+)"
+)
+# Number of course IDs for which the access scope is memoized
+ACCESS_SCOPE_CACHE_SIZE = 4096
+
+
+class AccessScope(t.NamedTuple):
+    """
+    LTI contexts which are visible from a course. Empty organization, course and
+    run fields are not limited. The context ID is limited unless it is None,
+    even when it is empty.
+    """
+
+    context_id: t.Optional[str] = None
+    organization: str = ""
+    course: str = ""
+    run: str = ""
+
+    @property
+    def lookups(self) -> t.Dict[str, str]:
+        """
+        LtiContext field lookups that limit access to this scope.
+        """
+        lookups = {
+            field: value
+            for field, value in [
+                ("organization", self.organization),
+                ("course", self.course),
+                ("run", self.run),
+            ]
+            if value
+        }
+        if self.context_id is not None:
+            lookups["context_id"] = self.context_id
+        return lookups
 
 
 def course_pattern_match(course_id: str) -> t.Optional[t.Tuple[str]]:
@@ -9,18 +49,18 @@ def course_pattern_match(course_id: str) -> t.Optional[t.Tuple[str]]:
     Returns: org, course, run for given course ID. Return None if it does not
     correspond to an Open edX course ID pattern.
     """
-    match = re.match(
-        r"course-v1:(?P<organization>[^+]+)\+(?P<course>[^+]+)\+(?P<run>[^+]+)",
-        course_id,
-    )
+    match = COURSE_ID_REGEX.match(course_id)
     return match.groups() if match else None  # type: ignore
 
 
-def course_access_limit_regex(course_id: str) -> t.Optional[str]:
+def course_access_scope(course_id: str) -> t.Optional[AccessScope]:
     """
-    Return the regular expression to limit access to the people from the same org/course/run as the course_id.
-    Return None if there is no limit. If the course ID does not match the Open
-    edX course ID pattern, limit to assets in the same context ID, for safety.
+    Return the scope that limits access to the people from the same
+    org/course/run as the course_id. Return None if there is no limit. If the
+    course ID does not match the Open edX course ID pattern, limit to assets in
+    the same context ID, for safety.
+
+    Results are memoized: see `resolve_access_scope`.
     """
     access_limited_to = getattr(
         settings,
@@ -29,17 +69,37 @@ def course_access_limit_regex(course_id: str) -> t.Optional[str]:
     )
     if not access_limited_to:
         return None
+    return resolve_access_scope(course_id, access_limited_to)
+
+
+def course_access_limit_lookups(course_id: str) -> t.Optional[t.Dict[str, str]]:
+    """
+    Return the LtiContext field lookups of the access scope of the course_id
+    (see `course_access_scope`). Return None if there is no limit.
+    """
+    scope = course_access_scope(course_id)
+    return None if scope is None else scope.lookups
+
+
+@lru_cache(maxsize=ACCESS_SCOPE_CACHE_SIZE)
+def resolve_access_scope(course_id: str, access_limited_to: str) -> AccessScope:
     match = course_pattern_match(course_id)
     if not match:
-        return course_id
+        return AccessScope(context_id=course_id)
     org: str
     course: str
     run: str
     org, course, run = match  # type: ignore
     if access_limited_to == "ORGANIZATION":
-        return rf"^course-v1:{org}"
+        return AccessScope(organization=org)
     if access_limited_to == "COURSE":
-        return rf"^course-v1:{org}\+{course}"
+        return AccessScope(organization=org, course=course)
     if access_limited_to == "RUN":
-        return rf"^course-v1:{org}\+{course}\+{run}"
+        return AccessScope(organization=org, course=course, run=run)
     raise ValueError(f"Incorrect value for access limit setting: '{access_limited_to}'")
+
+
+@receiver(setting_changed)
+def on_setting_changed(setting: str, **_kwargs: t.Any) -> None:
+    if setting == "MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO":
+        resolve_access_scope.cache_clear()
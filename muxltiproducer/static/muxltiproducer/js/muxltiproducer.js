@@ -6,9 +6,8 @@ function activateNavTab(elementId) {
     }
 }
 
-(function (d) {
-    // Auto-load all videos
-    document.querySelectorAll('video').forEach(video => {
+function loadVideos(root) {
+    root.querySelectorAll('video').forEach(video => {
         videojs(video, { "fluid": true, "preload": "metadata" }).ready(function () {
             // https://www.npmjs.com/package/videojs-hotkeys
             this.hotkeys({
@@ -22,4 +21,9 @@ function activateNavTab(elementId) {
             })
         });
     })
+}
+
+(function (d) {
+    // Auto-load all videos
+    loadVideos(d);
 })(document);
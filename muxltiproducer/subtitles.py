@@ -1,41 +1,322 @@
+import codecs
 import logging
+import re
+import tempfile
 import typing as t
 import uuid
-from datetime import timedelta
 
+from django.conf import settings
+from django.core.files import File
 from django.core.files.storage import DefaultStorage
-from django.utils.timezone import now
+from django.db.models import QuerySet
 from storages.backends.s3boto3 import S3Boto3Storage
+from storages.utils import clean_name
+
+from . import models
 
 MEDIA_FOLDER = "mux/subtitles"
+MAX_SIZE = getattr(settings, "MUX_SUBTITLES_MAX_SIZE", 10 * 1024 * 1024)
+FALLBACK_ENCODING = getattr(settings, "MUX_SUBTITLES_FALLBACK_ENCODING", "cp1252")
+MAX_LINE_LENGTH = 1000
+MAX_CUE_LINES = 20
+# Maximum number of keys in an S3 DeleteObjects request
+DELETE_BATCH_SIZE = 1000
+# Files are no longer needed once their track has reached one of these statuses
+INGESTED_STATUSES = ("ready", "errored")
+# Converted files are kept in memory up to this size, then on disk
+SPOOL_MAX_SIZE = 1024 * 1024
+BOMS = [
+    (codecs.BOM_UTF8, "utf-8-sig"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
+]
+TIMING_REGEX = re.compile(
+    r"(?P<start>(?:\d+:)?\d{1,2}:\d{2}[,.]\d{3})\s+-->\s+"
+    r"(?P<end>(?:\d+:)?\d{1,2}:\d{2}[,.]\d{3})(?P<settings>\s.*)?$"
+)
 
 logger = logging.getLogger(__file__)
 
 
-def save(file: t.TextIO) -> None:
+class SubtitlesError(ValueError):
+    """
+    Raised when a subtitles file cannot be parsed.
     """
-    Save the file in the right media folder with a random name.
 
-    Return: url of the saved file (str)
+
+def save(file: File, asset: t.Optional[models.Asset] = None) -> models.SubtitleFile:
     """
-    storage = DefaultStorage()
-    filename = f"{MEDIA_FOLDER}/{uuid.uuid4()}"
-    storage.save(filename, file)
-    return storage.url(filename)
+    Convert the file to WebVTT and save it in the right media folder with a
+    random name.
+
+    The file is validated and converted before anything is written to the
+    storage: SubtitlesError is raised if the file is invalid. If the file cannot
+    be recorded in the database, it is deleted, such that it is not orphaned.
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as converted:
+        convert(file, converted)
+        converted.seek(0)
+        storage = DefaultStorage()
+        filename = storage.save(f"{MEDIA_FOLDER}/{uuid.uuid4()}.vtt", File(converted))
+    try:
+        return models.SubtitleFile.objects.create(name=filename, asset=asset)
+    except Exception:
+        storage.delete(filename)
+        raise
+
+
+def url(subtitle_file: models.SubtitleFile) -> str:
+    return DefaultStorage().url(subtitle_file.name)
+
+
+def convert(file: File, output: t.IO[bytes]) -> None:
+    """
+    Convert an SRT or WebVTT file to UTF-8-encoded WebVTT.
+
+    The file is processed chunk by chunk, so memory usage does not depend on the
+    file size. The encoding is detected from the byte order mark. Without byte
+    order mark, files are decoded as UTF-8 and then, if that fails, with the
+    MUX_SUBTITLES_FALLBACK_ENCODING.
+
+    Raise SubtitlesError if the file is too large (see MUX_SUBTITLES_MAX_SIZE)
+    or malformed.
+    """
+    if file.size is not None and file.size > MAX_SIZE:
+        raise SubtitlesError(f"File is larger than {MAX_SIZE} bytes")
+    file.seek(0)
+    head = file.read(3)
+    encodings = [encoding for bom, encoding in BOMS if head.startswith(bom)] or [
+        "utf-8",
+        FALLBACK_ENCODING,
+    ]
+    for encoding in encodings:
+        file.seek(0)
+        output.seek(0)
+        output.truncate()
+        try:
+            for line in to_webvtt(iter_lines(file.chunks(), encoding)):
+                output.write(line.encode())
+            return
+        except UnicodeDecodeError:
+            continue
+    raise SubtitlesError("Unknown file encoding")
 
 
-def delete_expired():
+def iter_lines(chunks: t.Iterable[bytes], encoding: str) -> t.Iterator[str]:
+    """
+    Decode chunks of bytes and return lines, without line endings.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    size = 0
+    pending = ""
+    for chunk in chunks:
+        size += len(chunk)
+        if size > MAX_SIZE:
+            raise SubtitlesError(f"File is larger than {MAX_SIZE} bytes")
+        pending += decoder.decode(chunk)
+        # Keep a trailing "\r": it may be followed by "\n" in the next chunk
+        complete, carriage_return, tail = pending.rpartition("\r")
+        if tail:
+            complete, carriage_return = pending, ""
+        lines = _split_lines(complete)
+        # The last line may be incomplete
+        pending = lines.pop() + carriage_return
+        if len(pending) > MAX_LINE_LENGTH:
+            raise SubtitlesError(f"Line is longer than {MAX_LINE_LENGTH} characters")
+        yield from lines
+    pending += decoder.decode(b"", final=True)
+    yield from _split_lines(pending)
+
+
+def _split_lines(text: str) -> t.List[str]:
+    return text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+
+
+def to_webvtt(lines: t.Iterable[str]) -> t.Iterator[str]:
+    """
+    Convert SRT or WebVTT lines to normalized WebVTT lines, with line endings.
+
+    Raise SubtitlesError for malformed cues.
+    """
+    blocks = iter_blocks(lines)
+    first_block = next(blocks, None)
+    if first_block is None:
+        raise SubtitlesError("File is empty")
+    is_webvtt = first_block[1][0].startswith("WEBVTT")
+    yield "WEBVTT\n"
+    if not is_webvtt:
+        # SRT files do not have a header
+        blocks = _chain([first_block], blocks)
+    cue_count = 0
+    for line_number, block in blocks:
+        if is_webvtt and block[0].startswith("NOTE"):
+            continue
+        if is_webvtt and block[0].startswith(("STYLE", "REGION")):
+            if cue_count:
+                raise SubtitlesError(
+                    f"Line {line_number}: style and region blocks must appear "
+                    "before cues"
+                )
+            yield "\n"
+            yield from (line + "\n" for line in block)
+            continue
+        yield "\n"
+        yield from _convert_cue(line_number, block, is_webvtt)
+        cue_count += 1
+    if not cue_count:
+        raise SubtitlesError("File does not contain any subtitles")
+
+
+def iter_blocks(lines: t.Iterable[str]) -> t.Iterator[t.Tuple[int, t.List[str]]]:
+    """
+    Group lines in blocks separated by blank lines.
+
+    Return (line number, lines) tuples.
+    """
+    block: t.List[str] = []
+    block_line_number = 0
+    for line_number, line in enumerate(lines, 1):
+        if len(line) > MAX_LINE_LENGTH:
+            raise SubtitlesError(
+                f"Line {line_number} is longer than {MAX_LINE_LENGTH} characters"
+            )
+        if not line.strip():
+            if block:
+                yield block_line_number, block
+                block = []
+            continue
+        if not block:
+            block_line_number = line_number
+        if len(block) >= MAX_CUE_LINES:
+            raise SubtitlesError(
+                f"Line {block_line_number}: cue is longer than {MAX_CUE_LINES} lines"
+            )
+        block.append(line)
+    if block:
+        yield block_line_number, block
+
+
+def _convert_cue(
+    line_number: int, block: t.List[str], is_webvtt: bool
+) -> t.Iterator[str]:
+    identifier = None
+    if "-->" not in block[0]:
+        identifier = block[0]
+        block = block[1:]
+        line_number += 1
+    match = TIMING_REGEX.match(block[0].strip()) if block else None
+    if not match:
+        raise SubtitlesError(f"Line {line_number}: invalid cue timing")
+    start = _parse_timestamp(match.group("start"))
+    end = _parse_timestamp(match.group("end"))
+    if end < start:
+        raise SubtitlesError(f"Line {line_number}: cue ends before it starts")
+    for text in block[1:]:
+        if "-->" in text:
+            raise SubtitlesError(f"Line {line_number}: invalid cue text")
+    if is_webvtt and identifier is not None:
+        yield identifier + "\n"
+    timing_settings = (match.group("settings") or "").rstrip() if is_webvtt else ""
+    yield f"{_format_timestamp(start)} --> {_format_timestamp(end)}{timing_settings}\n"
+    yield from (text + "\n" for text in block[1:])
+
+
+def _parse_timestamp(value: str) -> int:
+    """
+    Return the timestamp in milliseconds.
+    """
+    hms, milliseconds = value[:-4], value[-3:]
+    seconds = 0
+    for part in hms.split(":"):
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000 + int(milliseconds)
+
+
+def _format_timestamp(milliseconds: int) -> str:
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
+
+
+def _chain(*iterables: t.Iterable[t.Any]) -> t.Iterator[t.Any]:
+    for iterable in iterables:
+        yield from iterable
+
+
+def delete_expired() -> None:
     """
     Delete uploaded subtitle files older than one hour.
+
+    Files should normally be deleted as soon as they are ingested by Mux: this
+    is a fallback for files which were never ingested.
+    """
+    delete(models.SubtitleFile.objects.filter_expired())
+
+
+def delete_ingested(tracks: t.Iterable[t.Dict[str, t.Any]]) -> None:
+    """
+    Delete the files of the text tracks that were ingested by Mux, whether
+    successfully or not.
+    """
+    track_ids = [
+        track["id"]
+        for track in tracks
+        if track.get("type") == "text" and track.get("status") in INGESTED_STATUSES
+    ]
+    if track_ids:
+        delete(models.SubtitleFile.objects.filter(mux_track_id__in=track_ids))
+
+
+def delete(subtitle_files: QuerySet) -> None:
+    """
+    Delete files from the storage and from the database.
+
+    Files are found in the database, such that the storage does not have to be
+    listed. On S3, files are deleted in batches. Files that could not be deleted
+    are skipped, and will be deleted during the next run.
     """
     storage = DefaultStorage()
-    _folders, files = storage.listdir(MEDIA_FOLDER)
-    for filename in files:
-        path = f"{MEDIA_FOLDER}/{filename}"
+    failed_pks: t.List[int] = []
+    while True:
+        batch = list(
+            subtitle_files.exclude(pk__in=failed_pks)
+            .order_by("pk")
+            .values_list("pk", "name")[:DELETE_BATCH_SIZE]
+        )
+        if not batch:
+            break
+        names = [name for _pk, name in batch]
         if isinstance(storage, S3Boto3Storage):
-            created_at = storage.get_modified_time(path)
+            failed = _delete_s3_objects(storage, names)
         else:
-            created_at = storage.get_created_time(path)
-        if created_at < now() - timedelta(hours=1):
-            storage.delete(path)
-            logger.info("Deleted subtitle file: %s", path)
+            failed = set()
+            for name in names:
+                storage.delete(name)
+        deleted = [pk for pk, name in batch if name not in failed]
+        failed_pks.extend(pk for pk, name in batch if name in failed)
+        models.SubtitleFile.objects.filter(pk__in=deleted).delete()
+        logger.info("Deleted %d subtitle files", len(deleted))
+        if len(batch) < DELETE_BATCH_SIZE:
+            break
+
+
+def _delete_s3_objects(storage: S3Boto3Storage, names: t.List[str]) -> t.Set[str]:
+    """
+    Delete objects with a single request.
+
+    Return: names of the files that could not be deleted.
+    """
+    # pylint: disable=protected-access
+    keys = {storage._normalize_name(clean_name(name)): name for name in names}
+    response = storage.bucket.meta.client.delete_objects(
+        Bucket=storage.bucket_name,
+        Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+    )
+    failed = set()
+    for error in response.get("Errors", []):
+        logger.error(
+            "Could not delete subtitle file: %s (%s)", error["Key"], error["Message"]
+        )
+        failed.add(keys.get(error["Key"], error["Key"]))
+    return failed
@@ -1,87 +1,492 @@
 import logging
+import typing as t
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from time import perf_counter
 
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
 from huey import crontab
 from huey.contrib.djhuey import db_periodic_task, task
 
-from . import models, mux, subtitles
+from . import models, mux, subtitles, webhooks
 
 logger = logging.getLogger(__file__)
 
+DIRECT_UPLOADS_SYNC_CURSOR = "direct_uploads"
+DIRECT_UPLOADS_PAGE_SIZE = 100
+WEBHOOK_EVENTS_BATCH_SIZE = 100
+# Mux retries failed webhook deliveries for up to 24 hours
+WEBHOOK_EVENTS_RETENTION = timedelta(days=2)
+
 
 @db_periodic_task(crontab(minute=0, hour="*"))
-def synchronize() -> None:
+def synchronize(
+    mode: t.Optional[str] = None,
+    concurrency: t.Optional[int] = None,
+    rate: t.Optional[float] = None,
+) -> None:
     """
     Synchronize data with Mux.
 
     This hourly asynchronous task updates the upload urls stored locally with
     Mux: - Waiting urls for which an asset has been created are updated -
-    Expired urls are deleted - Upload urls which have been used are deleted
+    Expired urls are deleted - Upload urls which have been used are deleted -
+    Assets which are still being processed are updated - Pending webhook events
+    are processed and old ones are deleted - Ingested and expired subtitle files
+    are deleted
 
     In production, updating upload urls should be performed thanks to webhooks.
     In development this is more difficult. Thus, the 'mux_sync' management
     command should be run manually to update upload urls.
+
+    See `update_waiting_direct_uploads` for the meaning of the arguments.
     """
-    update_waiting_direct_uploads()
+    update_waiting_direct_uploads(mode=mode, concurrency=concurrency, rate=rate)
     delete_expired_direct_uploads()
+    update_unsettled_assets()
+    process_webhook_events.call_local()
+    delete_old_webhook_events()
+    delete_ingested_subtitle_files()
     subtitles.delete_expired()
 
 
-def update_waiting_direct_uploads() -> None:
+def update_waiting_direct_uploads(
+    mode: t.Optional[str] = None,
+    concurrency: t.Optional[int] = None,
+    rate: t.Optional[float] = None,
+) -> None:
     """
     Update direct upload status. When ready, create corresponding asset.
 
-    This function performs all tasks in a synchronous manner.
+    By default (mode="list"), direct uploads are listed from the Mux API (see
+    `list_waiting_direct_uploads`). With mode="poll", waiting direct uploads are
+    fetched one by one instead (see `poll_waiting_direct_uploads`). The default
+    mode is defined by the MUX_DIRECT_UPLOADS_SYNC_MODE setting.
 
     Note that this function should only be called from time to time. The "right"
     way to update upload urls is to receive web hook callbacks from Mux.
     """
-    upload_url_waiting = models.UploadUrl.objects.filter(
-        status=models.UploadUrl.Statuses.WAITING.value
+    mode = mode or getattr(settings, "MUX_DIRECT_UPLOADS_SYNC_MODE", "list")
+    if mode == "poll":
+        poll_waiting_direct_uploads(concurrency=concurrency, rate=rate)
+    elif mode == "list":
+        list_waiting_direct_uploads()
+    else:
+        raise ValueError(f"Incorrect direct uploads synchronization mode: '{mode}'")
+
+
+def poll_waiting_direct_uploads(
+    concurrency: t.Optional[int] = None, rate: t.Optional[float] = None
+) -> None:
+    """
+    Update waiting direct uploads by fetching them one by one.
+
+    Direct uploads are fetched concurrently by `concurrency` threads, with at
+    most `rate` requests per second. Requests that are rate-limited by Mux are
+    retried after some delay. Changes are then saved with a few bulk queries.
+    Defaults are defined by the MUX_DIRECT_UPLOADS_SYNC_CONCURRENCY and
+    MUX_API_RATE_LIMIT settings.
+    """
+    concurrency = concurrency or getattr(
+        settings, "MUX_DIRECT_UPLOADS_SYNC_CONCURRENCY", 4
+    )
+    if not rate:
+        rate = float(getattr(settings, "MUX_API_RATE_LIMIT", 5))
+    limiter = mux.RateLimiter(rate)
+    waiting = _get_waiting_upload_urls()
+    waiting_count = len(waiting)
+    durations: t.List[float] = []
+
+    def fetch(mux_id: str) -> t.Optional[t.Dict[str, t.Any]]:
+        start = perf_counter()
+        try:
+            return mux.get_direct_upload(mux_id, limiter=limiter)
+        except mux.ApiException as e:
+            logger.warning(
+                "Could not fetch direct upload: mux_id=%s status=%s", mux_id, e.status
+            )
+            return None
+        finally:
+            durations.append(perf_counter() - start)
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        uploads = [upload for upload in executor.map(fetch, list(waiting)) if upload]
+    elapsed = perf_counter() - start
+
+    upload_urls, assets = _match_direct_uploads(waiting, uploads)
+    with transaction.atomic():
+        _save_direct_uploads(upload_urls, assets)
+
+    durations.sort()
+    logger.info(
+        "Fetched %d/%d direct uploads in %.2fs (%.1f/s, concurrency=%d, rate=%.1f/s)"
+        ": latency p50=%.3fs p95=%.3fs p99=%.3fs; updated %d upload urls, "
+        "created %d assets",
+        len(uploads),
+        waiting_count,
+        elapsed,
+        waiting_count / elapsed if elapsed else 0,
+        concurrency,
+        rate,
+        _percentile(durations, 0.5),
+        _percentile(durations, 0.95),
+        _percentile(durations, 0.99),
+        len(upload_urls),
+        len(assets),
+    )
+
+
+def list_waiting_direct_uploads() -> None:
+    """
+    Update waiting direct uploads by paging through the list of direct uploads.
+
+    Direct uploads are listed from the most recent ones, and listing stops as
+    soon as all waiting uploads have been found, so the amount of work is
+    proportional to the number of uploads created since the oldest waiting
+    upload. Changes are saved with a few bulk queries.
+
+    At most MUX_DIRECT_UPLOADS_SYNC_MAX_PAGES pages are fetched per run. When
+    this limit is reached, the current page is stored such that the next run
+    resumes from there. Mux pages are offset-based and new uploads are
+    prepended to the list, so resuming may revisit some uploads, but it will
+    not miss any.
+    """
+    waiting = _get_waiting_upload_urls()
+    waiting_count = len(waiting)
+    cursor, _created = models.SyncCursor.objects.get_or_create(
+        name=DIRECT_UPLOADS_SYNC_CURSOR
     )
-    upload_url_count = upload_url_waiting.count()
+    max_pages = getattr(settings, "MUX_DIRECT_UPLOADS_SYNC_MAX_PAGES", 100)
+    first_page = page = cursor.page
+    is_complete = False
+    upload_urls: t.List[models.UploadUrl] = []
+    assets: t.List[models.Asset] = []
+    while waiting and page < first_page + max_pages:
+        uploads = mux.list_direct_uploads(page, limit=DIRECT_UPLOADS_PAGE_SIZE)
+        page_upload_urls, page_assets = _match_direct_uploads(waiting, uploads)
+        upload_urls += page_upload_urls
+        assets += page_assets
+        page += 1
+        if len(uploads) < DIRECT_UPLOADS_PAGE_SIZE:
+            is_complete = True
+            break
+    if not waiting:
+        is_complete = True
 
-    for upload_url in upload_url_waiting:
-        update_waiting_direct_upload.call_local(upload_url.mux_id)
+    with transaction.atomic():
+        _save_direct_uploads(upload_urls, assets)
+        cursor.page = 1 if is_complete else page
+        cursor.save()
 
     logger.info(
-        "Updated %d upload urls in the '%s' state",
-        upload_url_count,
+        "Listed %d pages of direct uploads: updated %d/%d upload urls in the '%s' "
+        "state, created %d assets",
+        page - first_page,
+        len(upload_urls),
+        waiting_count,
         models.UploadUrl.Statuses.WAITING.value,
+        len(assets),
     )
 
 
+def _get_waiting_upload_urls() -> t.Dict[str, models.UploadUrl]:
+    """
+    Return the waiting upload urls, indexed by Mux ID. Urls whose file is being
+    uploaded are skipped: their status will not change before the upload is
+    complete.
+    """
+    return {
+        upload_url.mux_id: upload_url
+        for upload_url in models.UploadUrl.objects.filter(
+            status=models.UploadUrl.Statuses.WAITING.value, lti_context__isnull=False
+        )
+        .exclude(pk__in=models.UploadUrl.objects.filter_uploading().values("pk"))
+        .only("id", "mux_id", "status", "lti_context_id")
+    }
+
+
+def _match_direct_uploads(
+    waiting: t.Dict[str, models.UploadUrl], uploads: t.Iterable[t.Dict[str, t.Any]]
+) -> t.Tuple[t.List[models.UploadUrl], t.List[models.Asset]]:
+    """
+    Match direct uploads from Mux with waiting upload urls. Matched upload urls
+    are removed from `waiting`.
+
+    Return the modified upload urls and the assets that need to be created. No
+    change is saved.
+    """
+    upload_urls = []
+    assets = []
+    for upload in uploads:
+        upload_url = waiting.pop(upload["id"], None)
+        if upload_url is None or upload["status"] == upload_url.status:
+            continue
+        upload_url.status = upload["status"]
+        upload_urls.append(upload_url)
+        if (
+            upload["status"] == models.UploadUrl.Statuses.CREATED.value
+            and upload_url.lti_context_id is not None
+        ):
+            assets.append(
+                models.Asset(
+                    mux_id=upload["asset_id"],
+                    lti_context_id=upload_url.lti_context_id,
+                )
+            )
+    return upload_urls, assets
+
+
+def _save_direct_uploads(
+    upload_urls: t.List[models.UploadUrl], assets: t.List[models.Asset]
+) -> None:
+    models.UploadUrl.objects.bulk_update(upload_urls, ["status"])
+    models.Asset.objects.bulk_create(assets, ignore_conflicts=True)
+    models.UploadUrl.set_cached_statuses(
+        {upload_url.mux_id: upload_url.status for upload_url in upload_urls}
+    )
+
+
+def _percentile(sorted_values: t.List[float], q: float) -> float:
+    if not sorted_values:
+        return 0
+    return sorted_values[min(int(len(sorted_values) * q), len(sorted_values) - 1)]
+
+
 @task()
-def update_waiting_direct_upload(mux_id: int) -> None:
+def update_waiting_direct_upload(mux_id: str) -> None:
     """
     Update a single direct upload url.
     """
     try:
         direct_upload = models.UploadUrl.objects.get(
-            mux_id=mux_id, status=models.UploadUrl.Statuses.WAITING.value
+            mux_id=mux_id,
+            status=models.UploadUrl.Statuses.WAITING.value,
+            lti_context__isnull=False,
         )
     except models.UploadUrl.DoesNotExist:
         return
 
-    mux_client = mux.get_uploads_client()
-    updated = mux_client.get_direct_upload(mux_id).data
+    updated = mux.get_direct_upload(mux_id)
 
-    if updated.status != models.UploadUrl.Statuses.CREATED.value:
+    if updated["status"] != models.UploadUrl.Statuses.CREATED.value:
         return
 
     # Create an asset, if necessary
     models.Asset.objects.get_or_create(
-        mux_id=updated.asset_id, lti_context=direct_upload.lti_context
+        mux_id=updated["asset_id"], lti_context=direct_upload.lti_context
     )
     direct_upload.status = models.UploadUrl.Statuses.CREATED.value
     direct_upload.save()
+    models.UploadUrl.set_cached_statuses({mux_id: direct_upload.status})
     logger.info(
         "Upload url updated: mux_id=%s status=%s asset_id=%s",
         direct_upload.mux_id,
         direct_upload.status,
-        updated.asset_id,
+        updated["asset_id"],
     )
 
 
+def update_unsettled_assets() -> None:
+    """
+    Update the local copy of assets which were never synchronized, or which are
+    still being processed by Mux.
+
+    Note that assets should normally be updated by web hook callbacks from Mux.
+    At most MUX_UNSETTLED_ASSETS_MAX_SYNC assets are updated by each run, most
+    recent first, such that a large backfill is spread over many runs.
+    """
+    max_assets = getattr(settings, "MUX_UNSETTLED_ASSETS_MAX_SYNC", 500)
+    assets = list(
+        models.Asset.objects.filter(
+            Q(mux_synced_at__isnull=True)
+            | Q(mux_status=models.Asset.Statuses.PREPARING.value)
+        ).order_by("-pk")[:max_assets]
+    )
+    failed = models.Asset.objects.sync_mux_data(assets, no_cache=True)
+    logger.info(
+        "Updated %d unsettled assets (%d failed)",
+        len(assets) - len(failed),
+        len(failed),
+    )
+
+
+def delete_ingested_subtitle_files() -> None:
+    """
+    Delete the subtitle files of the tracks which are no longer being ingested
+    by Mux.
+
+    Note that files should normally be deleted on web hook callbacks from Mux.
+    """
+    assets = list(
+        models.Asset.objects.filter(subtitle_files__mux_track_id__gt="").distinct()
+    )
+    if not assets:
+        return
+    models.Asset.objects.sync_mux_data(assets, no_cache=True)
+    pending_track_ids = [
+        track["id"]
+        for asset in assets
+        for track in asset.mux_text_tracks
+        if track.get("status") not in subtitles.INGESTED_STATUSES
+    ]
+    subtitles.delete(
+        models.SubtitleFile.objects.filter(
+            asset__in=assets, mux_track_id__gt=""
+        ).exclude(mux_track_id__in=pending_track_ids)
+    )
+
+
+@task()
+def replace_subtitles(
+    mux_id: str, subtitle_file_id: int, url: str, language_code: str
+) -> None:
+    """
+    Replace the subtitle tracks of an asset in the given language by a new
+    track created from the subtitle file url.
+
+    Existing tracks are deleted while the new track is created. The local copy
+    of the asset is refreshed once all calls are complete. Failed deletions do
+    not prevent the new track from being recorded, and the subtitle file is
+    only deleted if the new track could not be created. If the existing tracks
+    cannot be listed, they are kept.
+    """
+    client = mux.get_assets_client()
+    try:
+        data = mux.get_asset(mux_id) or {}
+    except mux.ApiException:
+        logger.exception("Could not list subtitle tracks: mux_id=%s", mux_id)
+        data = {}
+    old_track_ids = [
+        track["id"]
+        for track in data.get("tracks") or []
+        if track["type"] == "text" and track.get("language_code") == language_code
+    ]
+    with ThreadPoolExecutor(max_workers=len(old_track_ids) + 1) as executor:
+        deletions = {
+            track_id: executor.submit(
+                mux.call_api, client.delete_asset_track, mux_id, track_id
+            )
+            for track_id in old_track_ids
+        }
+        creation = executor.submit(
+            mux.call_api,
+            client.create_asset_track,
+            mux_id,
+            {
+                "url": url,
+                "type": "text",
+                "text_type": "subtitles",
+                "language_code": language_code,
+            },
+        )
+    for track_id, deletion in deletions.items():
+        try:
+            deletion.result()
+        except mux.NotFoundException:
+            pass
+        except mux.ApiException:
+            logger.exception(
+                "Could not delete subtitle track: mux_id=%s track_id=%s",
+                mux_id,
+                track_id,
+            )
+    track_id = None
+    try:
+        track_id = creation.result().data.id
+    except mux.ApiException:
+        logger.exception("Could not create subtitle track: mux_id=%s", mux_id)
+        subtitles.delete(models.SubtitleFile.objects.filter(pk=subtitle_file_id))
+    else:
+        # The file will be deleted as soon as the track is ingested
+        models.SubtitleFile.objects.filter(pk=subtitle_file_id).update(
+            mux_track_id=track_id
+        )
+
+    # Replace the pending track by the actual tracks
+    try:
+        models.Asset.objects.update_mux_data(mux_id, mux.get_asset(mux_id))
+    except mux.ApiException:
+        logger.exception("Could not refresh asset: mux_id=%s", mux_id)
+        _resolve_pending_text_tracks(mux_id, track_id)
+
+
+def _resolve_pending_text_tracks(mux_id: str, track_id: t.Optional[str]) -> None:
+    """
+    Patch the pending text tracks of the local copy of an asset, when the asset
+    cannot be refreshed: pending tracks get the ID of the created track, or they
+    are removed if the track could not be created.
+    """
+    asset = models.Asset.objects.filter(mux_id=mux_id).first()
+    if asset is None:
+        return
+    text_tracks = []
+    for track in asset.mux_text_tracks:
+        if track.get("id") is None:
+            if track_id is None:
+                continue
+            track = dict(track, id=track_id)
+        text_tracks.append(track)
+    asset.set_text_tracks(text_tracks)
+
+
+@task()
+def refresh_mux_asset(mux_id: str) -> None:
+    """
+    Refresh the cached and local properties of an asset from the Mux API.
+    """
+    models.Asset.objects.update_mux_data(mux_id, mux.get_asset(mux_id))
+
+
+@task()
+def process_webhook_events() -> None:
+    """
+    Process pending webhook events, in the order in which they were received.
+
+    Events are processed in batches of WEBHOOK_EVENTS_BATCH_SIZE. Concurrent
+    tasks skip the events that are being processed by other tasks. Events that
+    cannot be processed are logged and not retried.
+    """
+    while True:
+        with transaction.atomic():
+            events = list(
+                models.WebhookEvent.objects.filter(processed_at__isnull=True)
+                .select_for_update(skip_locked=True)
+                .order_by("id")[:WEBHOOK_EVENTS_BATCH_SIZE]
+            )
+            if not events:
+                return
+            for event in events:
+                try:
+                    with transaction.atomic():
+                        webhooks.process_event(event.type, event.data)
+                except Exception:  # pylint: disable=broad-except
+                    logger.exception(
+                        "Could not process webhook event: mux_id=%s type=%s",
+                        event.mux_id,
+                        event.type,
+                    )
+            models.WebhookEvent.objects.filter(
+                id__in=[event.id for event in events]
+            ).update(processed_at=now())
+        logger.info("Processed %d webhook events", len(events))
+        if len(events) < WEBHOOK_EVENTS_BATCH_SIZE:
+            return
+
+
+def delete_old_webhook_events() -> None:
+    """
+    Delete processed webhook events which are too old to be delivered again.
+    """
+    deleted, _deleted_by_model = models.WebhookEvent.objects.filter(
+        processed_at__lt=now() - WEBHOOK_EVENTS_RETENTION
+    ).delete()
+    logger.info("Deleted old webhook events: %d", deleted)
+
+
 def delete_expired_direct_uploads():
     """
     Delete upload urls which have passed their expiry date.
@@ -94,10 +499,107 @@ def delete_expired_direct_uploads():
     expired.delete()
 
 
+@db_periodic_task(crontab(minute="*/10"))
+def fill_upload_url_pools() -> None:
+    """
+    Top up the pools of upload urls of all the origins from which uploads were
+    recently started, such that uploads can start without waiting for the Mux
+    API.
+
+    Origins are found in the upload urls that are assigned to an LTI context
+    and not yet expired. Pooled urls which are too old to be checked out
+    expire like other urls (see `delete_expired_direct_uploads`).
+    """
+    origins = (
+        models.UploadUrl.objects.filter(lti_context__isnull=False)
+        .exclude(origin="")
+        .values_list("origin", flat=True)
+        .distinct()
+    )
+    for origin in origins:
+        # Pools that are being filled by another task are skipped
+        if models.UploadUrl.objects.lock_pool(origin):
+            fill_upload_url_pool.call_local(origin)
+
+
+@task()
+def fill_upload_url_pool(origin: str) -> None:
+    """
+    Top up the pool of upload urls of an origin, for the current playback
+    policy, up to MUX_UPLOAD_URL_POOL_SIZE urls.
+
+    The pool lock must be acquired by the caller (see
+    `UploadUrlManager.lock_pool`): it is released once the pool is filled.
+    """
+    try:
+        _fill_upload_url_pool(origin)
+    finally:
+        models.UploadUrl.objects.unlock_pool(origin)
+
+
+def _fill_upload_url_pool(origin: str) -> None:
+    playback_policy = mux.get_playback_policy()
+    missing = (
+        models.UPLOAD_URL_POOL_SIZE
+        - models.UploadUrl.objects.filter_pool(origin, playback_policy).count()
+    )
+    upload_urls = []
+    for _ in range(missing):
+        try:
+            direct_upload = mux.create_direct_upload(origin=origin)
+        except mux.ApiException as e:
+            logger.warning(
+                "Could not create direct upload: origin=%s status=%s", origin, e.status
+            )
+            break
+        upload_urls.append(
+            models.UploadUrl(
+                mux_id=direct_upload["id"],
+                url=direct_upload["url"],
+                origin=origin,
+                playback_policy=playback_policy,
+            )
+        )
+    models.UploadUrl.objects.bulk_create(upload_urls)
+    logger.info("Added %d upload urls to the pool: origin=%s", len(upload_urls), origin)
+
+
 @task()
 def delete_mux_asset(mux_id: str) -> None:
     """
     Delete asset from Mux.
+
+    Deprecated: assets are deleted by `delete_mux_assets`. This task is only
+    kept such that jobs which were queued before the upgrade are processed. It
+    will be removed in a future release.
+    """
+    delete_mux_assets.call_local([mux_id])
+
+
+@task()
+def delete_mux_assets(mux_ids: t.List[str]) -> None:
+    """
+    Delete many assets from Mux, with bounded concurrency and rate.
+
+    Concurrency and rate are defined by the MUX_ASSETS_DELETE_CONCURRENCY and
+    MUX_API_RATE_LIMIT settings.
     """
     client = mux.get_assets_client()
-    client.delete_asset(mux_id)
+    concurrency = getattr(settings, "MUX_ASSETS_DELETE_CONCURRENCY", 4)
+    limiter = mux.RateLimiter(getattr(settings, "MUX_API_RATE_LIMIT", 5))
+
+    def delete(mux_id: str) -> bool:
+        try:
+            mux.call_api(client.delete_asset, mux_id, limiter=limiter)
+        except mux.NotFoundException:
+            pass
+        except mux.ApiException as e:
+            logger.error(
+                "Could not delete asset: mux_id=%s status=%s", mux_id, e.status
+            )
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        deleted = sum(executor.map(delete, mux_ids))
+    logger.info("Deleted %d/%d assets from Mux", deleted, len(mux_ids))
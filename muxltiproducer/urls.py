@@ -14,6 +14,16 @@ urlpatterns = [
         views.edit_video,
         name="edit",
     ),
+    path(
+        "assets/<str:lti_session_id>",
+        views.list_assets,
+        name="assets",
+    ),
+    path(
+        "delete/<str:lti_session_id>",
+        views.delete_videos,
+        name="delete_many",
+    ),
     path(
         "delete/<str:lti_session_id>/<str:mux_id>",
         views.delete_video,
@@ -34,6 +44,16 @@ urlpatterns = [
         views.uploads,
         name="uploads",
     ),
+    path(
+        "upload-status/<str:token>",
+        views.upload_status,
+        name="upload_status",
+    ),
+    path(
+        "upload-progress/<str:token>",
+        views.upload_progress,
+        name="upload_progress",
+    ),
     path(
         "callback",
         views.callback,
@@ -1,11 +1,31 @@
+import asyncio
 import json
+import typing as t
+from datetime import date
+from time import monotonic
+from urllib.parse import urlencode
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.conf.global_settings import LANGUAGES
-from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.core import signing
+from django.core.cache import caches
+from django.http import (
+    Http404,
+    HttpRequest,
+    HttpResponse,
+    HttpResponseForbidden,
+    JsonResponse,
+)
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods, require_POST
+from django.views.decorators.http import (
+    require_GET,
+    require_http_methods,
+    require_POST,
+)
 from ltiproducer import ltiviews
 
 from . import models, mux
@@ -17,6 +37,13 @@ CAN_INSTRUCTORS_DELETE_ASSETS = getattr(
     "MUX_CAN_INSTRUCTORS_DELETE_ASSETS",
     True,
 )
+ASSETS_PAGE_SIZE = getattr(settings, "MUX_ASSETS_PAGE_SIZE", 20)
+UPLOAD_STATUS_TIMEOUT_SECONDS = getattr(
+    settings, "MUX_UPLOAD_STATUS_TIMEOUT_SECONDS", 25
+)
+UPLOAD_STATUS_POLL_SECONDS = 1
+UPLOAD_STATUS_SALT = "muxltiproducer.upload_status"
+UPLOAD_PROGRESS_SALT = "muxltiproducer.upload_progress"
 
 
 @ltiviews.view
@@ -35,40 +62,145 @@ def launch(request: ltiviews.HttpLtiRequest) -> HttpResponse:
     return render(
         request,
         "muxltiproducer/watch.html",
-        context={"asset": mux_asset},
+        context={
+            "asset": mux_asset,
+            "player_cache": mux_asset.get_player_cache() if mux_asset else None,
+        },
     )
 
 
 @ltiviews.view
 @ltiviews.instructor_required
 def edit_video(request: ltiviews.HttpLtiRequest) -> HttpResponse:
-    assets = models.Asset.objects.filter_visible(
-        request.lti_params.context_id
-    ).order_by("-pk")
+    """
+    Only the first page of assets is rendered. Next pages are loaded from the
+    `assets` view.
+    """
+    query = request.GET.get("q", "")
+    assets, before = models.Asset.objects.get_visible_page(
+        request.lti_params.context_id, query=query, size=ASSETS_PAGE_SIZE
+    )
 
     return render(
         request,
         "muxltiproducer/edit.html",
         context={
             "assets": assets,
+            "next_url": _get_assets_page_url(request, before, query),
+            "query": query,
             "can_delete_assets": CAN_INSTRUCTORS_DELETE_ASSETS,
             "languages": LANGUAGES,
         },
     )
 
 
+@ltiviews.view
+@ltiviews.instructor_required
+def list_assets(request: ltiviews.HttpLtiRequest) -> HttpResponse:
+    """
+    Return a page of visible assets, with their properties and rendered html.
+
+    The "before" and "q" querystring parameters are the pagination cursor and
+    search query: see `AssetManager.get_visible_page`.
+    """
+    try:
+        before = int(request.GET["before"]) if "before" in request.GET else None
+    except ValueError:
+        return HttpResponse("Invalid 'before' parameter", status=400)
+    query = request.GET.get("q", "")
+    page, next_before = models.Asset.objects.get_visible_page(
+        request.lti_params.context_id,
+        before=before,
+        query=query,
+        size=ASSETS_PAGE_SIZE,
+    )
+    return JsonResponse(
+        {
+            "assets": [
+                {
+                    "id": asset.mux_id,
+                    "status": asset.mux_status,
+                    "created_at": asset.mux_created_at,
+                    "playback_policy": asset.mux_playback_policy,
+                    "error_messages": asset.mux_errors,
+                    "subtitle_tracks": asset.mux_text_tracks,
+                    "html": render_to_string(
+                        "muxltiproducer/_instructor_asset.html",
+                        context={
+                            "asset": asset,
+                            "can_delete_assets": CAN_INSTRUCTORS_DELETE_ASSETS,
+                            "languages": LANGUAGES,
+                        },
+                        request=request,
+                    ),
+                }
+                for asset in page
+            ],
+            "next_url": _get_assets_page_url(request, next_before, query),
+        }
+    )
+
+
+def _get_assets_page_url(
+    request: ltiviews.HttpLtiRequest, before: t.Optional[int], query: str
+) -> t.Optional[str]:
+    if before is None:
+        return None
+    url = reverse("mux:assets", kwargs={"lti_session_id": request.lti_session_id})
+    return f"{url}?{urlencode({'before': before, 'q': query})}"
+
+
 @ltiviews.view
 @ltiviews.instructor_required
 @require_POST
 def delete_video(request: ltiviews.HttpLtiRequest, mux_id: str) -> HttpResponse:
     if not CAN_INSTRUCTORS_DELETE_ASSETS:
         return HttpResponseForbidden("Asset deletion is not allowed")
-    mux_assets = models.Asset.objects.filter_visible(
-        request.lti_params.context_id
-    ).filter(mux_id=mux_id)
-    for mux_asset in mux_assets:
-        tasks.delete_mux_asset(mux_asset.mux_id)
-    mux_assets.delete()
+    models.Asset.objects.bulk_delete(
+        models.Asset.objects.filter_visible(request.lti_params.context_id).filter(
+            mux_id=mux_id
+        )
+    )
+    return redirect("mux:edit", lti_session_id=request.lti_session_id)
+
+
+@ltiviews.view
+@ltiviews.instructor_required
+@require_POST
+def delete_videos(request: ltiviews.HttpLtiRequest) -> HttpResponse:
+    """
+    Delete many videos at once.
+
+    Videos are selected by Mux asset ID, with the "mux_id" form field (which
+    can be repeated), or by upload date, with the "created_before" form field
+    (YYYY-MM-DD). Only the videos uploaded from the current LTI context are
+    deleted by upload date: other deletions by date are done with the
+    "mux_delete_assets" command.
+    """
+    if not CAN_INSTRUCTORS_DELETE_ASSETS:
+        return HttpResponseForbidden("Asset deletion is not allowed")
+    mux_ids = request.POST.getlist("mux_id")
+    created_before = request.POST.get("created_before")
+    if not mux_ids and not created_before:
+        return HttpResponse("Missing 'mux_id' or 'created_before' field", status=400)
+    if mux_ids and created_before:
+        return HttpResponse(
+            "Fields 'mux_id' and 'created_before' cannot be used together", status=400
+        )
+    if mux_ids:
+        mux_assets = models.Asset.objects.filter_visible(
+            request.lti_params.context_id
+        ).filter(mux_id__in=mux_ids)
+    else:
+        try:
+            created_before_date = date.fromisoformat(created_before)
+        except ValueError:
+            return HttpResponse("Invalid 'created_before' field", status=400)
+        mux_assets = models.Asset.objects.filter(
+            lti_context__context_id=request.lti_params.context_id,
+            mux_created_at__date__lt=created_before_date,
+        )
+    models.Asset.objects.bulk_delete(mux_assets)
     return redirect("mux:edit", lti_session_id=request.lti_session_id)
 
 
@@ -79,6 +211,9 @@ def subtitles(request: ltiviews.HttpLtiRequest, mux_id: str) -> HttpResponse:
     """
     Upload subtitle file to Mux.
 
+    The file is validated and stored right away, while the asset track is
+    created in the background.
+
     https://docs.mux.com/api-reference/video#operation/create-asset-track
     """
     try:
@@ -93,34 +228,42 @@ def subtitles(request: ltiviews.HttpLtiRequest, mux_id: str) -> HttpResponse:
     if not subtitles_file:
         return HttpResponse("Missing file", status=400)
 
-    # Save the subtitles file
-    subtitles_file_url = mux_subtitles.save(subtitles_file)
+    # Validate, convert and save the subtitles file
+    try:
+        subtitle_file = mux_subtitles.save(subtitles_file, asset=asset)
+    except mux_subtitles.SubtitlesError as e:
+        return HttpResponse(f"Invalid subtitles file: {e}", status=400)
 
-    # Delete subtitles with the same language code
+    # Subtitles with the same language code are replaced
     # Note: do we really want to do that? Should we send a warning to the
     # end-user? Should we instead create a new track with a different name?
     language_code = request.POST.get("language", settings.LANGUAGE_CODE)
-    mux_assets_client = mux.get_assets_client()
-    # Update asset cache to fetch latest changes
-    asset.mux_properties.update()
-    for subtitle_track in asset.mux_properties.subtitle_tracks:
-        if subtitle_track["language_code"] == language_code:
-            mux_assets_client.delete_asset_track(mux_id, subtitle_track["id"])
-
-    # Create new asset track
-    mux_assets_client.create_asset_track(
+    # Mux API calls are performed in the background: display a pending track
+    # in the meantime
+    asset.set_text_tracks(
+        [
+            track
+            for track in asset.mux_text_tracks
+            if track.get("language_code") != language_code
+        ]
+        + [
+            {
+                "id": None,
+                "type": "text",
+                "text_type": "subtitles",
+                "name": None,
+                "language_code": language_code,
+                "status": "preparing",
+            }
+        ]
+    )
+    tasks.replace_subtitles(
         mux_id,
-        {
-            "url": request.build_absolute_uri(subtitles_file_url),
-            "type": "text",
-            "text_type": "subtitles",
-            "language_code": language_code,
-        },
+        subtitle_file.id,
+        request.build_absolute_uri(mux_subtitles.url(subtitle_file)),
+        language_code,
     )
 
-    # Update asset cache one more time to reflect changes in the frontend
-    asset.mux_properties.update()
-
     return redirect("mux:edit", lti_session_id=request.lti_session_id)
 
 
@@ -130,18 +273,19 @@ def subtitles(request: ltiviews.HttpLtiRequest, mux_id: str) -> HttpResponse:
 def delete_subtitles(
     request: ltiviews.HttpLtiRequest, mux_id: str, track_id: str
 ) -> HttpResponse:
-    try:
-        asset = models.Asset.objects.filter_visible(request.lti_params.context_id).get(
-            mux_id=mux_id
-        )
-    except models.Asset.DoesNotExist as e:
-        raise Http404 from e
+    asset = get_object_or_404(
+        models.Asset.objects.filter_visible(request.lti_params.context_id),
+        mux_id=mux_id,
+    )
     mux_assets_client = mux.get_assets_client()
     try:
         mux_assets_client.delete_asset_track(mux_id, track_id)
     except mux.NotFoundException:
         pass
-    asset.mux_properties.update()
+    # Patch the local copy, such that the deleted track is no longer displayed
+    asset.set_text_tracks(
+        [track for track in asset.mux_text_tracks if track.get("id") != track_id]
+    )
     return redirect("mux:edit", lti_session_id=request.lti_session_id)
 
 
@@ -153,32 +297,141 @@ def uploads(request: ltiviews.HttpLtiRequest) -> HttpResponse:
     Generate a URL for direct upload of assets.
     """
     if request.method == "GET":
-        mux_id = request.GET.get("id")
-        lti_context = get_object_or_404(
-            models.LtiContext.objects, context_id=request.lti_params.context_id
-        )
         direct_upload = get_object_or_404(
-            models.UploadUrl,
-            mux_id=mux_id,
-            lti_context=lti_context,
+            models.UploadUrl.objects.filter_context(request.lti_params.context_id).only(
+                "mux_id", "status"
+            ),
+            mux_id=request.GET.get("id"),
         )
         return JsonResponse(
             {"id": direct_upload.mux_id, "status": direct_upload.status}
         )
 
-    # Create url on POST
+    # Check out a pooled url on POST, or create one if the pool is empty. The
+    # pool is topped up in the background when it runs low.
     scheme = "https" if request.is_secure() else "http"
-    direct_upload_data = mux.create_direct_upload(
-        origin=f"{scheme}://{request.META['HTTP_HOST']}"
-    )
+    origin = f"{scheme}://{request.META['HTTP_HOST']}"
+    playback_policy = mux.get_playback_policy()
     lti_context, _created = models.LtiContext.objects.get_or_create(
         context_id=request.lti_params.context_id
     )
-    models.UploadUrl.objects.create(
-        mux_id=direct_upload_data["id"], lti_context=lti_context
+    upload_url = models.UploadUrl.objects.checkout(lti_context, origin, playback_policy)
+    if upload_url is None:
+        direct_upload_data = mux.create_direct_upload(origin=origin)
+        upload_url = models.UploadUrl.objects.create(
+            mux_id=direct_upload_data["id"],
+            url=direct_upload_data["url"],
+            origin=origin,
+            playback_policy=playback_policy,
+            lti_context=lti_context,
+        )
+    models.UploadUrl.objects.fill_pool_if_needed(origin, playback_policy)
+    models.UploadUrl.set_cached_statuses({upload_url.mux_id: upload_url.status})
+    return JsonResponse(
+        {
+            "url": upload_url.url,
+            "id": upload_url.mux_id,
+            "status_url": reverse(
+                "mux:upload_status",
+                kwargs={
+                    "token": signing.dumps(upload_url.mux_id, salt=UPLOAD_STATUS_SALT)
+                },
+            ),
+            "progress_url": reverse(
+                "mux:upload_progress",
+                kwargs={
+                    "token": signing.dumps(upload_url.mux_id, salt=UPLOAD_PROGRESS_SALT)
+                },
+            ),
+        }
+    )
+
+
+@require_GET
+async def upload_status(request: HttpRequest, token: str) -> HttpResponse:
+    """
+    Return the status of a direct upload url.
+
+    This view is polled after an upload, so it is kept lightweight: it does not
+    require an LTI session, because the upload url is identified by a signed
+    token (see `uploads`), and statuses are read from the cache.
+
+    With the "status" querystring parameter, which is the last known status,
+    the response is delayed until the status changes, for at most
+    MUX_UPLOAD_STATUS_TIMEOUT_SECONDS (long polling). Waiting does not block a
+    thread when the app is served with ASGI.
+    """
+    try:
+        mux_id = signing.loads(
+            token,
+            salt=UPLOAD_STATUS_SALT,
+            max_age=models.UPLOAD_STATUS_CACHE_TIMEOUT,
+        )
+    except signing.BadSignature:
+        return HttpResponseForbidden("Invalid token")
+    known_status = request.GET.get("status")
+    deadline = monotonic() + UPLOAD_STATUS_TIMEOUT_SECONDS
+    cache = caches["lti_apps"]
+    while True:
+        status = await cache.aget(models.UploadUrl.status_cache_key(mux_id))
+        if status is None:
+            status = await sync_to_async(models.UploadUrl.objects.get_status)(mux_id)
+            if status is None:
+                raise Http404
+        if status != known_status or monotonic() >= deadline:
+            return JsonResponse({"id": mux_id, "status": status})
+        await asyncio.sleep(UPLOAD_STATUS_POLL_SECONDS)
+
+
+@csrf_exempt
+@require_http_methods(["GET", "POST"])
+def upload_progress(request: HttpRequest, token: str) -> HttpResponse:
+    """
+    Record or return the progress of a direct upload, such that the upload can
+    be resumed after a page reload.
+
+    Like `upload_status`, this view does not require an LTI session: the upload
+    url is identified by a signed token (see `uploads`). The browser POSTs the
+    "bytes_confirmed", "bytes_total" and "chunk_size" fields after every
+    uploaded chunk. On GET, the upload checkpoint is returned.
+    """
+    try:
+        mux_id = signing.loads(
+            token,
+            salt=UPLOAD_PROGRESS_SALT,
+            max_age=models.UPLOAD_STATUS_CACHE_TIMEOUT,
+        )
+    except signing.BadSignature:
+        return HttpResponseForbidden("Invalid token")
+
+    if request.method == "POST":
+        try:
+            recorded = models.UploadUrl.objects.record_progress(
+                mux_id,
+                bytes_confirmed=int(request.POST["bytes_confirmed"]),
+                bytes_total=int(request.POST["bytes_total"]),
+                chunk_size=int(request.POST["chunk_size"]),
+            )
+        except (KeyError, ValueError):
+            return HttpResponse("Invalid upload progress", status=400)
+        if not recorded:
+            return HttpResponse("Upload cannot be resumed", status=409)
+        return HttpResponse(status=204)
+
+    upload_url = get_object_or_404(
+        models.UploadUrl.objects.filter(lti_context__isnull=False),
+        mux_id=mux_id,
     )
     return JsonResponse(
-        {"url": direct_upload_data["url"], "id": direct_upload_data["id"]}
+        {
+            "id": upload_url.mux_id,
+            "url": upload_url.url,
+            "status": upload_url.status,
+            "bytes_total": upload_url.bytes_total,
+            "bytes_confirmed": upload_url.bytes_confirmed,
+            "chunk_size": upload_url.chunk_size,
+            "progress_at": upload_url.progress_at,
+        }
     )
 
 
@@ -188,6 +441,9 @@ def callback(request: ltiviews.HttpLtiRequest):
     """
     Callback webhook used by Mux to tell us about asset changes.
 
+    Events are stored and processed asynchronously. Events that were already
+    received are ignored.
+
     https://docs.mux.com/guides/video/listen-for-webhooks
     """
     signature = request.headers.get("Mux-Signature", "")
@@ -195,7 +451,10 @@ def callback(request: ltiviews.HttpLtiRequest):
         return HttpResponseForbidden("Invalid Signature")
 
     data = json.loads(request.body)
-    if data["type"] == "video.asset.ready":
-        tasks.update_waiting_direct_upload(data["data"]["upload_id"])
+    _event, created = models.WebhookEvent.objects.get_or_create(
+        mux_id=data["id"], defaults={"type": data["type"], "data": data["data"]}
+    )
+    if created:
+        tasks.process_webhook_events()
 
     return HttpResponse("")
@@ -0,0 +1,123 @@
+"""
+Processing of the webhook events sent by Mux.
+
+Webhook payloads include the full object that was modified, so events are
+processed without querying the Mux API.
+
+https://docs.mux.com/guides/video/listen-for-webhooks
+"""
+import logging
+import typing as t
+
+from . import models, subtitles
+
+logger = logging.getLogger(__file__)
+
+
+def process_event(event_type: str, data: t.Dict[str, t.Any]) -> None:
+    handler = HANDLERS.get(event_type)
+    if handler:
+        handler(data)
+    else:
+        logger.debug("Ignoring webhook event: type=%s", event_type)
+
+
+def on_asset_updated(data: t.Dict[str, t.Any]) -> None:
+    if data.get("upload_id"):
+        create_asset_from_upload(data["upload_id"], data["id"])
+    models.Asset.objects.update_mux_data(data["id"], data)
+    subtitles.delete_ingested(data.get("tracks") or [])
+
+
+def on_asset_deleted(data: t.Dict[str, t.Any]) -> None:
+    models.Asset.objects.update_mux_data(data["id"], None)
+
+
+def on_upload_asset_created(data: t.Dict[str, t.Any]) -> None:
+    create_asset_from_upload(data["id"], data["asset_id"])
+
+
+def on_upload_updated(data: t.Dict[str, t.Any]) -> None:
+    if models.UploadUrl.objects.filter(mux_id=data["id"]).update(status=data["status"]):
+        models.UploadUrl.set_cached_statuses({data["id"]: data["status"]})
+
+
+def on_track_updated(data: t.Dict[str, t.Any]) -> None:
+    update_text_track(data)
+    subtitles.delete_ingested([data])
+
+
+def on_track_deleted(data: t.Dict[str, t.Any]) -> None:
+    update_text_track(data, deleted=True)
+
+
+def create_asset_from_upload(upload_id: str, asset_id: str) -> None:
+    """
+    Create the asset corresponding to a direct upload, if necessary, and mark
+    the upload url as used.
+    """
+    upload_url = (
+        models.UploadUrl.objects.filter(mux_id=upload_id, lti_context__isnull=False)
+        .only("id", "status", "lti_context_id")
+        .first()
+    )
+    if upload_url is None or upload_url.lti_context_id is None:
+        return
+    models.Asset.objects.bulk_create(
+        [models.Asset(mux_id=asset_id, lti_context_id=upload_url.lti_context_id)],
+        ignore_conflicts=True,
+    )
+    if upload_url.status != models.UploadUrl.Statuses.CREATED.value:
+        upload_url.status = models.UploadUrl.Statuses.CREATED.value
+        upload_url.save(update_fields=["status"])
+        models.UploadUrl.set_cached_statuses({upload_id: upload_url.status})
+        logger.info(
+            "Upload url updated: mux_id=%s status=%s asset_id=%s",
+            upload_id,
+            upload_url.status,
+            asset_id,
+        )
+
+
+def update_text_track(track: t.Dict[str, t.Any], deleted: bool = False) -> None:
+    """
+    Patch the local copy of the asset properties with the track data.
+
+    Pending tracks (without ID) which were created locally for the same language
+    are replaced by the new track.
+    """
+    if track.get("type") != "text":
+        return
+    asset = models.Asset.objects.filter(mux_id=track["asset_id"]).first()
+    if asset is None or asset.mux_synced_at is None:
+        # Properties will be loaded from Mux on first access
+        return
+    text_tracks = [
+        text_track
+        for text_track in asset.mux_text_tracks
+        if text_track["id"] != track["id"]
+        and (
+            deleted
+            or text_track["id"] is not None
+            or text_track.get("language_code") != track.get("language_code")
+        )
+    ]
+    if not deleted:
+        text_tracks.append({key: track.get(key) for key in asset.MUX_TRACK_KEYS})
+    asset.set_text_tracks(text_tracks)
+
+
+HANDLERS: t.Dict[str, t.Callable[[t.Dict[str, t.Any]], None]] = {
+    "video.asset.created": on_asset_updated,
+    "video.asset.ready": on_asset_updated,
+    "video.asset.updated": on_asset_updated,
+    "video.asset.errored": on_asset_updated,
+    "video.asset.deleted": on_asset_deleted,
+    "video.upload.asset_created": on_upload_asset_created,
+    "video.upload.cancelled": on_upload_updated,
+    "video.upload.errored": on_upload_updated,
+    "video.asset.track.created": on_track_updated,
+    "video.asset.track.ready": on_track_updated,
+    "video.asset.track.errored": on_track_updated,
+    "video.asset.track.deleted": on_track_deleted,
+}
@@ -38,8 +38,27 @@ TEMPLATES = [
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+STATIC_URL = "/static/"
+
+ROOT_URLCONF = "tests.urls"
+
 MUX_TOKEN_ID = "dummy"
 MUX_TOKEN_SECRET = "dummy"
 MUX_SIGNING_KEY_ID = "dummy"
 MUX_SIGNING_PRIVATE_KEY = "dummy"
 MUX_WEBHOOK_SIGNING_SECRET = "dummy"
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "lti_apps": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "lti_apps",
+    },
+}
+
+HUEY = {
+    "huey_class": "huey.MemoryHuey",
+    "immediate": True,
+}
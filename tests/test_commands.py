@@ -0,0 +1,63 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from muxltiproducer import models, mux
+
+
+class DeleteAssetsCommandTests(TestCase):
+    def setUp(self) -> None:
+        lti_context1 = models.LtiContext.objects.create(context_id="context1")
+        lti_context2 = models.LtiContext.objects.create(context_id="context2")
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context1)
+        models.Asset.objects.create(mux_id="2", lti_context=lti_context1)
+        models.Asset.objects.create(mux_id="3", lti_context=lti_context2)
+
+    def test_dry_run(self) -> None:
+        stdout = StringIO()
+        call_command(
+            "mux_delete_assets", context=["context1"], dry_run=True, stdout=stdout
+        )
+        self.assertIn("2 assets would be deleted", stdout.getvalue())
+        self.assertEqual(3, models.Asset.objects.count())
+
+    @mock.patch.object(mux, "get_assets_client")
+    def test_delete_by_context(self, get_assets_client) -> None:
+        call_command("mux_delete_assets", context=["context1"], stdout=StringIO())
+        self.assertEqual(["3"], [asset.mux_id for asset in models.Asset.objects.all()])
+        self.assertEqual(2, get_assets_client.return_value.delete_asset.call_count)
+
+
+class ReparentAssetsCommandTests(TestCase):
+    def test_reparent(self) -> None:
+        source = models.LtiContext.objects.create(context_id="course-v1:org+c+run1")
+        for mux_id in ["1", "2", "3"]:
+            models.Asset.objects.create(mux_id=mux_id, lti_context=source)
+
+        stdout = StringIO()
+        call_command(
+            "mux_reparent_assets",
+            source.context_id,
+            "course-v1:org+c+run2",
+            "--dry-run",
+            stdout=stdout,
+        )
+        self.assertIn("3 assets would be moved", stdout.getvalue())
+        self.assertFalse(
+            models.LtiContext.objects.filter(context_id="course-v1:org+c+run2").exists()
+        )
+
+        stdout = StringIO()
+        call_command(
+            "mux_reparent_assets",
+            source.context_id,
+            "course-v1:org+c+run2",
+            "--batch-size=2",
+            stdout=stdout,
+        )
+        self.assertEqual("Moved 2/3 assets\nMoved 3/3 assets\n", stdout.getvalue())
+        target = models.LtiContext.objects.get(context_id="course-v1:org+c+run2")
+        self.assertEqual("run2", target.run)
+        self.assertEqual(3, target.asset_set.count())
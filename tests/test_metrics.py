@@ -0,0 +1,111 @@
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from muxltiproducer import metrics, models, mux
+
+
+class MetricsTests(TestCase):
+    def setUp(self) -> None:
+        metrics.reset()
+
+    def test_instrumented_client(self) -> None:
+        api = mock.Mock()
+        api.get_asset.return_value = "asset"
+        api.delete_asset.side_effect = mux.NotFoundException(status=404)
+        client = metrics.InstrumentedClient(api)
+
+        self.assertEqual("asset", client.get_asset("asset1"))
+        self.assertEqual("asset", client.get_asset("asset1"))
+        with self.assertRaises(mux.NotFoundException):
+            client.delete_asset("asset1")
+        snapshot = metrics.get_snapshot()
+
+        self.assertEqual(2, sum(snapshot.latency["get_asset"]))
+        self.assertEqual(1, sum(snapshot.latency["delete_asset"]))
+        self.assertEqual({("delete_asset", "NotFoundException"): 1}, snapshot.errors)
+        self.assertEqual(0.005, snapshot.latency_quantile("get_asset", 0.99))
+
+    def test_flush_from_many_processes(self) -> None:
+        processes = [metrics.Metrics(), metrics.Metrics()]
+        for process in processes:
+            process.observe_cache(hits=1)
+            process.flush()
+        processes[1].observe("get_asset", 0.1)
+        processes[1].flush()
+
+        self.assertEqual(
+            ["cache|hit", "latency_sum|get_asset", "latency|get_asset|4"],
+            metrics.get_names(),
+        )
+        self.assertEqual(2, metrics.get_snapshot().cache_hits)
+
+        # Counters are registered again after a reset
+        metrics.reset()
+        processes[0].observe_cache(hits=1)
+        processes[0].flush()
+        self.assertEqual(["cache|hit"], metrics.get_names())
+        self.assertEqual(1, metrics.get_snapshot().cache_hits)
+
+    @mock.patch.object(metrics.threading, "Thread")
+    def test_flush_in_background(self, thread_class) -> None:
+        process = metrics.Metrics()
+        process.flushed_at -= 3600
+        with mock.patch.object(process, "flush") as flush:
+            process.observe_cache(hits=1)
+            process.observe_cache(hits=1)
+            flush.assert_not_called()
+            thread_class.assert_called_once()
+            thread_class.call_args[1]["target"]()
+            flush.assert_called_once()
+
+    @mock.patch.object(mux, "get_asset")
+    def test_cache_hit_ratio(self, get_asset) -> None:
+        get_asset.return_value = {"id": "asset1", "status": "ready"}
+        models.MuxAssetProperties.delete_cached_data(["asset1", "asset2"])
+        models.MuxAssetProperties.load_data("asset1")
+        models.MuxAssetProperties.load_data("asset1")
+        models.MuxAssetProperties.load_data_many(["asset1", "asset2"])
+
+        snapshot = metrics.get_snapshot()
+        self.assertEqual(2, snapshot.cache_hits)
+        self.assertEqual(2, snapshot.cache_misses)
+        self.assertEqual(0.5, snapshot.cache_hit_ratio)
+
+    def test_exporters(self) -> None:
+        metrics.metrics.observe("get_asset", 0.2)
+        metrics.metrics.observe("get_asset", 0.3, error=ValueError())
+        metrics.metrics.observe_cache(hits=3, misses=1)
+
+        stdout = StringIO()
+        call_command("mux_metrics", format="prometheus", stdout=stdout)
+        prometheus = stdout.getvalue()
+        self.assertIn(
+            'mux_api_request_duration_seconds_bucket{operation="get_asset",le="0.25"} 1',
+            prometheus,
+        )
+        self.assertIn(
+            'mux_api_request_duration_seconds_bucket{operation="get_asset",le="+Inf"} 2',
+            prometheus,
+        )
+        self.assertIn(
+            'mux_api_request_duration_seconds_count{operation="get_asset"} 2',
+            prometheus,
+        )
+        self.assertIn(
+            'mux_api_errors_total{operation="get_asset",exception="ValueError"} 1',
+            prometheus,
+        )
+        self.assertIn('mux_asset_cache_lookups_total{result="hit"} 3', prometheus)
+
+        stdout = StringIO()
+        with self.assertLogs(metrics.logger, "INFO"):
+            call_command("mux_metrics", format="log", stdout=stdout)
+        self.assertIn('"operation": "get_asset", "calls": 2', stdout.getvalue())
+
+        stdout = StringIO()
+        call_command("mux_metrics", "--reset", stdout=stdout)
+        self.assertIn("hit ratio: 75.0%", stdout.getvalue())
+        self.assertEqual({}, metrics.get_snapshot().latency)
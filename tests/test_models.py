@@ -1,6 +1,15 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connection
+from django.template.loader import render_to_string
 from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 
-from muxltiproducer import models
+from muxltiproducer import models, mux, tasks
 
 
 class MuxLtiProducerTests(TestCase):
@@ -54,6 +63,442 @@ class MuxLtiProducerTests(TestCase):
             self.assertEqual(["2"], get_mux_asset_ids("dummy"))
         with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="RUN"):
             self.assertEqual(["2"], get_mux_asset_ids("dummy"))
+            # Empty course IDs do not give access to all assets
+            self.assertEqual([], get_mux_asset_ids(""))
+
+    def test_lti_context_course_fields(self) -> None:
+        lti_context1, _created = models.LtiContext.objects.get_or_create(
+            context_id="course-v1:org1+course1+run1"
+        )
+        lti_context2 = models.LtiContext.objects.create(context_id="dummy")
+        self.assertEqual(
+            ("org1", "course1", "run1"),
+            (lti_context1.organization, lti_context1.course, lti_context1.run),
+        )
+        self.assertEqual(
+            ("", "", ""),
+            (lti_context2.organization, lti_context2.course, lti_context2.run),
+        )
+
+    def test_filter_by_openedx_context_exact_match(self) -> None:
+        lti_context1 = models.LtiContext.objects.create(
+            context_id="course-v1:org1+course1+run1"
+        )
+        lti_context2 = models.LtiContext.objects.create(
+            context_id="course-v1:org10+course1+run1"
+        )
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context1)
+        models.Asset.objects.create(mux_id="2", lti_context=lti_context2)
+
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="ORGANIZATION"):
+            self.assertEqual(["1"], get_mux_asset_ids(lti_context1.context_id))
+
+    def test_get_visible_page(self) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        for mux_id in ["a1", "a2", "b3", "b4", "b5"]:
+            asset = models.Asset.objects.create(mux_id=mux_id, lti_context=lti_context)
+            asset.set_mux_data({"id": mux_id, "created_at": "1646396487"})
+            asset.save()
+
+        page, before = models.Asset.objects.get_visible_page("dummy", size=2)
+        self.assertEqual(["b5", "b4"], [asset.mux_id for asset in page])
+        page, before = models.Asset.objects.get_visible_page(
+            "dummy", before=before, size=2
+        )
+        self.assertEqual(["b3", "a2"], [asset.mux_id for asset in page])
+        page, before = models.Asset.objects.get_visible_page(
+            "dummy", before=before, size=2
+        )
+        self.assertEqual(["a1"], [asset.mux_id for asset in page])
+        self.assertIsNone(before)
+
+        page, before = models.Asset.objects.get_visible_page("dummy", query="a")
+        self.assertEqual(["a2", "a1"], [asset.mux_id for asset in page])
+        page, before = models.Asset.objects.get_visible_page(
+            "dummy", query="2022-03-04"
+        )
+        self.assertEqual(5, len(page))
+        page, before = models.Asset.objects.get_visible_page(
+            "dummy", query="2022-03-05"
+        )
+        self.assertEqual([], page)
+
+    @override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="ORGANIZATION")
+    def test_get_visible_page_queries(self) -> None:
+        lti_context = models.LtiContext.objects.create(
+            context_id="course-v1:org1+course1+run1"
+        )
+        for mux_id in range(30):
+            asset = models.Asset(mux_id=str(mux_id), lti_context=lti_context)
+            asset.set_mux_data(
+                {
+                    "id": str(mux_id),
+                    "status": "ready",
+                    "created_at": "1646396487",
+                    "playback_ids": [{"id": f"playback{mux_id}", "policy": "public"}],
+                }
+            )
+            asset.save()
+
+        # Synchronized assets are rendered without any additional query
+        with self.assertNumQueries(1):
+            page, _before = models.Asset.objects.get_visible_page(
+                lti_context.context_id, size=20
+            )
+            for asset in page:
+                properties = asset.mux_properties
+                assert properties is not None
+                self.assertIsNotNone(properties.video_url)
+                self.assertIsNotNone(asset.get_player_cache())
+        self.assertEqual(20, len(page))
+
+    def test_upload_url_filter_context(self) -> None:
+        lti_context1 = models.LtiContext.objects.create(context_id="context1")
+        lti_context2 = models.LtiContext.objects.create(context_id="context2")
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=lti_context1)
+
+        with self.assertNumQueries(1):
+            upload_url = models.UploadUrl.objects.filter_context("context1").get(
+                mux_id="upload1"
+            )
+        self.assertEqual(lti_context1.id, upload_url.lti_context_id)
+        self.assertFalse(
+            models.UploadUrl.objects.filter_context(lti_context2.context_id)
+            .filter(mux_id="upload1")
+            .exists()
+        )
+
+    def test_upload_url_status(self) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=lti_context)
+        caches["lti_apps"].clear()
+
+        # Cache miss: the status is loaded from the database and cached
+        with self.assertNumQueries(1):
+            self.assertEqual("waiting", models.UploadUrl.objects.get_status("upload1"))
+        with self.assertNumQueries(0):
+            self.assertEqual("waiting", models.UploadUrl.objects.get_status("upload1"))
+        models.UploadUrl.set_cached_statuses({"upload1": "asset_created"})
+        self.assertEqual(
+            "asset_created", models.UploadUrl.objects.get_status("upload1")
+        )
+        self.assertIsNone(models.UploadUrl.objects.get_status("upload2"))
+
+    def test_upload_url_pool_checkout(self) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        for mux_id, origin, playback_policy in [
+            ("upload1", "https://lms", "signed"),
+            ("upload2", "https://lms", "public"),
+            ("upload3", "https://other", "signed"),
+            ("expired", "https://lms", "signed"),
+        ]:
+            models.UploadUrl.objects.create(
+                mux_id=mux_id,
+                url=f"https://mux/{mux_id}",
+                origin=origin,
+                playback_policy=playback_policy,
+            )
+        models.UploadUrl.objects.filter(mux_id="expired").update(
+            created_at=now()
+            - timedelta(seconds=models.UPLOAD_URL_POOL_MAX_AGE_SECONDS + 1)
+        )
+
+        upload_url = models.UploadUrl.objects.checkout(
+            lti_context, "https://lms", "signed"
+        )
+        assert upload_url is not None
+        self.assertEqual("upload1", upload_url.mux_id)
+        self.assertEqual("https://mux/upload1", upload_url.url)
+        self.assertEqual(
+            lti_context.id,
+            models.UploadUrl.objects.get(mux_id="upload1").lti_context_id,
+        )
+        self.assertIsNone(
+            models.UploadUrl.objects.checkout(lti_context, "https://lms", "signed")
+        )
+
+    def test_upload_url_record_progress(self) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=lti_context)
+        models.UploadUrl.objects.create(mux_id="pooled")
+        record_progress = models.UploadUrl.objects.record_progress
+
+        with self.assertNumQueries(1):
+            self.assertTrue(record_progress("upload1", 100, 1000, 100))
+        self.assertTrue(record_progress("upload1", 200, 1000, 100))
+        # Progress does not go backwards, and the file does not change
+        self.assertFalse(record_progress("upload1", 100, 1000, 100))
+        self.assertFalse(record_progress("upload1", 300, 2000, 100))
+        self.assertFalse(record_progress("pooled", 100, 1000, 100))
+        self.assertFalse(record_progress("unknown", 100, 1000, 100))
+        self.assertRaises(ValueError, record_progress, "upload1", 2000, 1000, 100)
+        self.assertRaises(ValueError, record_progress, "upload1", 300, 1000, 0)
+
+        upload_url = models.UploadUrl.objects.get(mux_id="upload1")
+        self.assertEqual(200, upload_url.bytes_confirmed)
+        self.assertEqual(1000, upload_url.bytes_total)
+        self.assertEqual(100, upload_url.chunk_size)
+        self.assertEqual(
+            ["upload1"],
+            list(
+                models.UploadUrl.objects.filter_uploading().values_list(
+                    "mux_id", flat=True
+                )
+            ),
+        )
+
+        # Complete uploads and stalled uploads are not being uploaded
+        record_progress("upload1", 1000, 1000, 100)
+        self.assertFalse(models.UploadUrl.objects.filter_uploading().exists())
+        models.UploadUrl.objects.filter(mux_id="upload1").update(
+            bytes_confirmed=500,
+            progress_at=now()
+            - timedelta(seconds=models.UPLOAD_PROGRESS_TIMEOUT_SECONDS + 1),
+        )
+        self.assertFalse(models.UploadUrl.objects.filter_uploading().exists())
+
+    @mock.patch.object(mux, "get_asset")
+    def test_prefetch_mux_properties(self, get_asset) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        for mux_id in ["1", "2", "3"]:
+            models.Asset.objects.create(mux_id=mux_id, lti_context=lti_context)
+        cache = caches["lti_apps"]
+        cache.clear()
+        models.MuxAssetProperties.set_cached_data({"1": {"id": "1", "created_at": "1"}})
+        get_asset.side_effect = lambda mux_id, limiter=None: (
+            {"id": mux_id, "created_at": mux_id} if mux_id == "2" else None
+        )
+
+        assets = models.Asset.objects.prefetch_mux_properties(
+            models.Asset.objects.order_by("mux_id")
+        )
+
+        self.assertEqual(2, get_asset.call_count)
+        self.assertEqual(
+            [1, 2],
+            [
+                properties.created_at_timestamp
+                for properties in [assets[0].mux_properties, assets[1].mux_properties]
+                if properties is not None
+            ],
+        )
+        self.assertIsNone(assets[2].mux_properties)
+        self.assertEqual(2, get_asset.call_count)
+        self.assertEqual(
+            {"id": "2", "created_at": "2"},
+            cache.get(models.MuxAssetProperties.cache_key("2"))["data"],
+        )
+
+    @mock.patch.object(mux, "get_asset")
+    def test_prefetch_mux_properties_errors(self, get_asset) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context)
+        caches["lti_apps"].clear()
+        get_asset.side_effect = mux.ApiException(status=500)
+
+        assets = models.Asset.objects.prefetch_mux_properties(
+            models.Asset.objects.all()
+        )
+
+        self.assertIsNone(assets[0].mux_properties)
+        self.assertEqual(1, get_asset.call_count)
+        self.assertIsNone(models.Asset.objects.get().mux_synced_at)
+        self.assertIsNone(
+            caches["lti_apps"].get(models.MuxAssetProperties.cache_key("1"))
+        )
+
+    @mock.patch.object(models, "DELETE_CHUNK_SIZE", 2)
+    @mock.patch.object(mux, "get_assets_client")
+    def test_bulk_delete(self, get_assets_client) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        for mux_id in ["1", "2", "3", "4"]:
+            models.Asset.objects.create(mux_id=mux_id, lti_context=lti_context)
+        models.MuxAssetProperties.set_cached_data(
+            {"1": {"id": "1", "created_at": "1"}, "4": {"id": "4", "created_at": "4"}}
+        )
+        get_assets_client.return_value.delete_asset.side_effect = [
+            None,
+            mux.NotFoundException(status=404),
+            None,
+        ]
+
+        mux_ids = models.Asset.objects.bulk_delete(
+            models.Asset.objects.exclude(mux_id="4")
+        )
+
+        self.assertEqual(["1", "2", "3"], sorted(mux_ids))
+        self.assertEqual(["4"], [asset.mux_id for asset in models.Asset.objects.all()])
+        self.assertEqual(3, get_assets_client.return_value.delete_asset.call_count)
+        cache = caches["lti_apps"]
+        self.assertIsNone(cache.get(models.MuxAssetProperties.cache_key("1")))
+        self.assertIsNotNone(cache.get(models.MuxAssetProperties.cache_key("4")))
+
+    @mock.patch.object(tasks, "delete_mux_assets")
+    def test_bulk_delete_queries(self, _delete_mux_assets) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+
+        def count_queries(asset_count: int) -> int:
+            for mux_id in range(asset_count):
+                asset = models.Asset.objects.create(
+                    mux_id=str(mux_id), lti_context=lti_context
+                )
+                models.SubtitleFile.objects.create(
+                    name=f"{asset_count}-{mux_id}.vtt", asset=asset
+                )
+            with CaptureQueriesContext(connection) as context:
+                models.Asset.objects.bulk_delete(models.Asset.objects.all())
+            return len(context)
+
+        # The number of queries does not depend on the number of assets
+        self.assertEqual(count_queries(1), count_queries(50))
+        self.assertEqual(0, models.Asset.objects.count())
+        self.assertEqual(
+            51, models.SubtitleFile.objects.filter(asset__isnull=True).count()
+        )
+
+    def test_reparent(self) -> None:
+        source = models.LtiContext.objects.create(context_id="source")
+        target = models.LtiContext.objects.create(context_id="target")
+        for mux_id in ["1", "2", "3"]:
+            models.Asset.objects.create(mux_id=mux_id, lti_context=source)
+
+        with self.assertNumQueries(4):
+            progress = list(models.Asset.objects.reparent(source, target, batch_size=2))
+
+        self.assertEqual([2, 3], progress)
+        self.assertEqual(3, models.Asset.objects.filter(lti_context=target).count())
+        with self.assertRaises(ValueError):
+            list(models.Asset.objects.reparent(target, target))
+
+    @mock.patch.object(mux, "get_asset")
+    def test_mux_properties_local_copy(self, get_asset) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context)
+        models.Asset.objects.update_mux_data(
+            "1",
+            {
+                "id": "1",
+                "status": "ready",
+                "created_at": "1646396487",
+                "playback_ids": [{"id": "playback1", "policy": "public"}],
+                "tracks": [
+                    {"id": "track1", "type": "video"},
+                    {"id": "track2", "type": "text", "language_code": "fr"},
+                ],
+                "errors": None,
+            },
+        )
+
+        asset = models.Asset.objects.get(mux_id="1")
+        properties = asset.mux_properties
+
+        get_asset.assert_not_called()
+        assert properties is not None
+        self.assertEqual("ready", asset.mux_status)
+        self.assertEqual(1646396487, properties.created_at_timestamp)
+        self.assertEqual("playback1", properties.playback_id)
+        self.assertTrue(properties.is_public)
+        self.assertEqual([], properties.error_messages)
+        self.assertEqual(["track2"], [t["id"] for t in properties.subtitle_tracks])
+        self.assertEqual("fr", properties.subtitle_tracks[0]["language_code"])
+
+    @mock.patch.object(mux, "sign_video_playback_url")
+    @mock.patch.object(mux, "sign_poster_playback_url")
+    def test_player_cache(self, sign_poster, sign_video) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context)
+        data = {
+            "id": "1",
+            "status": "preparing",
+            "created_at": "1646396487",
+            "playback_ids": [{"id": "playback1", "policy": "signed"}],
+        }
+        models.Asset.objects.update_mux_data("1", data)
+        self.assertIsNone(models.Asset.objects.get().get_player_cache())
+
+        models.Asset.objects.update_mux_data("1", dict(data, status="ready"))
+        sign_video.return_value = "https://video"
+        sign_poster.return_value = "https://poster"
+        request = SimpleNamespace(lti_params=SimpleNamespace(is_instructor=False))
+
+        def render() -> str:
+            # Same context as the "launch" view
+            asset = models.Asset.objects.get()
+            return render_to_string(
+                "muxltiproducer/watch.html",
+                {
+                    "asset": asset,
+                    "player_cache": asset.get_player_cache(),
+                    "request": request,
+                },
+            )
+
+        player = render()
+        self.assertIn("https://video", player)
+        self.assertEqual(player, render())
+        self.assertEqual(1, sign_video.call_count)
+
+        # The player is rendered again after the asset is updated
+        models.Asset.objects.filter(mux_id="1").update(
+            mux_synced_at=now() + timedelta(seconds=1)
+        )
+        render()
+        self.assertEqual(2, sign_video.call_count)
+
+    @mock.patch.object(mux, "get_asset")
+    def test_mux_properties_missing_asset(self, get_asset) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.Asset.objects.create(mux_id="1", lti_context=lti_context)
+        caches["lti_apps"].clear()
+        get_asset.return_value = None
+
+        self.assertIsNone(models.Asset.objects.get(mux_id="1").mux_properties)
+        self.assertIsNone(models.Asset.objects.get(mux_id="1").mux_properties)
+        get_asset.assert_called_once_with("1")
+
+    @mock.patch.object(mux, "get_asset")
+    def test_load_data_cache(self, get_asset) -> None:
+        caches["lti_apps"].clear()
+        get_asset.return_value = {"id": "1", "status": "preparing"}
+        with mock.patch.object(models, "time", return_value=1000):
+            self.assertEqual("preparing", load_status("1"))
+        self.assertEqual(1, get_asset.call_count)
+
+        # Fresh data is served from the cache
+        with mock.patch.object(models, "time", return_value=1059):
+            self.assertEqual("preparing", load_status("1"))
+        self.assertEqual(1, get_asset.call_count)
+
+        # Stale data is served from the cache, and refreshed in the background
+        get_asset.return_value = {"id": "1", "status": "ready"}
+        with mock.patch.object(models, "time", return_value=1061):
+            self.assertEqual("preparing", load_status("1"))
+            self.assertEqual(2, get_asset.call_count)
+            self.assertEqual("ready", load_status("1"))
+        self.assertEqual(2, get_asset.call_count)
+
+    @override_settings(MUX_ASSET_CACHE_TTL_SECONDS={"missing": 10})
+    def test_negative_cache_ttl(self) -> None:
+        self.assertEqual(10, models.MuxAssetProperties.get_cache_ttl(None))
+        self.assertEqual(60, models.MuxAssetProperties.get_cache_ttl("preparing"))
+        self.assertEqual(60, models.MuxAssetProperties.get_cache_ttl("unknown"))
+        with mock.patch.object(caches["lti_apps"], "set_many") as set_many:
+            models.MuxAssetProperties.set_cached_data({"1": None})
+        self.assertEqual(10, set_many.call_args.kwargs["timeout"])
+
+    @mock.patch.object(models, "sleep")
+    @mock.patch.object(mux, "get_asset")
+    def test_load_data_lock(self, get_asset, sleep) -> None:
+        cache = caches["lti_apps"]
+        cache.clear()
+        cache.add(models.MuxAssetProperties.cache_key("1") + ":lock", True)
+
+        def fill_cache(_seconds):
+            models.MuxAssetProperties.set_cached_data({"1": {"id": "1"}})
+
+        sleep.side_effect = fill_cache
+        self.assertEqual({"id": "1"}, models.MuxAssetProperties.load_data("1"))
+        get_asset.assert_not_called()
 
 
 def get_mux_asset_ids(course_id: str):
@@ -63,3 +508,9 @@ def get_mux_asset_ids(course_id: str):
         .order_by("mux_id")
         .all()
     ]
+
+
+def load_status(mux_id: str) -> str:
+    data = models.MuxAssetProperties.load_data(mux_id)
+    assert data is not None
+    return data["status"]
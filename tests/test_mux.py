@@ -1,9 +1,35 @@
+import base64
+from unittest import mock
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from django.test import TestCase, override_settings
 
 from muxltiproducer import mux
 
+SIGNING_KEY = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+SIGNING_PRIVATE_KEY = base64.b64encode(
+    SIGNING_KEY.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+).decode()
+
 
 class MuxTests(TestCase):
+    def test_shared_client(self):
+        mux.reset_client()
+        client = mux._get_client()  # pylint: disable=protected-access
+        self.assertIs(client, mux.get_assets_client().api_client)
+        self.assertIs(client, mux.get_uploads_client().api_client)
+        self.assertEqual(
+            {"requests": 0, "connections": 0, "reused": 0}, mux.get_client_stats()
+        )
+        mux.reset_client()
+        self.assertIsNot(client, mux.get_assets_client().api_client)
+
     @override_settings(MUX_WEBHOOK_SIGNING_SECRET="secret")
     def test_verify_invalid_webhook_signatures(self):
         self.assertFalse(mux.verify_webhook_signature("t=1234,v1=dummy", b"body"))
@@ -16,3 +42,70 @@ class MuxTests(TestCase):
         body = b"""{"type":"video.upload.created","request_id":null,"object":{"type":"upload","id":"00bAe2kCB4K006Y9X3HiDJje01z6x1KOZzm4UyPYapUC00k"},"id":"5307615d-4a37-4045-9d12-ddb9cb8e7a2f","environment":{"name":"Development","id":"qunfvh"},"data":{"url":"https://storage.googleapis.com/video-storage-us-east1-uploads/00bAe2kCB4K006Y9X3HiDJje01z6x1KOZzm4UyPYapUC00k?Expires=1646571336&GoogleAccessId=direct-uploads-writer-prod%40mux-cloud.iam.gserviceaccount.com&Signature=FOdP7yIzJ4I6W35pRr9HGqZ%2BriFdChbW6nBacPqJ%2BfWvbZb%2F2MPCQVwk%2FzOPX0kOPAaZBYT0E3S98JVtKLiYmicwthwhtw%2FJv%2BjsZ8iT4yA686nZ70xRDvCLtqN%2BDJI%2FTcRwt1Adw5AwFQ6ROqP1XrFH34L3OeQKUcDXSvn299kahaQv911zQqBDZNVtQiuSQsQ2w2IcHa7mzGsFwfapUxp5k%2BVlATPtCt4g9V7Xc3NHWnRhhY4EHVca%2BZWxkTJ%2B11DCC3ba%2BaFmTx40j65IyFRkAtoP90nugO6pe5j5nb3eq3Wf2w87l70hNsPNQv1Ta%2F4QFIQ4POZOqEp%2BNLh2%2FQ%3D%3D&upload_id=ADPycdu_JEWhcWSaoJar3af-TUPVHpSFIZVTOOcX5U4Zu6URJoad3XCCi34H9bQhdLtxzO7yQR2U5nmETj8qE9jhNSoXSsRWQQ","timeout":172800,"status":"waiting","new_asset_settings":{"playback_policies":["signed"]},"id":"00bAe2kCB4K006Y9X3HiDJje01z6x1KOZzm4UyPYapUC00k","cors_origin":"http://localhost:9630"},"created_at":"2022-03-04T12:55:37.000000Z","attempts":[],"accessor_source":null,"accessor":null}"""
         signature = "t=1646398537,v1=3a336662fd90119b62bb53ea7b208e9b8439fe757d3ceaef8f3c04f0c4d5f187"
         self.assertTrue(mux.verify_webhook_signature(signature, body))
+
+    @mock.patch.object(mux, "sleep")
+    def test_call_api_retries_rate_limited_requests(self, sleep):
+        func = mock.Mock(
+            side_effect=[
+                mux.ApiException(status=429),
+                mux.ApiException(status=429),
+                "result",
+            ]
+        )
+        self.assertEqual("result", mux.call_api(func, "arg"))
+        self.assertEqual(3, func.call_count)
+        self.assertEqual([mock.call(0.5), mock.call(1)], sleep.call_args_list)
+
+    @override_settings(MUX_API_MAX_RETRIES=1)
+    @mock.patch.object(mux, "sleep")
+    def test_call_api_does_not_retry_errors(self, _sleep):
+        func = mock.Mock(side_effect=mux.ApiException(status=500))
+        with self.assertRaises(mux.ApiException):
+            mux.call_api(func)
+        self.assertEqual(1, func.call_count)
+        func.side_effect = mux.ApiException(status=429)
+        with self.assertRaises(mux.ApiException):
+            mux.call_api(func)
+        self.assertEqual(3, func.call_count)
+
+    def test_max_request_seconds(self):
+        self.assertEqual(35, mux.get_max_request_seconds())
+        with override_settings(MUX_API_TIMEOUT_SECONDS=10):
+            self.assertEqual(20, mux.get_max_request_seconds())
+
+
+@override_settings(
+    MUX_SIGNING_KEY_ID="key1",
+    MUX_SIGNING_PRIVATE_KEY=SIGNING_PRIVATE_KEY,
+    MUX_SIGNED_URL_EXPIRY_SECONDS=1000,
+    MUX_SIGNED_URL_REUSE_FRACTION=0.5,
+)
+class SignedUrlTests(TestCase):
+    def test_sign_url(self):
+        url = mux.sign_video_playback_url("https://video", "sign1")
+        self.assertTrue(url.startswith("https://video?token="))
+        token = url.split("token=")[1]
+        self.assertEqual("key1", jwt.get_unverified_header(token)["kid"])
+        claims = jwt.decode(
+            token, SIGNING_KEY.public_key(), algorithms=["RS256"], audience="v"
+        )
+        self.assertEqual("sign1", claims["sub"])
+        self.assertTrue(claims["redundant_streams"])
+
+    def test_signed_urls_are_reused(self):
+        with mock.patch.object(mux, "time", return_value=10000):
+            video_url = mux.sign_video_playback_url("https://video", "reuse1")
+            poster_url = mux.sign_poster_playback_url("https://poster", "reuse1")
+        self.assertNotEqual(video_url, poster_url)
+        with mock.patch.object(mux, "time", return_value=10499):
+            self.assertEqual(
+                video_url, mux.sign_video_playback_url("https://video", "reuse1")
+            )
+        with mock.patch.object(mux, "time", return_value=10500):
+            self.assertNotEqual(
+                video_url, mux.sign_video_playback_url("https://video", "reuse1")
+            )
+        with override_settings(MUX_SIGNING_KEY_ID="key2"):
+            self.assertNotEqual(
+                poster_url, mux.sign_poster_playback_url("https://poster", "reuse1")
+            )
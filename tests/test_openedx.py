@@ -1,4 +1,4 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 from muxltiproducer import openedx
 
@@ -10,3 +10,33 @@ class OpenedXTests(TestCase):
         self.assertEqual("org1", org)
         self.assertEqual("course1", course)
         self.assertEqual("run1", run)
+
+    def test_course_access_limit_lookups(self):
+        course_id = "course-v1:org1+course1+run1"
+        self.assertIsNone(openedx.course_access_limit_lookups(course_id))
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="ORGANIZATION"):
+            self.assertEqual(
+                {"organization": "org1"}, openedx.course_access_limit_lookups(course_id)
+            )
+            self.assertEqual(
+                {"context_id": "dummy"}, openedx.course_access_limit_lookups("dummy")
+            )
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="RUN"):
+            self.assertEqual(
+                {"organization": "org1", "course": "course1", "run": "run1"},
+                openedx.course_access_limit_lookups(course_id),
+            )
+
+    def test_course_access_scope_is_memoized(self):
+        course_id = "course-v1:org1+course1+run1"
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="COURSE"):
+            scope = openedx.course_access_scope(course_id)
+            self.assertEqual(
+                openedx.AccessScope(organization="org1", course="course1"), scope
+            )
+            self.assertIs(scope, openedx.course_access_scope(course_id))
+            self.assertEqual(1, openedx.resolve_access_scope.cache_info().currsize)
+        self.assertEqual(0, openedx.resolve_access_scope.cache_info().currsize)
+        with override_settings(MUX_ASSET_INSTRUCTOR_ACCESS_LIMITED_TO="INVALID"):
+            with self.assertRaises(ValueError):
+                openedx.course_access_scope(course_id)
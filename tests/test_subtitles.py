@@ -0,0 +1,162 @@
+import io
+from datetime import timedelta
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError
+from django.test import TestCase
+from django.utils.timezone import now
+from storages.backends.s3boto3 import S3Boto3Storage
+
+from muxltiproducer import models, subtitles
+
+
+class SubtitlesTests(TestCase):
+    def convert(self, content: bytes) -> str:
+        output = io.BytesIO()
+        subtitles.convert(SimpleUploadedFile("subtitles", content), output)
+        return output.getvalue().decode()
+
+    def test_convert_srt(self) -> None:
+        self.assertEqual(
+            "WEBVTT\n"
+            "\n"
+            "00:00:01.000 --> 00:00:02.500\n"
+            "Hello\n"
+            "World\n"
+            "\n"
+            "00:01:03.000 --> 01:00:00.000\n"
+            "Bye\n",
+            self.convert(
+                b"1\r\n00:00:01,000 --> 00:00:02,500\r\nHello\r\nWorld\r\n\r\n\r\n"
+                b"2\r\n00:01:03,000 --> 01:00:00,000\r\nBye\r\n"
+            ),
+        )
+
+    def test_convert_webvtt(self) -> None:
+        self.assertEqual(
+            "WEBVTT\n"
+            "\n"
+            "intro\n"
+            "00:00:01.000 --> 00:00:02.000 line:0\n"
+            "Hello\n",
+            self.convert(
+                b"WEBVTT - title\n\nNOTE comment\n\n"
+                b"intro\n00:01.000 --> 00:02.000 line:0\nHello\n"
+            ),
+        )
+
+    def test_convert_encodings(self) -> None:
+        srt = "1\n00:00:01,000 --> 00:00:02,000\nÇa va ?\n"
+        expected = "WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nÇa va ?\n"
+        self.assertEqual(expected, self.convert(srt.encode()))
+        self.assertEqual(expected, self.convert(srt.encode("utf-8-sig")))
+        self.assertEqual(expected, self.convert(srt.encode("utf-16")))
+        self.assertEqual(expected, self.convert(srt.encode("cp1252")))
+
+    def test_line_endings_across_chunks(self) -> None:
+        lines = list(subtitles.iter_lines([b"a\r", b"\nb\r", b"c\n", b"d"], "utf-8"))
+        self.assertEqual(["a", "b", "c", "d"], lines)
+
+    def test_invalid_files(self) -> None:
+        for content in [
+            b"",
+            b"\n\n",
+            b"WEBVTT\n",
+            b"1\nHello\n",
+            b"1\n00:00:02,000 --> 00:00:01,000\nHello\n",
+            b"1\n00:00:01,000 -> 00:00:02,000\nHello\n",
+            b"1\n00:00:01,000 --> 00:00:02,000\n" + b"Hello\n" * 100,
+            b"1\n00:00:01,000 --> 00:00:02,000\n" + b"a" * 10000,
+        ]:
+            with self.subTest(content=content[:50]):
+                with self.assertRaises(subtitles.SubtitlesError):
+                    self.convert(content)
+
+    def test_oversized_file(self) -> None:
+        content = b"1\n00:00:01,000 --> 00:00:02,000\nHello\n\n" * 10
+        with mock.patch.object(subtitles, "MAX_SIZE", len(content) - 1):
+            with self.assertRaises(subtitles.SubtitlesError):
+                self.convert(content)
+
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_save(self, storage_class: mock.MagicMock) -> None:
+        storage_class.return_value.save.side_effect = lambda name, _content: name
+        storage_class.return_value.url.side_effect = lambda name: "/media/" + name
+        subtitle_file = subtitles.save(
+            SimpleUploadedFile(
+                "subtitles.srt", b"1\n00:00:01,000 --> 00:00:02,000\nHello\n"
+            )
+        )
+        self.assertEqual(subtitle_file, models.SubtitleFile.objects.get())
+        url = subtitles.url(subtitle_file)
+        self.assertTrue(url.startswith("/media/mux/subtitles/"))
+        self.assertTrue(url.endswith(".vtt"))
+
+        storage_class.return_value.save.reset_mock()
+        with self.assertRaises(subtitles.SubtitlesError):
+            subtitles.save(SimpleUploadedFile("subtitles.srt", b"invalid"))
+        storage_class.return_value.save.assert_not_called()
+
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_save_database_error(self, storage_class: mock.MagicMock) -> None:
+        storage_class.return_value.save.side_effect = lambda name, _content: name
+        with mock.patch.object(
+            models.SubtitleFile.objects, "create", side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError):
+            subtitles.save(
+                SimpleUploadedFile(
+                    "subtitles.srt", b"1\n00:00:01,000 --> 00:00:02,000\nHello\n"
+                )
+            )
+        storage_class.return_value.delete.assert_called_once_with(
+            storage_class.return_value.save.call_args[0][0]
+        )
+
+
+class DeleteExpiredTests(TestCase):
+    def setUp(self) -> None:
+        for index in range(5):
+            models.SubtitleFile.objects.create(name=f"mux/subtitles/{index}.vtt")
+        models.SubtitleFile.objects.filter(
+            name__in=[f"mux/subtitles/{index}.vtt" for index in range(3)]
+        ).update(created_at=now() - timedelta(hours=2))
+
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_delete_expired(self, storage_class: mock.MagicMock) -> None:
+        subtitles.delete_expired()
+
+        storage_class.return_value.listdir.assert_not_called()
+        self.assertEqual(3, storage_class.return_value.delete.call_count)
+        self.assertEqual(2, models.SubtitleFile.objects.count())
+
+    @mock.patch.object(subtitles, "DELETE_BATCH_SIZE", 2)
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_delete_expired_s3(self, storage_class: mock.MagicMock) -> None:
+        storage = mock.MagicMock(spec=S3Boto3Storage, bucket_name="bucket")
+        storage._normalize_name.side_effect = lambda name: "media/" + name
+        delete_objects = storage.bucket.meta.client.delete_objects
+        delete_objects.side_effect = [
+            {"Errors": [{"Key": "media/mux/subtitles/0.vtt", "Message": "Error"}]},
+            {},
+        ]
+        storage_class.return_value = storage
+
+        subtitles.delete_expired()
+
+        self.assertEqual(2, delete_objects.call_count)
+        self.assertEqual(
+            {
+                "Objects": [
+                    {"Key": "media/mux/subtitles/0.vtt"},
+                    {"Key": "media/mux/subtitles/1.vtt"},
+                ],
+                "Quiet": True,
+            },
+            delete_objects.call_args_list[0][1]["Delete"],
+        )
+        # Failed files don't prevent the next batches from being deleted
+        self.assertEqual(
+            ["mux/subtitles/0.vtt", "mux/subtitles/3.vtt", "mux/subtitles/4.vtt"],
+            sorted(models.SubtitleFile.objects.values_list("name", flat=True)),
+        )
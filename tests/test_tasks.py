@@ -0,0 +1,334 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from muxltiproducer import models, mux, subtitles, tasks
+
+
+class TasksTests(TestCase):
+    def setUp(self) -> None:
+        caches["lti_apps"].clear()
+        self.lti_context = models.LtiContext.objects.create(context_id="dummy")
+
+    @mock.patch.object(tasks, "DIRECT_UPLOADS_PAGE_SIZE", 2)
+    @mock.patch.object(mux, "list_direct_uploads")
+    def test_list_waiting_direct_uploads(self, list_direct_uploads) -> None:
+        caches["lti_apps"].clear()
+        for mux_id in ["upload1", "upload2", "upload3"]:
+            models.UploadUrl.objects.create(mux_id=mux_id, lti_context=self.lti_context)
+        list_direct_uploads.side_effect = [
+            [
+                {"id": "upload4", "status": "asset_created", "asset_id": "asset4"},
+                {"id": "upload3", "status": "waiting", "asset_id": None},
+            ],
+            [
+                {"id": "upload2", "status": "asset_created", "asset_id": "asset2"},
+                {"id": "upload1", "status": "timed_out", "asset_id": None},
+            ],
+        ]
+
+        tasks.list_waiting_direct_uploads()
+
+        self.assertEqual(2, list_direct_uploads.call_count)
+        self.assertEqual(
+            {"upload1": "timed_out", "upload2": "asset_created", "upload3": "waiting"},
+            dict(models.UploadUrl.objects.values_list("mux_id", "status")),
+        )
+        self.assertEqual(
+            ["asset2"], list(models.Asset.objects.values_list("mux_id", flat=True))
+        )
+        self.assertEqual(
+            1, models.SyncCursor.objects.get(name=tasks.DIRECT_UPLOADS_SYNC_CURSOR).page
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                "asset_created", models.UploadUrl.objects.get_status("upload2")
+            )
+
+    @mock.patch.object(mux, "list_direct_uploads")
+    def test_list_waiting_direct_uploads_skips_uploading(
+        self, list_direct_uploads
+    ) -> None:
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=self.lti_context)
+        models.UploadUrl.objects.record_progress("upload1", 100, 1000, 100)
+        list_direct_uploads.return_value = []
+
+        tasks.list_waiting_direct_uploads()
+        list_direct_uploads.assert_not_called()
+
+        # Stalled uploads are synchronized again
+        models.UploadUrl.objects.filter(mux_id="upload1").update(
+            progress_at=now()
+            - timedelta(seconds=models.UPLOAD_PROGRESS_TIMEOUT_SECONDS + 1)
+        )
+        tasks.list_waiting_direct_uploads()
+        list_direct_uploads.assert_called_once()
+
+    @mock.patch.object(models, "UPLOAD_URL_POOL_SIZE", 3)
+    @mock.patch.object(mux, "create_direct_upload")
+    def test_fill_upload_url_pools(self, create_direct_upload) -> None:
+        create_direct_upload.side_effect = [
+            {"id": f"pooled{i}", "url": f"https://mux/pooled{i}"} for i in range(3)
+        ]
+        models.UploadUrl.objects.create(
+            mux_id="upload1", lti_context=self.lti_context, origin="https://lms"
+        )
+        models.UploadUrl.objects.create(
+            mux_id="upload2", origin="https://lms", playback_policy="signed"
+        )
+
+        tasks.fill_upload_url_pools.call_local()
+
+        self.assertEqual(2, create_direct_upload.call_count)
+        create_direct_upload.assert_called_with(origin="https://lms")
+        self.assertEqual(
+            ["upload2", "pooled0", "pooled1"],
+            [
+                upload_url.mux_id
+                for upload_url in models.UploadUrl.objects.filter_pool(
+                    "https://lms", "signed"
+                ).order_by("pk")
+            ],
+        )
+        # Pooled urls are not synchronized
+        # pylint: disable=protected-access
+        self.assertEqual(["upload1"], list(tasks._get_waiting_upload_urls()))
+
+    @mock.patch.object(models, "UPLOAD_URL_POOL_SIZE", 4)
+    @mock.patch.object(models, "UPLOAD_URL_POOL_LOW_WATER_MARK", 2)
+    @mock.patch.object(mux, "create_direct_upload")
+    def test_fill_upload_url_pool_low_water_mark(self, create_direct_upload) -> None:
+        create_direct_upload.side_effect = [
+            {"id": f"pooled{i}", "url": f"https://mux/pooled{i}"} for i in range(6)
+        ]
+        fill_pool = models.UploadUrl.objects.fill_pool_if_needed
+        policy = mux.get_playback_policy()
+
+        fill_pool("https://lms", policy)
+        self.assertEqual(4, create_direct_upload.call_count)
+        models.UploadUrl.objects.checkout(self.lti_context, "https://lms", policy)
+        fill_pool("https://lms", policy)
+        self.assertEqual(4, create_direct_upload.call_count)
+        models.UploadUrl.objects.checkout(self.lti_context, "https://lms", policy)
+        fill_pool("https://lms", policy)
+        self.assertEqual(6, create_direct_upload.call_count)
+        self.assertEqual(
+            4, models.UploadUrl.objects.filter_pool("https://lms", policy).count()
+        )
+
+        # Pools that are being filled are skipped
+        models.UploadUrl.objects.lock_pool("https://lms")
+        models.UploadUrl.objects.filter_pool("https://lms", policy).delete()
+        fill_pool("https://lms", policy)
+        tasks.fill_upload_url_pools.call_local()
+        self.assertEqual(6, create_direct_upload.call_count)
+
+    @override_settings(MUX_DIRECT_UPLOADS_SYNC_MAX_PAGES=1)
+    @mock.patch.object(tasks, "DIRECT_UPLOADS_PAGE_SIZE", 1)
+    @mock.patch.object(mux, "list_direct_uploads")
+    def test_list_waiting_direct_uploads_resume(self, list_direct_uploads) -> None:
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=self.lti_context)
+        list_direct_uploads.return_value = [
+            {"id": "upload2", "status": "asset_created", "asset_id": "asset2"}
+        ]
+
+        tasks.list_waiting_direct_uploads()
+        tasks.list_waiting_direct_uploads()
+
+        self.assertEqual(
+            [mock.call(1, limit=1), mock.call(2, limit=1)],
+            list_direct_uploads.call_args_list,
+        )
+        self.assertEqual(
+            3, models.SyncCursor.objects.get(name=tasks.DIRECT_UPLOADS_SYNC_CURSOR).page
+        )
+
+    @mock.patch.object(mux, "get_direct_upload")
+    def test_poll_waiting_direct_uploads(self, get_direct_upload) -> None:
+        for mux_id in ["upload1", "upload2", "upload3"]:
+            models.UploadUrl.objects.create(mux_id=mux_id, lti_context=self.lti_context)
+        uploads = {
+            "upload1": {"id": "upload1", "status": "asset_created", "asset_id": "a1"},
+            "upload2": {"id": "upload2", "status": "waiting", "asset_id": None},
+        }
+
+        def get_upload(mux_id, limiter=None):
+            self.assertIsInstance(limiter, mux.RateLimiter)
+            if mux_id not in uploads:
+                raise mux.ApiException(status=500)
+            return uploads[mux_id]
+
+        get_direct_upload.side_effect = get_upload
+
+        tasks.poll_waiting_direct_uploads(concurrency=2, rate=100)
+
+        self.assertEqual(3, get_direct_upload.call_count)
+        self.assertEqual(
+            {"upload1": "asset_created", "upload2": "waiting", "upload3": "waiting"},
+            dict(models.UploadUrl.objects.values_list("mux_id", "status")),
+        )
+        self.assertEqual(
+            ["a1"], list(models.Asset.objects.values_list("mux_id", flat=True))
+        )
+
+    @override_settings(MUX_UNSETTLED_ASSETS_MAX_SYNC=2)
+    @mock.patch.object(mux, "get_asset")
+    def test_update_unsettled_assets(self, get_asset) -> None:
+        for mux_id in ["asset1", "asset2", "asset3"]:
+            models.Asset.objects.create(mux_id=mux_id, lti_context=self.lti_context)
+
+        def get_asset_or_fail(mux_id, **_kwargs):
+            if mux_id == "asset2":
+                raise mux.ApiException(status=500)
+            return {"id": mux_id, "status": "ready"}
+
+        get_asset.side_effect = get_asset_or_fail
+
+        # Most recent assets are updated first, failed assets are left unsynced
+        tasks.update_unsettled_assets()
+        self.assertEqual(
+            ["asset3"],
+            list(
+                models.Asset.objects.filter(mux_synced_at__isnull=False).values_list(
+                    "mux_id", flat=True
+                )
+            ),
+        )
+
+        tasks.update_unsettled_assets()
+        self.assertEqual(
+            {"asset1": "ready", "asset2": "", "asset3": "ready"},
+            dict(models.Asset.objects.values_list("mux_id", "mux_status")),
+        )
+
+    @mock.patch.object(subtitles, "DefaultStorage")
+    @mock.patch.object(mux, "get_asset")
+    def test_delete_ingested_subtitle_files(self, get_asset, storage_class) -> None:
+        asset = models.Asset.objects.create(
+            mux_id="asset1", lti_context=self.lti_context
+        )
+        for track_id in ["track1", "track2", "track3"]:
+            models.SubtitleFile.objects.create(
+                name=f"{track_id}.vtt", asset=asset, mux_track_id=track_id
+            )
+        models.SubtitleFile.objects.create(name="pending.vtt", asset=asset)
+        get_asset.return_value = {
+            "id": "asset1",
+            "status": "ready",
+            "tracks": [
+                {"id": "track1", "type": "text", "status": "ready"},
+                {"id": "track2", "type": "text", "status": "preparing"},
+            ],
+        }
+
+        tasks.delete_ingested_subtitle_files()
+
+        self.assertEqual(
+            ["pending.vtt", "track2.vtt"],
+            sorted(models.SubtitleFile.objects.values_list("name", flat=True)),
+        )
+        self.assertEqual(2, storage_class.return_value.delete.call_count)
+
+    @mock.patch.object(mux, "get_asset")
+    @mock.patch.object(mux, "get_assets_client")
+    def test_replace_subtitles(self, get_assets_client, get_asset) -> None:
+        asset = models.Asset.objects.create(
+            mux_id="asset1", lti_context=self.lti_context
+        )
+        subtitle_file = models.SubtitleFile.objects.create(name="new.vtt", asset=asset)
+        tracks = [
+            {"id": "track1", "type": "text", "language_code": "fr"},
+            {"id": "track2", "type": "text", "language_code": "en"},
+        ]
+        new_track = {"id": "track3", "type": "text", "language_code": "fr"}
+        get_asset.side_effect = [
+            {"id": "asset1", "status": "ready", "tracks": tracks},
+            {"id": "asset1", "status": "ready", "tracks": tracks[1:] + [new_track]},
+        ]
+        client = get_assets_client.return_value
+        client.create_asset_track.return_value.data.id = "track3"
+
+        tasks.replace_subtitles.call_local(
+            "asset1", subtitle_file.id, "http://subtitles/new.vtt", "fr"
+        )
+
+        client.delete_asset_track.assert_called_once_with("asset1", "track1")
+        client.create_asset_track.assert_called_once()
+        self.assertEqual("track3", models.SubtitleFile.objects.get().mux_track_id)
+        properties = models.Asset.objects.get().mux_properties
+        assert properties is not None
+        self.assertEqual(
+            ["track2", "track3"], [track["id"] for track in properties.subtitle_tracks]
+        )
+
+    @mock.patch.object(mux, "get_asset")
+    @mock.patch.object(mux, "get_assets_client")
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_replace_subtitles_errors(
+        self, storage_class, get_assets_client, get_asset
+    ) -> None:
+        asset = models.Asset.objects.create(
+            mux_id="asset1", lti_context=self.lti_context
+        )
+        asset.set_text_tracks(
+            [{"id": None, "type": "text", "language_code": "fr", "status": "preparing"}]
+        )
+        subtitle_file = models.SubtitleFile.objects.create(name="new.vtt", asset=asset)
+        get_asset.side_effect = [
+            {
+                "id": "asset1",
+                "status": "ready",
+                "tracks": [{"id": "track1", "type": "text", "language_code": "fr"}],
+            },
+            mux.ApiException(status=500),
+        ]
+        client = get_assets_client.return_value
+        client.delete_asset_track.side_effect = mux.ApiException(status=500)
+        client.create_asset_track.return_value.data.id = "track2"
+
+        tasks.replace_subtitles.call_local(
+            "asset1", subtitle_file.id, "http://subtitles/new.vtt", "fr"
+        )
+
+        # The file is kept until the new track is ingested
+        storage_class.return_value.delete.assert_not_called()
+        self.assertEqual("track2", models.SubtitleFile.objects.get().mux_track_id)
+        self.assertEqual(
+            ["track2"],
+            [track["id"] for track in models.Asset.objects.get().mux_text_tracks],
+        )
+
+        # Files of tracks that could not be created are deleted
+        get_asset.side_effect = [{"id": "asset1", "status": "ready", "tracks": []}] * 2
+        client.create_asset_track.side_effect = mux.ApiException(status=500)
+        tasks.replace_subtitles.call_local(
+            "asset1", subtitle_file.id, "http://subtitles/new.vtt", "fr"
+        )
+        storage_class.return_value.delete.assert_called_once_with("new.vtt")
+        self.assertFalse(models.SubtitleFile.objects.exists())
+
+    @mock.patch.object(mux, "get_asset")
+    @mock.patch.object(mux, "get_assets_client")
+    def test_replace_subtitles_list_error(self, get_assets_client, get_asset) -> None:
+        asset = models.Asset.objects.create(
+            mux_id="asset1", lti_context=self.lti_context
+        )
+        subtitle_file = models.SubtitleFile.objects.create(name="new.vtt", asset=asset)
+        get_asset.side_effect = [
+            mux.ApiException(status=500),
+            {"id": "asset1", "status": "ready", "tracks": []},
+        ]
+        client = get_assets_client.return_value
+        client.create_asset_track.return_value.data.id = "track1"
+
+        tasks.replace_subtitles.call_local(
+            "asset1", subtitle_file.id, "http://subtitles/new.vtt", "fr"
+        )
+
+        # Existing tracks are kept, and the new track is still created
+        client.delete_asset_track.assert_not_called()
+        client.create_asset_track.assert_called_once()
+        self.assertEqual("track1", models.SubtitleFile.objects.get().mux_track_id)
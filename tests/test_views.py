@@ -0,0 +1,354 @@
+import asyncio
+import functools
+import hashlib
+import hmac
+import json
+import typing as t
+from datetime import timedelta
+from time import time
+from unittest import mock
+
+from django.core import signing
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils.timezone import now
+from ltiproducer import ltiviews
+
+from muxltiproducer import models, mux, subtitles, tasks
+
+
+class LtiParams(dict):
+    """
+    LTI launch parameters of the test views, such as "custom_video_id".
+    """
+
+    context_id = "dummy"
+    is_instructor = True
+
+
+LTI_PARAMS = LtiParams()
+
+
+def stub_lti_sessions() -> None:
+    """
+    Replace the LTI session decorators of the views by stubs, as in the
+    benchmark suite. This must be done before the views are imported.
+    """
+
+    def view(func: t.Callable[..., t.Any]) -> t.Callable[..., t.Any]:
+        @functools.wraps(func)
+        def wrapper(request: t.Any, *args: t.Any, **kwargs: t.Any) -> t.Any:
+            request.lti_session_id = kwargs.pop("lti_session_id")
+            request.lti_params = LTI_PARAMS
+            return func(request, *args, **kwargs)
+
+        return wrapper
+
+    ltiviews.view = view
+    ltiviews.instructor_required = lambda func: func
+
+
+stub_lti_sessions()
+# pylint: disable=wrong-import-position
+from muxltiproducer import views
+
+
+def get_lti_url(name: str, **kwargs: str) -> str:
+    return reverse(f"mux:{name}", kwargs=dict(kwargs, lti_session_id="session1"))
+
+
+def get_upload_status_url(mux_id: str) -> str:
+    return reverse(
+        "mux:upload_status",
+        kwargs={"token": signing.dumps(mux_id, salt=views.UPLOAD_STATUS_SALT)},
+    )
+
+
+class UploadStatusTests(TestCase):
+    def setUp(self) -> None:
+        caches["lti_apps"].clear()
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=lti_context)
+
+    def test_invalid_token(self) -> None:
+        self.assertEqual(
+            403,
+            self.client.get(
+                reverse("mux:upload_status", kwargs={"token": "invalid"})
+            ).status_code,
+        )
+        with mock.patch(
+            "django.core.signing.time.time",
+            return_value=time() - models.UPLOAD_STATUS_CACHE_TIMEOUT - 1,
+        ):
+            url = get_upload_status_url("upload1")
+        self.assertEqual(403, self.client.get(url).status_code)
+
+    def test_unknown_upload(self) -> None:
+        self.assertEqual(
+            404, self.client.get(get_upload_status_url("unknown")).status_code
+        )
+
+    def test_status(self) -> None:
+        url = get_upload_status_url("upload1")
+        response = self.client.get(url)
+        self.assertEqual({"id": "upload1", "status": "waiting"}, response.json())
+        # The status differs from the known status: no need to wait
+        response = self.client.get(url, {"status": "asset_created"})
+        self.assertEqual("waiting", response.json()["status"])
+
+    @mock.patch.object(views, "UPLOAD_STATUS_POLL_SECONDS", 0.01)
+    async def test_long_poll(self) -> None:
+        url = get_upload_status_url("upload1")
+
+        async def update_status() -> None:
+            await asyncio.sleep(0.05)
+            await caches["lti_apps"].aset(
+                models.UploadUrl.status_cache_key("upload1"), "asset_created"
+            )
+
+        with mock.patch.object(views, "UPLOAD_STATUS_TIMEOUT_SECONDS", 5):
+            response, _ = await asyncio.gather(
+                self.async_client.get(url, {"status": "waiting"}), update_status()
+            )
+        self.assertEqual("asset_created", response.json()["status"])
+
+        # The known status is returned on timeout
+        with mock.patch.object(views, "UPLOAD_STATUS_TIMEOUT_SECONDS", 0.05):
+            response = await self.async_client.get(url, {"status": "asset_created"})
+        self.assertEqual("asset_created", response.json()["status"])
+
+
+class UploadProgressTests(TestCase):
+    def setUp(self) -> None:
+        lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.UploadUrl.objects.create(
+            mux_id="upload1", url="https://mux/upload1", lti_context=lti_context
+        )
+        self.url = reverse(
+            "mux:upload_progress",
+            kwargs={"token": signing.dumps("upload1", salt=views.UPLOAD_PROGRESS_SALT)},
+        )
+
+    def test_record_progress(self) -> None:
+        progress = {"bytes_confirmed": 100, "bytes_total": 1000, "chunk_size": 100}
+        self.assertEqual(204, self.client.post(self.url, progress).status_code)
+        # Progress does not go backwards
+        self.assertEqual(
+            409,
+            self.client.post(self.url, dict(progress, bytes_confirmed=50)).status_code,
+        )
+        self.assertEqual(
+            400,
+            self.client.post(self.url, dict(progress, bytes_confirmed="x")).status_code,
+        )
+        self.assertEqual(
+            400, self.client.post(self.url, {"bytes_confirmed": 200}).status_code
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(200, response.status_code)
+        checkpoint = response.json()
+        self.assertIsNotNone(checkpoint.pop("progress_at"))
+        self.assertEqual(
+            {
+                "id": "upload1",
+                "url": "https://mux/upload1",
+                "status": "waiting",
+                "bytes_total": 1000,
+                "bytes_confirmed": 100,
+                "chunk_size": 100,
+            },
+            checkpoint,
+        )
+
+    def test_invalid_token(self) -> None:
+        # Upload status tokens cannot be used to record progress
+        url = reverse(
+            "mux:upload_progress",
+            kwargs={"token": signing.dumps("upload1", salt=views.UPLOAD_STATUS_SALT)},
+        )
+        self.assertEqual(403, self.client.get(url).status_code)
+        self.assertEqual(
+            403,
+            self.client.post(
+                url, {"bytes_confirmed": 100, "bytes_total": 1000, "chunk_size": 100}
+            ).status_code,
+        )
+        self.assertEqual(0, models.UploadUrl.objects.get().bytes_confirmed)
+
+
+class LtiViewsQueriesTests(TestCase):
+    """
+    Check the number of SQL queries of the views, which must not depend on the
+    number of assets.
+    """
+
+    def setUp(self) -> None:
+        caches["lti_apps"].clear()
+        LTI_PARAMS.clear()
+        self.lti_context = models.LtiContext.objects.create(context_id="dummy")
+        for index in range(30):
+            asset = models.Asset(mux_id=f"asset{index}", lti_context=self.lti_context)
+            asset.set_mux_data(
+                {
+                    "id": f"asset{index}",
+                    "status": "ready",
+                    "created_at": "1646396487",
+                    "playback_ids": [{"id": f"playback{index}", "policy": "public"}],
+                    "tracks": [{"id": "track1", "type": "text", "language_code": "fr"}],
+                }
+            )
+            asset.save()
+
+    def test_launch(self) -> None:
+        LTI_PARAMS["custom_video_id"] = "asset1"
+        with self.assertNumQueries(1):
+            self.assertEqual(200, self.client.get(get_lti_url("launch")).status_code)
+
+    def test_edit_video(self) -> None:
+        with self.assertNumQueries(1):
+            self.assertEqual(200, self.client.get(get_lti_url("edit")).status_code)
+
+    def test_list_assets(self) -> None:
+        before = models.Asset.objects.get(mux_id="asset25").pk
+        with self.assertNumQueries(1):
+            response = self.client.get(get_lti_url("assets"), {"before": before})
+        self.assertEqual(20, len(response.json()["assets"]))
+
+    @mock.patch.object(tasks, "delete_mux_assets")
+    def test_delete_video(self, delete_mux_assets) -> None:
+        with self.assertNumQueries(4):
+            response = self.client.post(get_lti_url("delete", mux_id="asset1"))
+        self.assertEqual(302, response.status_code)
+        delete_mux_assets.assert_called_once_with(["asset1"])
+
+    @mock.patch.object(tasks, "delete_mux_assets")
+    def test_delete_videos(self, _delete_mux_assets) -> None:
+        with self.assertNumQueries(4):
+            response = self.client.post(
+                get_lti_url("delete_many"), {"mux_id": ["asset1", "asset2"]}
+            )
+        self.assertEqual(302, response.status_code)
+        self.assertEqual(28, models.Asset.objects.count())
+
+    @mock.patch.object(tasks, "delete_mux_assets")
+    def test_delete_videos_created_before(self, _delete_mux_assets) -> None:
+        other_context = models.LtiContext.objects.create(context_id="other")
+        models.Asset.objects.create(
+            mux_id="other1",
+            lti_context=other_context,
+            mux_created_at=now() - timedelta(days=2),
+        )
+        models.Asset.objects.exclude(mux_id__in=["asset1", "other1"]).update(
+            mux_created_at=now()
+        )
+        created_before = now().date().isoformat()
+
+        # Selected videos and upload date cannot be combined
+        response = self.client.post(
+            get_lti_url("delete_many"),
+            {"mux_id": ["asset2"], "created_before": created_before},
+        )
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(31, models.Asset.objects.count())
+
+        # Only the videos of the current context are deleted by date
+        response = self.client.post(
+            get_lti_url("delete_many"), {"created_before": created_before}
+        )
+        self.assertEqual(302, response.status_code)
+        self.assertFalse(models.Asset.objects.filter(mux_id="asset1").exists())
+        self.assertTrue(models.Asset.objects.filter(mux_id="other1").exists())
+        self.assertEqual(30, models.Asset.objects.count())
+
+    @mock.patch.object(tasks, "replace_subtitles")
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_subtitles(self, storage_class, replace_subtitles) -> None:
+        storage_class.return_value.save.side_effect = lambda name, _content: name
+        storage_class.return_value.url.return_value = "/media/subtitles.vtt"
+        with self.assertNumQueries(3):
+            response = self.client.post(
+                get_lti_url("subtitles", mux_id="asset1"),
+                {
+                    "file": SimpleUploadedFile(
+                        "subtitles.srt", b"1\n00:00:01,000 --> 00:00:02,000\nHello\n"
+                    ),
+                    "language": "fr",
+                },
+            )
+        self.assertEqual(302, response.status_code)
+        replace_subtitles.assert_called_once()
+
+    @mock.patch.object(mux, "get_assets_client")
+    def test_delete_subtitles(self, get_assets_client) -> None:
+        with self.assertNumQueries(2):
+            response = self.client.post(
+                get_lti_url("delete_subtitles", mux_id="asset1", track_id="track1")
+            )
+        self.assertEqual(302, response.status_code)
+        get_assets_client.return_value.delete_asset_track.assert_called_once_with(
+            "asset1", "track1"
+        )
+        self.assertEqual([], models.Asset.objects.get(mux_id="asset1").mux_text_tracks)
+
+    def test_uploads_get(self) -> None:
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=self.lti_context)
+        with self.assertNumQueries(1):
+            response = self.client.get(get_lti_url("uploads"), {"id": "upload1"})
+        self.assertEqual({"id": "upload1", "status": "waiting"}, response.json())
+
+    @mock.patch.object(mux, "create_direct_upload")
+    def test_uploads_post(self, create_direct_upload) -> None:
+        models.UploadUrl.objects.bulk_create(
+            [
+                models.UploadUrl(
+                    mux_id=f"upload{index}",
+                    url=f"https://mux/upload{index}",
+                    origin="http://testserver",
+                    playback_policy=mux.get_playback_policy(),
+                )
+                for index in range(models.UPLOAD_URL_POOL_SIZE)
+            ]
+        )
+        with self.assertNumQueries(6):
+            response = self.client.post(get_lti_url("uploads"), HTTP_HOST="testserver")
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.json()["id"].startswith("upload"))
+        create_direct_upload.assert_not_called()
+
+
+@override_settings(MUX_WEBHOOK_SIGNING_SECRET="secret")
+class CallbackTests(TestCase):
+    def post_event(self, event: t.Dict[str, t.Any]) -> t.Any:
+        body = json.dumps(event).encode()
+        signature = hmac.new(b"secret", b"1646396487." + body, hashlib.sha256)
+        return self.client.post(
+            reverse("mux:callback"),
+            body,
+            content_type="application/json",
+            HTTP_MUX_SIGNATURE=f"t=1646396487,v1={signature.hexdigest()}",
+        )
+
+    @mock.patch.object(tasks, "process_webhook_events")
+    def test_callback(self, process_webhook_events) -> None:
+        event = {"id": "event1", "type": "video.asset.ready", "data": {"id": "a1"}}
+        with self.assertNumQueries(4):
+            self.assertEqual(200, self.post_event(event).status_code)
+        process_webhook_events.assert_called_once()
+
+        # Events that were already received are ignored
+        with self.assertNumQueries(1):
+            self.assertEqual(200, self.post_event(event).status_code)
+        process_webhook_events.assert_called_once()
+
+    def test_invalid_signature(self) -> None:
+        response = self.client.post(
+            reverse("mux:callback"),
+            "{}",
+            content_type="application/json",
+            HTTP_MUX_SIGNATURE="t=1646396487,v1=invalid",
+        )
+        self.assertEqual(403, response.status_code)
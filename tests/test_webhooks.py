@@ -0,0 +1,169 @@
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import TestCase
+
+from muxltiproducer import models, mux, subtitles, tasks, webhooks
+
+
+@mock.patch.object(mux, "get_uploads_client")
+@mock.patch.object(mux, "get_assets_client")
+class WebhooksTests(TestCase):
+    def setUp(self) -> None:
+        self.lti_context = models.LtiContext.objects.create(context_id="dummy")
+        models.UploadUrl.objects.create(mux_id="upload1", lti_context=self.lti_context)
+
+    def test_asset_ready(self, *_clients) -> None:
+        webhooks.process_event(
+            "video.asset.ready",
+            {
+                "id": "asset1",
+                "upload_id": "upload1",
+                "status": "ready",
+                "created_at": 1646396487,
+                "playback_ids": [{"id": "playback1", "policy": "signed"}],
+                "tracks": [{"id": "track1", "type": "video"}],
+            },
+        )
+
+        asset = models.Asset.objects.get(mux_id="asset1")
+        self.assertEqual(self.lti_context.id, asset.lti_context_id)
+        self.assertEqual("ready", asset.mux_status)
+        self.assertEqual("playback1", asset.mux_playback_id)
+        self.assertEqual(
+            models.UploadUrl.Statuses.CREATED.value,
+            models.UploadUrl.objects.get(mux_id="upload1").status,
+        )
+        data = models.MuxAssetProperties.load_data("asset1")
+        assert data is not None
+        self.assertEqual("ready", data["status"])
+
+    def test_asset_ready_queries(self, *_clients) -> None:
+        data = {
+            "id": "asset1",
+            "upload_id": "upload1",
+            "status": "ready",
+            "created_at": 1646396487,
+            "playback_ids": [{"id": "playback1", "policy": "signed"}],
+            "tracks": [
+                {"id": "track1", "type": "video", "status": "ready"},
+                {"id": "track2", "type": "text", "status": "ready"},
+            ],
+        }
+        # Upload url, asset creation and update, subtitle files
+        with self.assertNumQueries(5):
+            webhooks.process_event("video.asset.ready", data)
+        # The upload url is already up-to-date
+        with self.assertNumQueries(4):
+            webhooks.process_event("video.asset.ready", data)
+
+    def test_asset_deleted(self, *_clients) -> None:
+        models.Asset.objects.create(mux_id="asset1", lti_context=self.lti_context)
+        webhooks.process_event("video.asset.deleted", {"id": "asset1"})
+        self.assertIsNone(models.Asset.objects.get(mux_id="asset1").mux_properties)
+
+    def test_upload_errored(self, *_clients) -> None:
+        caches["lti_apps"].clear()
+        webhooks.process_event(
+            "video.upload.errored", {"id": "upload1", "status": "errored"}
+        )
+        self.assertEqual(
+            models.UploadUrl.Statuses.ERRORED.value,
+            models.UploadUrl.objects.get(mux_id="upload1").status,
+        )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                models.UploadUrl.Statuses.ERRORED.value,
+                models.UploadUrl.objects.get_status("upload1"),
+            )
+
+    def test_track_events(self, *_clients) -> None:
+        models.Asset.objects.create(mux_id="asset1", lti_context=self.lti_context)
+        models.Asset.objects.update_mux_data(
+            "asset1", {"id": "asset1", "status": "ready", "created_at": "1"}
+        )
+        track = {
+            "id": "track1",
+            "asset_id": "asset1",
+            "type": "text",
+            "language_code": "fr",
+            "status": "preparing",
+        }
+        # Pending tracks are replaced by the Mux track of the same language
+        asset = models.Asset.objects.get(mux_id="asset1")
+        asset.set_text_tracks(
+            [
+                {"id": None, "language_code": "fr", "status": "preparing"},
+                {"id": None, "language_code": "en", "status": "preparing"},
+            ]
+        )
+        webhooks.process_event("video.asset.track.created", track)
+        self.assertEqual(
+            [(None, "en"), ("track1", "fr")],
+            [
+                (text_track["id"], text_track["language_code"])
+                for text_track in models.Asset.objects.get(
+                    mux_id="asset1"
+                ).mux_text_tracks
+            ],
+        )
+        models.Asset.objects.get(mux_id="asset1").set_text_tracks([])
+
+        webhooks.process_event("video.asset.track.created", track)
+        webhooks.process_event(
+            "video.asset.track.ready", dict(track, status="ready", name="French")
+        )
+        properties = models.Asset.objects.get(mux_id="asset1").mux_properties
+        assert properties is not None
+        self.assertEqual(
+            [("track1", "ready", "French")],
+            [
+                (track["id"], track["status"], track["name"])
+                for track in properties.subtitle_tracks
+            ],
+        )
+
+        webhooks.process_event("video.asset.track.deleted", track)
+        properties = models.Asset.objects.get(mux_id="asset1").mux_properties
+        assert properties is not None
+        self.assertEqual([], properties.subtitle_tracks)
+
+    @mock.patch.object(subtitles, "DefaultStorage")
+    def test_track_ready_deletes_subtitle_file(self, storage_class, *_clients) -> None:
+        asset = models.Asset.objects.create(
+            mux_id="asset1", lti_context=self.lti_context
+        )
+        models.SubtitleFile.objects.create(
+            name="mux/subtitles/1.vtt", asset=asset, mux_track_id="track1"
+        )
+        track = {"id": "track1", "asset_id": "asset1", "type": "text"}
+
+        webhooks.process_event(
+            "video.asset.track.created", dict(track, status="preparing")
+        )
+        self.assertEqual(1, models.SubtitleFile.objects.count())
+
+        webhooks.process_event("video.asset.track.ready", dict(track, status="ready"))
+        self.assertEqual(0, models.SubtitleFile.objects.count())
+        storage_class.return_value.delete.assert_called_once_with("mux/subtitles/1.vtt")
+
+    def test_process_webhook_events(
+        self, get_assets_client, get_uploads_client
+    ) -> None:
+        models.WebhookEvent.objects.create(
+            mux_id="event1",
+            type="video.upload.asset_created",
+            data={"id": "upload1", "asset_id": "asset1", "status": "asset_created"},
+        )
+        models.WebhookEvent.objects.create(
+            mux_id="event2", type="video.unknown", data={}
+        )
+
+        tasks.process_webhook_events.call_local()
+
+        self.assertTrue(models.Asset.objects.filter(mux_id="asset1").exists())
+        self.assertFalse(
+            models.WebhookEvent.objects.filter(processed_at__isnull=True).exists()
+        )
+        get_assets_client.assert_not_called()
+        get_uploads_client.assert_not_called()